@@ -0,0 +1,325 @@
+"""Client for the adb server's socket protocol, so routine work needs no `adb` process.
+
+The server (started by any `adb` command, listening on localhost:5037) takes
+requests as a 4-hex-digit length and a string and answers OKAY or FAIL. A
+`host:transport:<serial>` request turns the connection into a pipe to that
+device's adbd, which then accepts one service: `shell,v2,raw:<command>`
+(packets tagged stdout, stderr or exit status; plain `shell:` on devices
+older than Android 7), or `sync:` for the file sync protocol, whose STAT, LIST, SEND and RECV requests run back
+to back on the same connection. Sync connections are kept in a small pool per
+device and reused. Everything here is asyncio; it runs on the engine's loop.
+"""
+import asyncio
+import os
+import stat
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037))
+
+# Seconds to wait for the server to accept a connection
+CONNECT_TIMEOUT = 5
+
+# Largest DATA packet adbd accepts
+SYNC_DATA_MAX = 64 * 1024
+
+# Local file I/O happens off the loop in blocks of this size
+FILE_BLOCK_SIZE = 1024 * 1024
+
+# shell v2 packet ids
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+# Idle sync connections kept open per device
+SYNC_POOL_SIZE = 4
+
+# Threads writing pulled blocks to disk, shared by all connections
+FILE_IO_WORKERS = 4
+
+_HEADER = struct.Struct('<4sI')
+_SHELL_PACKET = struct.Struct('<BI')
+_STAT = struct.Struct('<III')
+_DENT = struct.Struct('<IIII')
+
+_file_io = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix='sync-io')
+
+
+class AdbProtocolError(Exception):
+    """The server or device refused a request (a FAIL reply), or spoke out of turn."""
+
+
+class AdbServerUnavailable(OSError):
+    """No adb server answers on the configured port; the `adb` binary starts one."""
+
+
+async def _read_status(reader):
+    status = await reader.readexactly(4)
+    if status == b'OKAY':
+        return
+    if status == b'FAIL':
+        length = int(await reader.readexactly(4), 16)
+        raise AdbProtocolError((await reader.readexactly(length)).decode('utf-8', errors='replace'))
+    raise AdbProtocolError(f"Unexpected reply {status!r}")
+
+
+def _finish_file(f, previous_write, data):
+    """Writes the last bytes of a pull once the block before them has landed, then closes f."""
+    try:
+        if previous_write is not None:
+            previous_write.result()
+        f.write(data)
+    finally:
+        f.close()
+
+
+class SyncConnection:
+    """A connection switched to a device's sync service. One request at a time."""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def _send_request(self, request_id, payload=b''):
+        self.writer.write(_HEADER.pack(request_id, len(payload)) + payload)
+
+    async def _read_header(self):
+        return _HEADER.unpack(await self.reader.readexactly(_HEADER.size))
+
+    async def _fail(self, request_id, length):
+        if request_id == b'FAIL':
+            raise AdbProtocolError((await self.reader.readexactly(length)).decode('utf-8', errors='replace'))
+        raise AdbProtocolError(f"Unexpected sync reply {request_id!r}")
+
+    async def stat(self, path):
+        """Returns (mode, size, mtime) of path; mode is 0 when it doesn't exist.
+
+        The size field is 32 bits wide in this version of the protocol.
+        """
+        self._send_request(b'STAT', path.encode('utf-8'))
+        await self.writer.drain()
+        request_id = await self.reader.readexactly(4)
+        if request_id != b'STAT':
+            await self._fail(request_id, struct.unpack('<I', await self.reader.readexactly(4))[0])
+        return _STAT.unpack(await self.reader.readexactly(_STAT.size))
+
+    async def list(self, path):
+        """Returns (name, mode, size, mtime) for every entry of a folder, '.' and '..' included."""
+        self._send_request(b'LIST', path.encode('utf-8'))
+        await self.writer.drain()
+        entries = []
+        while True:
+            request_id = await self.reader.readexactly(4)
+            if request_id == b'DONE':
+                await self.reader.readexactly(_DENT.size)
+                return entries
+            if request_id != b'DENT':
+                await self._fail(request_id, struct.unpack('<I', await self.reader.readexactly(4))[0])
+            mode, size, mtime, length = _DENT.unpack(await self.reader.readexactly(_DENT.size))
+            name = (await self.reader.readexactly(length)).decode('utf-8', errors='surrogateescape')
+            entries.append((name, mode, size, mtime))
+
+    async def send(self, local_path, remote_path, on_bytes=None):
+        """Copies a local file to remote_path, keeping its permissions and mtime.
+
+        on_bytes receives the number of bytes sent so far after every packet.
+        """
+        loop = asyncio.get_running_loop()
+        with open(local_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self._send_request(b'SEND', f"{remote_path},{stat.S_IMODE(st.st_mode)}".encode('utf-8'))
+            sent = 0
+            while True:
+                block = await loop.run_in_executor(None, f.read, FILE_BLOCK_SIZE)
+                if not block:
+                    break
+                for start in range(0, len(block), SYNC_DATA_MAX):
+                    self._send_request(b'DATA', block[start:start + SYNC_DATA_MAX])
+                    # Waits while the socket buffer is full: the device sets the pace
+                    await self.writer.drain()
+                    sent += min(SYNC_DATA_MAX, len(block) - start)
+                    if on_bytes:
+                        on_bytes(sent)
+        self.writer.write(_HEADER.pack(b'DONE', int(st.st_mtime)))
+        await self.writer.drain()
+        request_id, length = await self._read_header()
+        if request_id != b'OKAY':
+            await self._fail(request_id, length)
+
+    async def recv(self, remote_path, local_path, on_bytes=None):
+        """Copies remote_path into a local file. on_bytes receives the bytes received so far."""
+        self._send_request(b'RECV', remote_path.encode('utf-8'))
+        await self.writer.drain()
+        received = 0
+        f = open(local_path, 'wb')
+        pending = []
+        pending_size = 0
+        write = None # the last block handed to _file_io
+        try:
+            while True:
+                request_id, length = await self._read_header()
+                if request_id == b'DONE':
+                    break
+                if request_id != b'DATA':
+                    await self._fail(request_id, length)
+                pending.append(await self.reader.readexactly(length))
+                pending_size += length
+                received += length
+                if pending_size >= FILE_BLOCK_SIZE:
+                    data, pending, pending_size = b''.join(pending), [], 0
+                    write = _file_io.submit(f.write, data)
+                    # Shielded: a cancel leaves the write running, and the tail below waits for it
+                    await asyncio.shield(asyncio.wrap_future(write))
+                if on_bytes:
+                    on_bytes(received)
+        finally:
+            # Everything that arrived is kept exactly once, so a cancelled pull resumes from there
+            tail = _file_io.submit(_finish_file, f, write, b''.join(pending))
+            await asyncio.shield(asyncio.wrap_future(tail))
+        return received
+
+    def close(self):
+        self.writer.close()
+
+
+class AdbClient:
+    """Talks to one adb server. Safe to share between coroutines on one event loop."""
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT, pool_size=SYNC_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._idle = {} # serial -> [SyncConnection]
+
+    async def _connect(self):
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise AdbServerUnavailable(f"No adb server on {self.host}:{self.port} ({e})") from e
+
+    @staticmethod
+    async def _request(reader, writer, service):
+        data = service.encode('utf-8')
+        writer.write(b'%04x' % len(data) + data)
+        await writer.drain()
+        await _read_status(reader)
+
+    async def _host_query(self, service):
+        reader, writer = await self._connect()
+        try:
+            await self._request(reader, writer, service)
+            length = int(await reader.readexactly(4), 16)
+            return (await reader.readexactly(length)).decode('utf-8', errors='replace')
+        finally:
+            writer.close()
+
+    async def _transport(self, serial):
+        """Opens a connection routed to serial (None: the only device attached)."""
+        reader, writer = await self._connect()
+        try:
+            await self._request(reader, writer, f"host:transport:{serial}" if serial else "host:transport-any")
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def devices(self):
+        """Returns (serial, state) for every device the server knows, like `adb devices`."""
+        text = await self._host_query('host:devices')
+        return [tuple(line.split('\t', 1)) for line in text.splitlines() if '\t' in line]
+
+    async def shell(self, serial, command):
+        """Runs command on the device and returns (stdout, stderr, exit status).
+
+        Devices without the shell v2 protocol interleave stderr into stdout and
+        report no exit status (None).
+        """
+        reader, writer = await self._transport(serial)
+        try:
+            try:
+                await self._request(reader, writer, f"shell,v2,raw:{command}")
+            except AdbProtocolError:
+                writer.close()
+                reader, writer = await self._transport(serial)
+                await self._request(reader, writer, f"shell:{command}")
+                return (await reader.read()).decode('utf-8', errors='replace'), '', None
+            streams = {SHELL_STDOUT: [], SHELL_STDERR: []}
+            status = None
+            while True:
+                try:
+                    packet_id, length = _SHELL_PACKET.unpack(await reader.readexactly(_SHELL_PACKET.size))
+                except asyncio.IncompleteReadError as e:
+                    if e.partial:
+                        raise
+                    break
+                data = await reader.readexactly(length)
+                if packet_id in streams:
+                    streams[packet_id].append(data)
+                elif packet_id == SHELL_EXIT:
+                    status = data[0] if data else None
+            out, err = (b''.join(streams[i]).decode('utf-8', errors='replace') for i in (SHELL_STDOUT, SHELL_STDERR))
+            return out, err, status
+        finally:
+            writer.close()
+
+    async def _checkout(self, serial):
+        idle = self._idle.get(serial, [])
+        while idle:
+            conn = idle.pop()
+            if not conn.reader.at_eof():
+                return conn
+            conn.close()
+        reader, writer = await self._transport(serial)
+        try:
+            await self._request(reader, writer, 'sync:')
+        except BaseException:
+            writer.close()
+            raise
+        return SyncConnection(reader, writer)
+
+    def _checkin(self, serial, conn):
+        idle = self._idle.setdefault(serial, [])
+        if len(idle) < self.pool_size:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    async def sync(self, serial, operation):
+        """Runs await operation(SyncConnection) on a pooled sync connection of serial.
+
+        The connection goes back to the pool afterwards, unless the operation
+        failed or was cancelled halfway, which leaves it out of step.
+        """
+        conn = await self._checkout(serial)
+        try:
+            result = await operation(conn)
+        except BaseException:
+            # adbd also ends the sync session after a FAIL reply
+            conn.close()
+            raise
+        self._checkin(serial, conn)
+        return result
+
+    async def stat(self, serial, path):
+        return await self.sync(serial, lambda conn: conn.stat(path))
+
+    async def list(self, serial, path):
+        return await self.sync(serial, lambda conn: conn.list(path))
+
+    async def push(self, serial, local_path, remote_path, on_bytes=None):
+        await self.sync(serial, lambda conn: conn.send(local_path, remote_path, on_bytes))
+
+    async def pull(self, serial, remote_path, local_path, on_bytes=None, keep_mtime=True):
+        """Pulls remote_path into local_path; with keep_mtime the local copy gets the device mtime, like `adb pull -a`."""
+        async def operation(conn):
+            received = await conn.recv(remote_path, local_path, on_bytes)
+            if keep_mtime:
+                _, _, mtime = await conn.stat(remote_path)
+                os.utime(local_path, (mtime, mtime))
+            return received
+        return await self.sync(serial, operation)
+
+    def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
@@ -0,0 +1,233 @@
+"""Micro-benchmarks for the hot paths of the transfer code, on synthetic data.
+
+    python benchmarks/bench.py [walk|listing|progress|index|compression ...]
+
+Runs the named benchmarks, or all of them, and prints one line per measurement.
+None of them needs a device.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import stat
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import DecompressingReader, zstandard
+from device_index import INDEX_ROOT, DeviceIndex
+from listing import LINK_MODES_MARKER, LINK_TARGETS_MARKER, parse_listing
+from localwalk import local_files, walk_local
+from progress import pty, run_with_progress
+
+
+def bench_walk(dirs=200, files_per_dir=250, repeat=3):
+    """Compares the old os.walk + getsize + getmtime pass with walk_local on a
+    synthetic tree, and the memory of tuples against a FileManifest."""
+    with tempfile.TemporaryDirectory() as tmp:
+        top = os.path.join(tmp, 'tree')
+        for d in range(dirs):
+            folder = os.path.join(top, f"dir {d // 20}", f"sub {d}")
+            os.makedirs(folder)
+            for f in range(files_per_dir):
+                with open(os.path.join(folder, f"IMG_{f:05}.jpg"), 'wb') as fh:
+                    fh.write(b'x' * (f % 7))
+        count = dirs * files_per_dir
+
+        def os_walk():
+            rows = []
+            for root, _, names in os.walk(top):
+                for name in names:
+                    abs_path = os.path.join(root, name)
+                    rows.append((abs_path, os.path.relpath(abs_path, tmp), os.path.getsize(abs_path),
+                                 os.path.getmtime(abs_path)))
+            return rows
+
+        for label, fn in (('os.walk', os_walk), ('scandir', lambda: list(walk_local([top])))):
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = fn()
+                best = min(best, time.perf_counter() - start)
+            assert len(rows) == count
+            print(f"{label:>8}: {best * 1000:8.1f} ms for {count} files ({best / count * 1e6:5.2f} us/file)")
+
+        for label, build in (('tuples', lambda: list(walk_local([top]))), ('manifest', lambda: local_files([top]))):
+            tracemalloc.start()
+            kept = build()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del kept
+            print(f"{label:>8}: {size / count:6.0f} bytes/file")
+
+
+def bench_listing(sizes=(25_000, 50_000, 100_000), repeat=3):
+    """Times parse_listing on synthetic listings to check it scales linearly."""
+    for n in sizes:
+        lines = []
+        for i in range(n):
+            if i % 50 == 0:
+                lines.append(f"41f9 3452 1700000000 ./Folder - {i}")
+            elif i % 97 == 0:
+                lines.append(f"a1ff 12 1700000000 ./link {i}")
+            else:
+                lines.append(f"81b0 {i * 37} {1700000000 + i} ./IMG_2023-01-01 12:00 {i}.jpg")
+        lines.append(LINK_MODES_MARKER)
+        lines += [f"41f9 ./link {i}" for i in range(0, n, 97) if i % 50]
+        lines.append(LINK_TARGETS_MARKER)
+        lines += [f"'./link {i}' -> '/data/target {i}'" for i in range(0, n, 97) if i % 50]
+        text = '\n'.join(lines)
+
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            entries = parse_listing(text)
+            best = min(best, time.perf_counter() - start)
+        assert len(entries) == n
+        print(f"{n:>7} lines: {best * 1000:8.1f} ms ({best / n * 1e9:6.0f} ns/line)")
+
+
+# Stands in for `adb push -p`: prints updates as fast as the pty takes them
+_FAKE_ADB = r"""
+import sys
+n = int(sys.argv[1])
+out = sys.stdout
+for i in range(n):
+    out.write(f"\r[{i * 100 // n:3d}%] /sdcard/DCIM/Camera/VID_20240101_120000.mp4")
+out.write("\r[100%] /sdcard/DCIM/Camera/VID_20240101_120000.mp4\n")
+out.flush()
+"""
+
+
+def bench_progress(updates=(10_000, 100_000, 1_000_000)):
+    """Times run_with_progress against a fake adb flooding the pty with updates.
+
+    Reports wall time, this process's CPU time (the parsing overhead) and how
+    many callbacks got through the throttle.
+    """
+    if pty is None:
+        print("skipped: needs a pty")
+        return
+    for n in updates:
+        seen = []
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        msg, code = asyncio.run(run_with_progress([sys.executable, '-c', _FAKE_ADB, str(n)], seen.append))
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+        assert code == 0 and seen and seen[-1] == 100, (msg, code, seen[-1:])
+        print(f"{n:>9} updates: {wall * 1000:8.1f} ms wall, {cpu * 1000:7.1f} ms reader CPU "
+              f"({cpu / n * 1e9:5.0f} ns/update), {len(seen)} callbacks")
+
+
+def bench_index(n=200_000, repeat=3):
+    """Builds a synthetic in-memory index and times typical queries against it."""
+    exts = ['jpg', 'mp4', 'pdf', 'txt', 'apk', 'mp3']
+    rng = random.Random(0)
+
+    def records():
+        yield (INDEX_ROOT, 0, 1700000000, stat.S_IFDIR)
+        for d in range(n // 100):
+            folder = f"{INDEX_ROOT}/Folder {d}"
+            yield (folder, 0, 1700000000, stat.S_IFDIR)
+            for i in range(99):
+                ext = exts[i % len(exts)]
+                yield (f"{folder}/IMG_{d}_{i}.{ext}", rng.randrange(1 << 30), 1600000000 + rng.randrange(10**8),
+                       stat.S_IFREG)
+
+    index = DeviceIndex(':memory:')
+    start = time.perf_counter()
+    index.rebuild(records())
+    print(f"       build: {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    queries = {
+        'name': dict(name='img_1234_'),
+        'extension': dict(exts=['pdf']),
+        'size range': dict(min_size=500 << 20, max_size=600 << 20),
+        'mtime': dict(newer_than=1699000000),
+        'combined': dict(name='_5', exts=['mp4', 'jpg'], min_size=1 << 20),
+    }
+    for label, query in queries.items():
+        best = float('inf')
+        for _ in range(repeat):
+            t = time.perf_counter()
+            index.search(**query)
+            best = min(best, time.perf_counter() - t)
+        print(f"{label:>12}: {best * 1000:8.2f} ms")
+    index.close()
+
+
+def _sample_text(n, rng):
+    words = ['I/ActivityManager', 'D/WifiStateMachine', 'W/System.err', 'E/AndroidRuntime', 'Start proc',
+             'for activity', 'com.android.systemui', 'pid=', 'uid=', 'connected', 'timeout', 'retry']
+    lines = []
+    length = 0
+    while length < n:
+        line = f"01-01 12:{rng.randrange(60):02d}:{rng.randrange(60):02d}.{rng.randrange(1000):03d} " + \
+               ' '.join(rng.choice(words) for _ in range(8)) + f" {rng.randrange(1 << 20)}\n"
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines).encode()[:n]
+
+
+class _Raw(io.BytesIO):
+    def read1(self, n=-1):
+        return self.read(n)
+
+
+def bench_compression(size=64 * 1024 * 1024):
+    """Times the host side of a compressed pull of a synthetic log and of random bytes.
+
+    Reports the compression ratio of gzip -1 and how fast DecompressingReader
+    inflates the stream, which bounds the logical throughput on fast links.
+    """
+    if zstandard is None:
+        print("zstandard is not installed, pulls use gzip only")
+    rng = random.Random(0)
+    for label, data in (('log text', _sample_text(size, rng)), ('random', os.urandom(size))):
+        packer = zlib.compressobj(1, wbits=31)
+        wire = packer.compress(data) + packer.flush()
+        totals = [0, 0]
+
+        def count(logical, wire_bytes):
+            totals[0] += logical
+            totals[1] += wire_bytes
+
+        reader = DecompressingReader(_Raw(wire), 'gzip', count)
+        start = time.perf_counter()
+        while reader.read():
+            pass
+        seconds = time.perf_counter() - start
+        assert totals == [len(data), len(wire)], totals
+        print(f"{label:>9}: {len(data) / len(wire):5.2f}x, inflated at {len(data) / seconds / 1e6:7.1f} MB/s")
+
+
+BENCHMARKS = {
+    'walk': bench_walk,
+    'listing': bench_listing,
+    'progress': bench_progress,
+    'index': bench_index,
+    'compression': bench_compression,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run DroidPipe micro-benchmarks.")
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    names = parser.parse_args(argv).names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Headless DroidPipe: push, pull, ls, rm and sync from a terminal, CI job or SSH session.
+
+    droidpipe [-s SERIAL] push LOCAL... REMOTE_DIR
+    droidpipe [-s SERIAL] pull REMOTE... LOCAL_DIR
+    droidpipe [-s SERIAL] ls REMOTE_DIR
+    droidpipe [-s SERIAL] rm REMOTE...
+    droidpipe [-s SERIAL] sync {push,pull} LOCAL_DIR REMOTE_DIR [NAME...]
+
+`pip install .` puts the droidpipe command on PATH; `python cli.py` works from
+a checkout. Sync without names takes every entry of the source folder except
+dotfiles, in both directions.
+
+Output is one JSON object per line on stdout: 'start', throttled 'progress'
+and a final 'done' event for transfers, one 'entry' per file for ls (or an
+'error' if the folder can't be listed). A push
+starts sending while its local folders are still being walked: its 'start'
+event has no totals yet, and its 'progress' events carry the total found so
+far until 'scanning' turns false. Logs go to stderr. The exit status is one of the EXIT_* codes below. Only the
+transfer engine is imported, never tkinter.
+"""
+import argparse
+import json
+import logging
+import os
+import posixpath
+import sys
+import threading
+import time
+
+from engine import TransferEngine, DEFAULT_TRANSFER_WORKERS, ListingError, remaining_bytes
+from eventloop import CancelEvent
+from localwalk import LocalWalk
+from progress import Throttle
+
+EXIT_OK = 0
+EXIT_FAILED = 1 # some items failed to transfer or delete
+EXIT_USAGE = 2 # bad arguments (argparse uses the same code)
+EXIT_NO_DEVICE = 3 # adb missing, no device, or several without -s
+EXIT_CANCELLED = 130 # interrupted with Ctrl+C
+
+# Progress events printed per second
+PROGRESS_EVENTS_HZ = 4
+
+
+def emit(event, **fields):
+    sys.stdout.write(json.dumps({'event': event, **fields}) + '\n')
+    sys.stdout.flush()
+
+
+def _remote_dir(path):
+    return path if path.endswith('/') else path + '/'
+
+
+class ProgressPrinter:
+    """Thread-safe progress callback printing throttled 'progress' events.
+
+    With a LocalWalk, the total is whatever the walk has found so far.
+    """
+    def __init__(self, total_bytes, wire_stats=None, walk=None):
+        self.total_bytes = total_bytes
+        self.wire_stats = wire_stats
+        self.walk = walk
+        self.start_time = time.monotonic()
+        self._lock = threading.Lock()
+        self._throttle = Throttle(self._emit, PROGRESS_EVENTS_HZ)
+
+    def __call__(self, done):
+        with self._lock:
+            self._throttle.update(done)
+
+    def flush(self):
+        with self._lock:
+            self._throttle.flush()
+
+    def _emit(self, done):
+        elapsed = time.monotonic() - self.start_time
+        total = self.walk.total_bytes if self.walk is not None else self.total_bytes
+        fields = dict(done=done, total=total,
+                      percent=round(min(done / total * 100, 100), 1) if total else 100.0,
+                      bytes_per_s=int(done / elapsed) if elapsed > 0 else 0)
+        if self.walk is not None:
+            fields.update(files=len(self.walk), scanning=not self.walk.finished)
+        if self.wire_stats:
+            fields['wire'] = done - sum(logical - wire for logical, wire in self.wire_stats)
+        emit('progress', **fields)
+
+
+def _run_cancellable(engine, fn, cancel_event):
+    """Runs fn on a session thread so Ctrl+C can cancel it cleanly. Returns fn's result."""
+    operation = engine.loop.submit(engine.loop.run_thread(fn))
+    while True:
+        try:
+            return operation.result()
+        except KeyboardInterrupt:
+            logging.warning("Cancelling...")
+            cancel_event.set()
+
+
+def _finish(results, cancel_event):
+    failed = [dict(item=label, error=msg) for label, msg, code in results if code not in (0, -2)]
+    cancelled = cancel_event.is_set()
+    emit('done', ok=not failed and not cancelled, cancelled=cancelled, jobs=len(results), failed=failed)
+    if cancelled:
+        return EXIT_CANCELLED
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def _transfer(engine, serial, op, prepare, run):
+    """Plans and runs one push or pull with progress events. Returns the exit code."""
+    cancel_event = CancelEvent()
+    job_id, files, offsets = prepare()
+    walk = files if isinstance(files, LocalWalk) else None
+    if walk is not None:
+        emit('start', op=op, job=job_id, files=None, bytes=None)
+    else:
+        emit('start', op=op, job=job_id, files=len(files), bytes=remaining_bytes(files, offsets))
+    wire_stats = []
+    printer = ProgressPrinter(remaining_bytes(files, offsets), wire_stats, walk)
+    results = _run_cancellable(engine, lambda: run(job_id, files, offsets, printer, cancel_event, wire_stats), cancel_event)
+    printer.flush()
+    return _finish(results or [], cancel_event)
+
+
+def cmd_push(engine, serial, args):
+    remote_base = _remote_dir(args.remote)
+    missing = [p for p in args.local if not os.path.exists(p)]
+    if missing:
+        logging.error(f"No such file or directory: {', '.join(missing)}")
+        return EXIT_USAGE
+    return _transfer(
+        engine, serial, 'push',
+        lambda: engine.prepare_push(serial, remote_base, local_paths=[os.path.abspath(p) for p in args.local]),
+        lambda job_id, files, offsets, report, cancel, _: engine.run_push(
+            serial, remote_base, job_id, files, offsets, report, cancel, {} if args.verify else None,
+            lambda count: emit('verify', files=count)))
+
+
+def cmd_pull(engine, serial, args):
+    remote_paths = [p.rstrip('/') or '/' for p in args.remote]
+    parents = {posixpath.dirname(p) for p in remote_paths}
+    if len(parents) != 1:
+        logging.error("All remote paths must be in the same folder")
+        return EXIT_USAGE
+    remote_base = _remote_dir(parents.pop())
+    local_dir = os.path.abspath(args.local)
+    os.makedirs(local_dir, exist_ok=True)
+    return _transfer(
+        engine, serial, 'pull',
+        lambda: engine.prepare_pull(serial, remote_base, local_dir, remote_paths=remote_paths),
+        lambda job_id, files, offsets, report, cancel, wire_stats: engine.run_pull(
+            serial, remote_base, local_dir, job_id, files, offsets, report, cancel, args.compress, wire_stats))
+
+
+def cmd_ls(engine, serial, args):
+    try:
+        entries = engine.list_android_dir(args.remote, serial, strict=True)
+    except ListingError as e:
+        emit('error', path=args.remote, error=str(e))
+        return EXIT_FAILED
+    for e in sorted(entries, key=lambda e: (not e.is_dir, e.name.lower())):
+        emit('entry', name=e.name, size=e.size, mtime=e.mtime, mode=e.mode,
+             type='dir' if e.is_dir else 'link' if e.is_link else 'file', link_target=e.link_target)
+    return EXIT_OK
+
+
+def cmd_rm(engine, serial, args):
+    errors = engine.delete_remote([p.rstrip('/') or '/' for p in args.remote], serial)
+    emit('done', ok=not errors, items=len(args.remote), failed=[dict(item=p, error=err) for p, err in errors])
+    return EXIT_FAILED if errors else EXIT_OK
+
+
+def cmd_sync(engine, serial, args):
+    local_dir = os.path.abspath(args.local)
+    remote_base = _remote_dir(args.remote)
+    names = args.names
+    if not names:
+        if args.direction == 'push':
+            names = sorted(n for n in os.listdir(local_dir) if not n.startswith('.'))
+        else:
+            names = sorted(e.name for e in engine.list_android_dir(remote_base, serial))
+
+    plan = engine.compare(serial, args.direction, local_dir, remote_base, names, args.delete, args.hash)
+    emit('plan', direction=args.direction, new=plan.new, modified=plan.modified, extraneous=plan.extraneous,
+         unchanged=len(plan.unchanged), bytes=plan.copy_bytes)
+    if args.dry_run:
+        return EXIT_OK
+
+    engine.remove_extraneous(serial, plan, remote_base)
+    files = plan.transfer_files()
+    if not files:
+        emit('done', ok=True, cancelled=False, jobs=0, failed=[])
+        return EXIT_OK
+    if args.direction == 'push':
+        return _transfer(
+            engine, serial, 'push',
+            lambda: engine.prepare_push(serial, remote_base, files=files),
+            lambda job_id, files, offsets, report, cancel, _: engine.run_push(
+                serial, remote_base, job_id, files, offsets, report, cancel))
+    return _transfer(
+        engine, serial, 'pull',
+        lambda: engine.prepare_pull(serial, remote_base, local_dir, files=files),
+        lambda job_id, files, offsets, report, cancel, wire_stats: engine.run_pull(
+            serial, remote_base, local_dir, job_id, files, offsets, report, cancel, False, wire_stats))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Transfer files to and from Android devices.")
+    parser.add_argument("-s", "--serial", default=os.environ.get('ANDROID_SERIAL'),
+                        help="device to use (default: $ANDROID_SERIAL, or the only one attached)")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_TRANSFER_WORKERS,
+                        help="concurrent adb transfers per device")
+    parser.add_argument("-d", "--debug", action="store_true")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    push = commands.add_parser('push', help="copy local files and folders into a device folder")
+    push.add_argument('local', nargs='+')
+    push.add_argument('remote')
+    push.add_argument('--verify', action='store_true', help="compare checksums after the transfer")
+    push.set_defaults(run=cmd_push)
+
+    pull = commands.add_parser('pull', help="copy device files and folders into a local folder")
+    pull.add_argument('remote', nargs='+')
+    pull.add_argument('local')
+    pull.add_argument('--compress', action='store_true', help="compress compressible files on the wire")
+    pull.set_defaults(run=cmd_pull)
+
+    ls = commands.add_parser('ls', help="list a device folder")
+    ls.add_argument('remote')
+    ls.set_defaults(run=cmd_ls)
+
+    rm = commands.add_parser('rm', help="delete device files and folders (recursively)")
+    rm.add_argument('remote', nargs='+')
+    rm.set_defaults(run=cmd_rm)
+
+    sync = commands.add_parser('sync', help="mirror items from one side to the other")
+    sync.add_argument('direction', choices=('push', 'pull'))
+    sync.add_argument('local', help="local folder")
+    sync.add_argument('remote', help="device folder")
+    sync.add_argument('names', nargs='*', help="items of the source folder to sync (default: all)")
+    sync.add_argument('--delete', action='store_true', help="delete target files missing from the source")
+    sync.add_argument('--hash', action='store_true', help="compare files of equal size by checksum")
+    sync.add_argument('-n', '--dry-run', action='store_true', help="only print the plan")
+    sync.set_defaults(run=cmd_sync)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, stream=sys.stderr,
+                        format="%(levelname)s: %(message)s")
+
+    engine = TransferEngine(max(1, args.workers))
+    serials, err = engine.list_devices()
+    if serials is None:
+        logging.error(f"adb failed: {err}")
+        return EXIT_NO_DEVICE
+    serial = args.serial
+    if serial is None:
+        if len(serials) != 1:
+            logging.error("No device attached" if not serials else
+                          f"{len(serials)} devices attached, pick one with -s: {', '.join(serials)}")
+            return EXIT_NO_DEVICE
+        serial = serials[0]
+    elif serial not in serials:
+        logging.error(f"Device {serial} is not attached")
+        return EXIT_NO_DEVICE
+
+    try:
+        return args.run(engine, serial, args)
+    except OSError as e:
+        logging.error(str(e))
+        return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
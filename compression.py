@@ -0,0 +1,121 @@
+"""Compressed pulls: which files to compress and how to inflate them on the fly.
+
+Logs, databases and text dumps shrink several times under even the fastest
+compression level, while photos, videos and archives are compressed already
+and would only cost device CPU. Files are judged by extension first; for the
+rest a sample is compressed on the device and the ratio decides. The device
+pipes the file through `gzip` (or `zstd` when both ends have it) and the host
+inflates the stream chunk by chunk, so nothing compressed touches the disk.
+"""
+import os
+import shlex
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_EXTS = frozenset((
+    'txt', 'log', 'csv', 'tsv', 'json', 'xml', 'html', 'htm', 'md', 'ini', 'conf', 'cfg', 'prop', 'yaml',
+    'yml', 'sql', 'db', 'sqlite', 'sqlite3', 'wal', 'journal', 'trace', 'dump', 'dmp', 'hprof', 'tar',
+    'vcf', 'ics', 'svg', 'js', 'css', 'bmp', 'wav',
+))
+
+INCOMPRESSIBLE_EXTS = frozenset((
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'heif', 'dng', 'mp4', 'mkv', 'mov', '3gp', 'webm', 'avi',
+    'mp3', 'm4a', 'aac', 'ogg', 'opus', 'flac', 'amr', 'zip', 'apk', 'apks', 'xapk', 'jar', 'obb', 'gz',
+    'tgz', 'xz', 'zst', 'bz2', '7z', 'rar', 'br', 'lz4',
+))
+
+# Bytes of a file compressed on the device to judge an unknown extension
+SAMPLE_BYTES = 64 * 1024
+
+# Files are compressed when the sample shrinks to at most this fraction
+MAX_SAMPLE_RATIO = 0.8
+
+# Device tools in order of preference; zstd also needs the zstandard module here
+COMPRESSION_TOOLS = ('zstd', 'gzip')
+
+READ_SIZE = 64 * 1024
+
+
+def host_tools():
+    """The COMPRESSION_TOOLS this Python can decompress."""
+    return tuple(t for t in COMPRESSION_TOOLS if t != 'zstd' or zstandard is not None)
+
+
+def classify(name):
+    """True or False when the extension of name decides, None when it has to be sampled."""
+    ext = os.path.splitext(name)[1][1:].lower()
+    if ext in COMPRESSIBLE_EXTS:
+        return True
+    if ext in INCOMPRESSIBLE_EXTS:
+        return False
+    return None
+
+
+def sample_command(paths):
+    """Prints, per path, the size of its first SAMPLE_BYTES after `gzip -1`."""
+    return (f"for f in {' '.join(shlex.quote(p) for p in paths)}; do "
+            f"head -c {SAMPLE_BYTES} \"$f\" 2>/dev/null | gzip -1 | wc -c; done")
+
+
+def parse_sample_sizes(text, paths, sizes):
+    """Maps sample_command output back to paths; returns the set of paths worth compressing.
+
+    sizes holds each path's full size, since files shorter than the sample
+    compress to a fraction of their own length.
+    """
+    worth = set()
+    for path, line in zip(paths, text.splitlines()):
+        try:
+            compressed = int(line.strip())
+        except ValueError:
+            continue
+        sampled = min(sizes[path], SAMPLE_BYTES)
+        if sampled and compressed <= sampled * MAX_SAMPLE_RATIO:
+            worth.add(path)
+    return worth
+
+
+def compress_command(tool):
+    """Device-side filter compressing stdin to stdout at the fastest level."""
+    return 'zstd -1 -q -c' if tool == 'zstd' else 'gzip -1 -c'
+
+
+def decompressor(tool):
+    """Streaming decompressor for the output of compress_command(tool)."""
+    if tool == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=31) # gzip header and trailer
+
+
+class DecompressingReader:
+    """Read-only file object inflating a compressed stream as it is read.
+
+    callback(logical, wire) receives the decompressed and the compressed size
+    of every chunk. read() may return more than asked for, which tarfile's
+    stream mode and plain copy loops both accept.
+    """
+    def __init__(self, raw, tool, callback=None):
+        self.raw = raw
+        self.callback = callback
+        self._inflater = decompressor(tool)
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof:
+            chunk = self.raw.read1(READ_SIZE)
+            if chunk:
+                data = self._inflater.decompress(chunk)
+            else:
+                self._eof = True
+                data = self._inflater.flush()
+                if not self._inflater.eof:
+                    raise OSError("Compressed stream ended early")
+            if self.callback:
+                self.callback(len(data), len(chunk))
+            if data:
+                return data
+        return b''
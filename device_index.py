@@ -0,0 +1,267 @@
+"""Searchable index of a device's shared storage, kept in SQLite per serial.
+
+The index is filled from one streamed `find -exec stat` over the storage root
+and refreshed incrementally afterwards. A folder's mtime changes whenever an
+entry is added, removed or renamed inside it, so a refresh only stats the
+folders themselves and lists again those whose mtime moved. Files rewritten
+in place keep their folder's mtime; a full rebuild picks those up.
+"""
+import os
+import posixpath
+import re
+import shlex
+import sqlite3
+import stat
+import threading
+import time
+
+INDEX_ROOT = "/storage/emulated/0"
+
+# Rows written per transaction while building, so queries can interleave
+INSERT_BATCH_ROWS = 5000
+
+_RECORD = re.compile(r'([0-9a-fA-F]+) (\d+) (-?\d+) (/.*)')
+_DIR_RECORD = re.compile(r'(-?\d+) (/.*)')
+
+_FILES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        path TEXT PRIMARY KEY,
+        dir TEXT NOT NULL,
+        name_lower TEXT NOT NULL,
+        ext TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        is_dir INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS {dirs_table} (
+        path TEXT PRIMARY KEY,
+        mtime INTEGER NOT NULL
+    );
+"""
+
+_FILES_INDEXES = """
+    CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+    CREATE INDEX IF NOT EXISTS files_ext ON files(ext);
+    CREATE INDEX IF NOT EXISTS files_size ON files(size);
+    CREATE INDEX IF NOT EXISTS files_mtime ON files(mtime);
+"""
+
+
+def index_path(state_dir, serial):
+    """Database file for one device; serials like 'host:port' are made filename-safe."""
+    return os.path.join(state_dir, "index-" + re.sub(r'[^A-Za-z0-9._-]', '_', serial) + ".sqlite3")
+
+
+def full_scan_command(root=INDEX_ROOT):
+    """Recursive listing of root as '<raw mode hex> <size> <mtime> <path>' lines."""
+    return f"find {shlex.quote(root)} -exec stat -c '%f %s %Y %n' {{}} +"
+
+
+def dir_scan_command(root=INDEX_ROOT):
+    """Device clock, then '<mtime> <path>' for every folder under root."""
+    return f"date +%s; find {shlex.quote(root)} -type d -exec stat -c '%Y %n' {{}} +"
+
+
+def children_command(dirs):
+    """Lists the non-folder entries directly inside dirs, in full_scan_command's format."""
+    return ("find " + ' '.join(shlex.quote(d) for d in dirs) +
+            " -mindepth 1 -maxdepth 1 ! -type d -exec stat -c '%f %s %Y %n' {} +")
+
+
+def parse_records(lines):
+    """Yields (path, size, mtime, mode) from stat lines, as they arrive.
+
+    A line that doesn't start a record continues the previous path (a name
+    containing a newline), so each record is held until the next one starts.
+    """
+    last = None
+    for line in lines:
+        line = line.rstrip('\n')
+        m = _RECORD.fullmatch(line)
+        if m:
+            if last is not None:
+                yield tuple(last)
+            last = [m.group(4), int(m.group(2)), int(m.group(3)), int(m.group(1), 16)]
+        elif last is not None:
+            last[0] += '\n' + line
+    if last is not None:
+        yield tuple(last)
+
+
+def parse_dir_scan(text):
+    """Parses dir_scan_command output into (device_time, {path: mtime})."""
+    lines = text.split('\n')
+    try:
+        device_time = int(lines[0].strip())
+    except (ValueError, IndexError):
+        device_time = None
+    dirs = {}
+    last = None
+    for line in lines[1:]:
+        m = _DIR_RECORD.fullmatch(line)
+        if m:
+            last = m.group(2)
+            dirs[last] = int(m.group(1))
+        elif last is not None and line:
+            mtime = dirs.pop(last)
+            last += '\n' + line
+            dirs[last] = mtime
+    return device_time, dirs
+
+
+def _row(path, size, mtime, mode):
+    directory, name = posixpath.split(path)
+    is_dir = stat.S_ISDIR(mode)
+    ext = '' if is_dir else posixpath.splitext(name)[1][1:].lower()
+    return (path, directory, name.lower(), ext, size, mtime, int(is_dir))
+
+
+class DeviceIndex:
+    """SQLite index of one device's files. Thread-safe; queries run between write batches."""
+    def __init__(self, path):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript(_FILES_SCHEMA.format(table='files', dirs_table='dirs') + _FILES_INDEXES + """
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+    def _meta(self, key):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def summary(self):
+        """Returns (entries, last update as a Unix time or None)."""
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            updated = self._meta('updated')
+        return count, float(updated) if updated else None
+
+    def is_empty(self):
+        with self._lock:
+            return self._meta('updated') is None
+
+    def rebuild(self, records, root=INDEX_ROOT, device_time=None, on_progress=None):
+        """Replaces the index with (path, size, mtime, mode) records of a full scan.
+
+        Rows go into shadow tables in batches, so the old index keeps answering
+        queries until the new one is swapped in. Returns the number of entries.
+        """
+        with self._lock, self._db:
+            self._db.executescript("DROP TABLE IF EXISTS files_new; DROP TABLE IF EXISTS dirs_new;" +
+                                   _FILES_SCHEMA.format(table='files_new', dirs_table='dirs_new'))
+        count = 0
+        files, dirs = [], []
+        for path, size, mtime, mode in records:
+            if stat.S_ISDIR(mode):
+                dirs.append((path, mtime))
+            if path != root:
+                files.append(_row(path, size, mtime, mode))
+            if len(files) + len(dirs) >= INSERT_BATCH_ROWS:
+                count += len(files)
+                self._insert_new(files, dirs)
+                files, dirs = [], []
+                if on_progress:
+                    on_progress(count)
+        count += len(files)
+        self._insert_new(files, dirs)
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for statement in ("DROP TABLE files", "DROP TABLE dirs",
+                                  "ALTER TABLE files_new RENAME TO files", "ALTER TABLE dirs_new RENAME TO dirs"):
+                    self._db.execute(statement)
+                for statement in _FILES_INDEXES.strip().split(';'):
+                    if statement.strip():
+                        self._db.execute(statement)
+                self._set_updated(device_time)
+                self._db.commit()
+            except sqlite3.Error:
+                self._db.rollback()
+                raise
+        return count
+
+    def _insert_new(self, files, dirs):
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO files_new VALUES (?, ?, ?, ?, ?, ?, ?)", files)
+            self._db.executemany("INSERT OR REPLACE INTO dirs_new VALUES (?, ?)", dirs)
+
+    def _set_updated(self, device_time):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('updated', ?)", (str(time.time()),))
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('device_time', ?)",
+                         (None if device_time is None else str(device_time),))
+
+    def refresh(self, scanned, device_time, list_children, root=INDEX_ROOT):
+        """Brings the index up to date from a dir_scan_command result.
+
+        scanned maps every folder on the device to its mtime. Folders that are
+        new, changed, or touched within a second of the previous scan (mtimes
+        have one-second resolution) are passed to list_children, which returns
+        (path, size, mtime, mode) records of their non-folder entries. Returns
+        the number of folders listed again.
+        """
+        with self._lock:
+            stored = dict(self._db.execute("SELECT path, mtime FROM dirs"))
+            last_scan = self._meta('device_time')
+        since = int(last_scan) - 1 if last_scan else None
+
+        changed = [d for d, mtime in scanned.items()
+                   if stored.get(d) != mtime or (since is not None and mtime >= since)]
+        removed = [d for d in stored if d not in scanned]
+        children = [_row(*record) for record in list_children(changed)] if changed else []
+
+        with self._lock, self._db:
+            for d in removed:
+                self._db.execute("DELETE FROM files WHERE path = ? OR dir = ?", (d, d))
+                self._db.execute("DELETE FROM dirs WHERE path = ?", (d,))
+            self._db.executemany("DELETE FROM files WHERE dir = ? AND is_dir = 0", ((d,) for d in changed))
+            self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", children)
+            self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (_row(d, 0, scanned[d], stat.S_IFDIR) for d in changed if d != root))
+            self._db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?)", ((d, scanned[d]) for d in changed))
+            self._set_updated(device_time)
+        return len(changed)
+
+    def search(self, name=None, exts=None, min_size=None, max_size=None, newer_than=None, older_than=None,
+               limit=1000):
+        """Returns up to limit (path, size, mtime, is_dir) rows matching every given filter.
+
+        name matches case-insensitively anywhere in the file name; exts is a list
+        of extensions without the dot. Size bounds only match files.
+        """
+        clauses, params = [], []
+        if name:
+            clauses.append("instr(name_lower, ?) > 0")
+            params.append(name.lower())
+        if exts:
+            clauses.append(f"ext IN ({', '.join('?' * len(exts))})")
+            params += [e.lower().lstrip('.') for e in exts]
+        if min_size is not None or max_size is not None:
+            clauses.append("is_dir = 0")
+        if min_size is not None:
+            clauses.append("size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            clauses.append("size <= ?")
+            params.append(max_size)
+        if newer_than is not None:
+            clauses.append("mtime >= ?")
+            params.append(newer_than)
+        if older_than is not None:
+            clauses.append("mtime <= ?")
+            params.append(older_than)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        with self._lock:
+            rows = self._db.execute(f"SELECT path, size, mtime, is_dir FROM files {where} ORDER BY path LIMIT ?",
+                                    params + [limit]).fetchall()
+        return [(path, size, mtime, bool(is_dir)) for path, size, mtime, is_dir in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
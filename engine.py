@@ -0,0 +1,1812 @@
+"""Transfer engine shared by the Tk app and the command line.
+
+Everything that talks to adb lives here: persistent shell sessions, listings,
+journaled and resumable pushes and pulls on per-device worker pools, with
+verification, compression and deletes. Device listing, single-file pushes and
+pulls and one-off shell commands speak the adb server's protocol directly
+(adb_client); the `adb` binary is the fallback when no server is running, and
+still carries the persistent shells and tar streams. Shells, one-off
+commands and server connections are driven by one BackgroundLoop; each has
+an async form for callers on that loop and a blocking one for plain threads.
+The raw tar, append and compressed streams stay on the scheduler's threads,
+pumping pipes through tarfile and zlib; cancelling kills their adb process,
+so a stream stuck on a stalled device returns at once.
+Nothing here imports tkinter; progress comes back through plain callbacks,
+called on worker threads or the loop thread.
+"""
+import asyncio
+import codecs
+import hashlib
+import heapq
+import json
+import logging
+import os
+import shlex
+import shutil
+import sqlite3
+import stat
+import subprocess
+import tarfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, as_completed, wait
+
+from adb_client import AdbClient, AdbProtocolError, AdbServerUnavailable
+from eventloop import BackgroundLoop
+from localwalk import LocalWalk, walk_local
+from progress import run_with_progress
+from listing import list_command, parse_listing, parse_ls
+from compression import (DecompressingReader, host_tools, classify, sample_command, parse_sample_sizes,
+                         compress_command)
+
+# Handle pty import for Windows/Linux compatibility
+try:
+    import pty
+except ImportError:
+    pty = None
+
+# Files up to this size are packed into one streamed tar instead of one `adb push` each
+TAR_BATCH_THRESHOLD = 1024 * 1024
+
+# Extraction filters (and their errors) only exist on newer Python patch releases
+TAR_FILTER_ERRORS = (tarfile.FilterError,) if hasattr(tarfile, 'FilterError') else ()
+
+# Seconds a command on the persistent shell may run before the session is reset
+SHELL_TIMEOUT = 60
+
+# Timeout (seconds) for one-off adb commands such as `adb devices`
+ADB_COMMAND_TIMEOUT = 60
+
+# One-off adb processes running at once; further commands wait for a slot
+MAX_ADB_PROCESSES = 8
+
+# Longest line a shell session reads; asyncio streams need a bound
+SHELL_LINE_LIMIT = 16 * 1024 * 1024
+
+# Bytes read per chunk from streamed device output
+STREAM_READ_SIZE = 64 * 1024
+
+# Android directory listings kept in memory, and how long one may be shown before refetching
+LISTING_CACHE_SIZE = 128
+LISTING_CACHE_TTL = 300
+
+# Local state (transfer journal) lives here
+STATE_DIR = os.path.join(os.path.expanduser("~"), ".droidpipe")
+JOURNAL_PATH = os.path.join(STATE_DIR, "journal.sqlite3")
+
+# Upper bound for the path arguments of one batched device command
+MAX_SHELL_ARGS_BYTES = 32 * 1024
+
+# Recursive listings and hashing of big trees can take a while
+MANIFEST_TIMEOUT = 600
+
+# So can deleting them
+DELETE_TIMEOUT = 600
+
+# Sync treats mtimes this many seconds apart as equal (FAT/exFAT round to 2 s)
+SYNC_MTIME_TOLERANCE = 2
+
+# Concurrent adb transfer processes per device
+DEFAULT_TRANSFER_WORKERS = 3
+
+# Jobs queued per transfer worker; a scheduler fed while the walk goes on holds back beyond that
+PENDING_JOBS_PER_WORKER = 4
+
+# Don't open another tar stream for fewer files than this
+MIN_FILES_PER_TAR_BATCH = 256
+
+# Threads hashing local files for transfer verification, shared by all sessions
+HASH_WORKERS = 2
+
+# Device-side checksum tools in order of preference, with their hashlib names
+DEVICE_HASH_TOOLS = (('sha256sum', 'sha256'), ('md5sum', 'md5'))
+
+
+class TransferCancelled(Exception):
+    pass
+
+
+class ListingError(OSError):
+    """A device folder could not be listed."""
+
+
+class _ProgressReader:
+    """Wraps a file object and reports every chunk read to a callback.
+
+    With a hasher, the data is also fed to it on the way through.
+    """
+    def __init__(self, fileobj, callback, hasher=None):
+        self.fileobj = fileobj
+        self.callback = callback
+        self.hasher = hasher
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if data:
+            if self.hasher is not None:
+                self.hasher.update(data)
+            self.callback(len(data))
+        return data
+
+
+def _unsafe_member(member):
+    """Returns why a tar member must not be extracted, or None for a plain file or folder inside the target."""
+    name = member.name.replace('\\', '/')
+    if name.startswith('/') or os.path.isabs(member.name):
+        return "absolute path"
+    if '..' in name.split('/'):
+        return "path leaves the target folder"
+    if member.issym() or member.islnk():
+        return "links are not extracted"
+    if not (member.isfile() or member.isdir()):
+        return "not a regular file or folder"
+    return None
+
+
+def _kill_on_cancel(process, cancel_event):
+    """Kills a Popen the moment cancel_event (a CancelEvent) is set.
+
+    A stream stuck in read() or write() on a stalled device then returns
+    instead of waiting for a chunk boundary that never comes. Returns a
+    function that stops watching.
+    """
+    if cancel_event is None:
+        return lambda: None
+    return cancel_event.add_callback(process.kill)
+
+
+def _kill(process):
+    """Kills an asyncio subprocess without waiting for it.
+
+    The loop's child watcher reaps it; process.wait() would also wait for any
+    grandchild still holding its pipes open.
+    """
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+class AdbShellError(Exception):
+    pass
+
+
+class AdbShellTimeout(AdbShellError):
+    """The command outlived its timeout. It may still be running on the device, so it is never run again."""
+
+
+class AdbShell:
+    """A long-lived `adb shell` process shared by all metadata commands of a device.
+
+    Each command is followed by a unique sentinel on stdout and stderr, so output
+    can be framed without spawning a process per call. The session lives on the
+    engine's event loop and commands are serialized with an asyncio lock. If the
+    session closes or its pipe breaks, the process is respawned and the command
+    retried once; a command that times out, fails mid-frame or is cancelled takes
+    the process down with it and is not retried.
+    """
+    def __init__(self, serial=None):
+        self.serial = serial
+        self._lock = asyncio.Lock()
+        self._process = None
+
+    async def _start(self):
+        cmd = ['adb'] + (['-s', self.serial] if self.serial else []) + ['shell']
+        logging.debug(f"Starting persistent shell: {' '.join(cmd)}")
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                limit=SHELL_LINE_LIMIT)
+        except FileNotFoundError:
+            raise AdbShellError("ADB executable not found in PATH.")
+
+    @staticmethod
+    async def _read_until(stream, marker):
+        collected = []
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError: # a line longer than SHELL_LINE_LIMIT
+                raise AdbShellError("Shell output line too long")
+            if not line:
+                raise EOFError("Shell session closed")
+            line = line.decode('utf-8', errors='replace')
+            if line.startswith(marker):
+                return ''.join(collected), line[len(marker):].strip()
+            collected.append(line.replace('\r\n', '\n'))
+
+    async def _execute(self, command, timeout):
+        marker = f"__DROIDPIPE_{uuid.uuid4().hex}__"
+        script = (f"{{ {command}\n}} </dev/null; printf '\\n%s %s\\n' {marker} \"$?\"; "
+                  f"printf '\\n%s\\n' {marker} >&2\n")
+        self._process.stdin.write(script.encode('utf-8'))
+        await self._process.stdin.drain()
+        # Both streams are read together, so a chatty stderr can't stall stdout
+        try:
+            (out, _), (err, _) = await asyncio.wait_for(asyncio.gather(
+                self._read_until(self._process.stdout, marker),
+                self._read_until(self._process.stderr, marker)), timeout)
+        except asyncio.TimeoutError:
+            raise AdbShellTimeout(f"Shell command timed out after {timeout} s")
+        return out.strip(), err.strip()
+
+    async def run(self, command, timeout=SHELL_TIMEOUT):
+        """Runs a shell command string and returns (stdout, stderr) like run_adb_cmd."""
+        async with self._lock:
+            for attempt in range(2):
+                if self._process is None or self._process.returncode is not None:
+                    await self._start()
+                try:
+                    return await self._execute(command, timeout)
+                except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+                    # The session died under us (or the device dropped): start over on a new process
+                    logging.debug(f"Shell session failed on attempt {attempt + 1}: {e}")
+                    self._terminate()
+                except OSError as e:
+                    self._terminate()
+                    raise AdbShellError(f"Shell session failed: {e}") from e
+                except (AdbShellError, asyncio.CancelledError):
+                    # Framing is lost mid-command: the session goes, the command isn't repeated
+                    self._terminate()
+                    raise
+            raise AdbShellError(f"Could not run command on {self.serial or 'device'}")
+
+    def _terminate(self):
+        if self._process is not None:
+            _kill(self._process)
+            self._process = None
+
+    async def close(self):
+        async with self._lock:
+            self._terminate()
+
+
+class ListingCache:
+    """LRU cache of parsed Android listings keyed by (device serial, directory).
+
+    Entries older than the TTL are dropped on lookup; our own writes invalidate
+    the directories they touch. Thread-safe.
+    """
+    def __init__(self, max_entries=LISTING_CACHE_SIZE, ttl=LISTING_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # (serial, path) -> (timestamp, items, disk_text)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _norm(path):
+        return path.rstrip('/') + '/'
+
+    def get(self, serial, path):
+        """Returns (items, disk_text) or None when missing or expired."""
+        key = (serial, self._norm(path))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, serial, path, items, disk_text=None):
+        key = (serial, self._norm(path))
+        with self._lock:
+            self._entries[key] = (time.time(), list(items), disk_text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, serial, path, recursive=False):
+        """Drops the listing of path, and of everything below it if recursive."""
+        prefix = self._norm(path)
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] != serial:
+                    continue
+                if key[1] == prefix or (recursive and key[1].startswith(prefix)):
+                    del self._entries[key]
+
+
+class TransferJournal:
+    """SQLite record of every push and pull, so interrupted jobs can be resumed.
+
+    Each file is pending, partial (with the bytes known to have landed) or done.
+    Finished jobs are deleted; whatever is left over is resumable. Thread-safe.
+    """
+    def __init__(self, path=JOURNAL_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    direction TEXT NOT NULL,
+                    serial TEXT,
+                    remote_base TEXT NOT NULL,
+                    local_dir TEXT,
+                    walk_paths TEXT,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    job_id INTEGER NOT NULL REFERENCES jobs(id),
+                    local_path TEXT NOT NULL,
+                    rel_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    bytes_done INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (job_id, rel_path)
+                );
+            """)
+            # Journals written before pulls were recorded lack the local_dir column, older ones walk_paths too
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+            if 'local_dir' not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN local_dir TEXT")
+            if 'walk_paths' not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN walk_paths TEXT")
+
+    def create_job(self, direction, serial, remote_base, rows, local_dir=None, walk_paths=None):
+        """Records a new job from (local_path, rel_path, size, mtime) rows and returns its id.
+
+        rel_path is relative to remote_base; mtime is the source side's. A push
+        whose files are still being found names the walked local paths in
+        walk_paths; its rows come in through add_files until finish_walk.
+        """
+        with self._lock, self._db:
+            cur = self._db.execute("INSERT INTO jobs (direction, serial, remote_base, local_dir, walk_paths, created) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)",
+                                   (direction, serial, remote_base, local_dir,
+                                    json.dumps(walk_paths) if walk_paths is not None else None, time.time()))
+            job_id = cur.lastrowid
+            self._db.executemany("INSERT OR REPLACE INTO files (job_id, local_path, rel_path, size, mtime) "
+                                 "VALUES (?, ?, ?, ?, ?)", ((job_id,) + tuple(r) for r in rows))
+        return job_id
+
+    def add_files(self, job_id, rows):
+        """Adds (local_path, rel_path, size, mtime) rows to a job. Files it already has keep their state.
+
+        rows may be a generator; it is read to the end before the journal is locked.
+        """
+        rows = [(job_id,) + tuple(r) for r in rows]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR IGNORE INTO files (job_id, local_path, rel_path, size, mtime) "
+                                 "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def walk_paths(self, job_id):
+        """The local paths of a push whose walk never finished, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT walk_paths FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def finish_walk(self, job_id):
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET walk_paths = NULL WHERE id = ?", (job_id,))
+
+    def mark_done(self, job_id, rel_paths):
+        with self._lock, self._db:
+            self._db.executemany("UPDATE files SET state = 'done', bytes_done = size WHERE job_id = ? AND rel_path = ?",
+                                 ((job_id, r) for r in rel_paths))
+
+    def mark_partial(self, job_id, rel_path, bytes_done):
+        with self._lock, self._db:
+            self._db.execute("UPDATE files SET state = 'partial', bytes_done = ? WHERE job_id = ? AND rel_path = ?",
+                             (bytes_done, job_id, rel_path))
+
+    def finish_job(self, job_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE job_id = ?", (job_id,))
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def latest_incomplete(self, serial):
+        """Returns (job_id, direction, remote_base, local_dir, files_left, bytes_left) of the
+        newest unfinished job, or None.
+
+        A push cancelled before its walk finished counts as unfinished even with
+        every file found so far done; the counts then only cover those files.
+        """
+        with self._lock:
+            return self._db.execute("""
+                SELECT j.id, j.direction, j.remote_base, j.local_dir, COUNT(f.rel_path),
+                       COALESCE(SUM(f.size - f.bytes_done), 0)
+                FROM jobs j LEFT JOIN files f ON f.job_id = j.id AND f.state != 'done'
+                WHERE j.serial = ?
+                GROUP BY j.id HAVING COUNT(f.rel_path) > 0 OR j.walk_paths IS NOT NULL
+                ORDER BY j.created DESC LIMIT 1
+            """, (serial,)).fetchone()
+
+    def unfinished_files(self, job_id):
+        """Returns (local_path, rel_path, size, mtime) of every file not yet done."""
+        with self._lock:
+            return self._db.execute("SELECT local_path, rel_path, size, mtime FROM files "
+                                    "WHERE job_id = ? AND state != 'done'", (job_id,)).fetchall()
+
+
+def plan_sync(source, target, delete_extraneous=False, compare_mtime=True):
+    """Compares {rel_path: (size, mtime)} manifests for a one-way sync from source to target.
+
+    Returns (new, modified, extraneous, unchanged) sorted lists of rel paths. extraneous
+    is only filled if delete_extraneous is set. Without compare_mtime, files of the same
+    size count as unchanged and are left for the caller to compare by hash.
+    """
+    new, modified, unchanged = [], [], []
+    for rel, (size, mtime) in source.items():
+        other = target.get(rel)
+        if other is None:
+            new.append(rel)
+        elif other[0] != size or (compare_mtime and abs(other[1] - mtime) > SYNC_MTIME_TOLERANCE):
+            modified.append(rel)
+        else:
+            unchanged.append(rel)
+    extraneous = [rel for rel in target if rel not in source] if delete_extraneous else []
+    return sorted(new), sorted(modified), sorted(extraneous), sorted(unchanged)
+
+
+def format_sync_report(direction, new, modified, extraneous, unchanged, copy_size, dry_run, limit=500):
+    arrow = "Local -> Device" if direction == 'push' else "Device -> Local"
+    lines = [f"{'Dry run' if dry_run else 'Sync'} ({arrow}): {len(new)} new, {len(modified)} modified, "
+             f"{len(extraneous)} to delete, {len(unchanged)} unchanged, {copy_size} to transfer", ""]
+    changes = [f"+ {r}" for r in new] + [f"~ {r}" for r in modified] + [f"- {r}" for r in extraneous]
+    lines += changes[:limit]
+    if len(changes) > limit:
+        lines.append(f"... and {len(changes) - limit} more")
+    return "\n".join(lines)
+
+
+class SyncPlan:
+    """The outcome of TransferEngine.compare: what a one-way sync has to copy and delete.
+
+    local and remote map rel paths ('/' separators) to (path, size, mtime).
+    """
+    def __init__(self, direction, local, remote, new, modified, extraneous, unchanged):
+        self.direction = direction
+        self.local = local
+        self.remote = remote
+        self.new = new
+        self.modified = modified
+        self.extraneous = extraneous
+        self.unchanged = unchanged
+
+    @property
+    def to_copy(self):
+        return self.new + self.modified
+
+    @property
+    def copy_bytes(self):
+        source = self.local if self.direction == 'push' else self.remote
+        return sum(source[rel][1] for rel in self.to_copy)
+
+    def transfer_files(self):
+        """The files to copy, as (source path, rel_path, size) for prepare_push or prepare_pull."""
+        if self.direction == 'push':
+            return [(self.local[rel][0], rel.replace('/', os.sep), self.local[rel][1]) for rel in self.to_copy]
+        return [(self.remote[rel][0], rel, self.remote[rel][1]) for rel in self.to_copy]
+
+    def report(self, copy_size, dry_run):
+        return format_sync_report(self.direction, self.new, self.modified, self.extraneous, self.unchanged,
+                                  copy_size, dry_run)
+
+
+def file_digest(path, algorithm='sha256'):
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class TransferVerifier:
+    """Local digests of a push, computed while the files are being sent.
+
+    Files sent by `adb push` are hashed on a shared pool as their transfer
+    starts, so the hashing reads them from the page cache alongside adb and
+    overlaps with the rest of the session. Streamed tar batches hand in the
+    digest they computed on the way through instead. Each file is hashed once,
+    even when several devices receive the same payload.
+    """
+    def __init__(self, pool, algorithm):
+        self.pool = pool
+        self.algorithm = algorithm
+        self._digests = {} # rel_path -> hex digest or Future
+        self._lock = threading.Lock()
+
+    def hash_file(self, rel_path, abs_path):
+        with self._lock:
+            if rel_path not in self._digests:
+                self._digests[rel_path] = self.pool.submit(file_digest, abs_path, self.algorithm)
+
+    def add_digest(self, rel_path, digest):
+        with self._lock:
+            self._digests[rel_path] = digest
+
+    def local_digests(self):
+        """Waits for outstanding hashes and returns {rel_path: hex digest}."""
+        with self._lock:
+            pending = dict(self._digests)
+        digests = {}
+        for rel_path, digest in pending.items():
+            try:
+                digests[rel_path] = digest.result() if hasattr(digest, 'result') else digest
+            except OSError as e:
+                logging.warning(f"Could not hash {rel_path}: {e}")
+        return digests
+
+
+def chunk_args(args, max_bytes=MAX_SHELL_ARGS_BYTES):
+    """Yields lists of args whose combined length stays under max_bytes."""
+    chunk, length = [], 0
+    for arg in args:
+        if chunk and length + len(arg) + 3 > max_bytes:
+            yield chunk
+            chunk, length = [], 0
+        chunk.append(arg)
+        length += len(arg) + 3 # quotes and separator
+    if chunk:
+        yield chunk
+
+
+def split_batches(files, max_batches):
+    """Splits (abs_path, rel_path, size) tuples into size-balanced batches."""
+    count = max(1, min(max_batches, len(files) // MIN_FILES_PER_TAR_BATCH))
+    batches = [[] for _ in range(count)]
+    heap = [(0, i) for i in range(count)]
+    for f in sorted(files, key=lambda f: f[2], reverse=True):
+        load, i = heapq.heappop(heap)
+        batches[i].append(f)
+        heapq.heappush(heap, (load + f[2], i))
+    return [b for b in batches if b]
+
+
+class TransferScheduler:
+    """Runs transfer jobs on a bounded pool of adb workers for one device."""
+    def __init__(self, max_workers=DEFAULT_TRANSFER_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='adb-worker')
+
+    def run(self, jobs, progress_callback, cancel_event):
+        """Runs (size, label, fn) jobs largest-first and blocks until all are done.
+
+        fn(on_bytes, cancel_event) returns (message, code); on_bytes takes the bytes
+        done so far for that job. progress_callback receives the total across all jobs.
+        Returns (label, message, code) tuples in completion order.
+        """
+        return self.run_stream([jobs], progress_callback, cancel_event)
+
+    def run_stream(self, job_batches, progress_callback, cancel_event):
+        """Like run, for jobs that are still being planned while the first ones run.
+
+        job_batches yields lists of jobs; each list is queued largest-first behind
+        the ones before it. Once max_workers * PENDING_JOBS_PER_WORKER jobs are
+        waiting, the next batch isn't taken until some finish, which holds back
+        whatever produces the batches.
+        """
+        lock = threading.Lock()
+        done = {} # running job -> bytes done
+        total = [0]
+
+        def make_reporter(i):
+            def on_bytes(n):
+                with lock:
+                    total[0] += n - done.get(i, 0)
+                    done[i] = n
+                    current = total[0]
+                progress_callback(current)
+            return on_bytes
+
+        def work(i, job):
+            size, label, fn = job
+            if cancel_event.is_set():
+                return label, "Cancelled", -2
+            on_bytes = make_reporter(i)
+            try:
+                msg, code = fn(on_bytes, cancel_event)
+            except Exception as e:
+                logging.exception(f"Transfer job {label} crashed")
+                msg, code = str(e), -1
+            if code == 0:
+                on_bytes(size)
+            with lock:
+                done.pop(i, None)
+            return label, msg, code
+
+        max_pending = self.max_workers * PENDING_JOBS_PER_WORKER
+        pending, results, count = set(), [], 0
+        try:
+            for jobs in job_batches:
+                # The executor queue is FIFO, so submission order is start order
+                for job in sorted(jobs, key=lambda job: job[0], reverse=True):
+                    if len(pending) >= max_pending:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        results += [f.result() for f in finished]
+                    pending.add(self._executor.submit(work, count, job))
+                    count += 1
+        except BaseException:
+            for f in pending:
+                f.cancel()
+            wait(pending)
+            raise
+        return results + [f.result() for f in as_completed(pending)]
+
+
+def local_manifest(local_paths):
+    """Returns {rel_path: (abs_path, size, mtime)} like local_files, with '/' separators."""
+    return {rel_path.replace(os.sep, '/'): (abs_path, size, mtime)
+            for abs_path, rel_path, size, mtime in walk_local(local_paths)}
+
+
+def local_size(path):
+    """Returns the size of the local file at path, or None if it can't be read."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def remaining_bytes(files, offsets):
+    """Bytes still to move for (source, rel_path, size) files, given the offsets of partial ones.
+
+    For a LocalWalk, the bytes found so far.
+    """
+    if isinstance(files, LocalWalk):
+        return files.total_bytes
+    return sum(f[2] - offsets.get(f[1], 0) for f in files)
+
+
+class TransferEngine:
+    """adb operations and journaled transfers for any number of devices. Thread-safe.
+
+    serial=None addresses adb's default device, the only one attached or the
+    one named by $ANDROID_SERIAL.
+    """
+    def __init__(self, transfer_workers=DEFAULT_TRANSFER_WORKERS, journal_path=JOURNAL_PATH):
+        self.transfer_workers = transfer_workers
+        self.schedulers = {} # serial -> TransferScheduler
+        self.shells = {} # serial -> AdbShell, used on the loop thread only
+        self.loop = BackgroundLoop()
+        self.adb_client = AdbClient()
+        self._adb_slots = asyncio.Semaphore(MAX_ADB_PROCESSES)
+        self._tar_support = {} # serial -> device has a tar binary
+        self._hash_tools = {} # serial -> (checksum tool, hashlib name) or None
+        self._compressors = {} # serial -> compression tool usable for pulls, or None
+        self.hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='hash')
+        self.listing_cache = ListingCache()
+        try:
+            self.journal = TransferJournal(journal_path)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Transfer journal unavailable ({e}), transfers won't be resumable across restarts")
+            self.journal = TransferJournal(':memory:')
+
+    def _adb(self, serial=None):
+        """Start of an adb command line routed to serial."""
+        return ['adb', '-s', serial] if serial else ['adb']
+
+    async def run_adb_cmd_async(self, cmd_list, serial=None, timeout=ADB_COMMAND_TIMEOUT):
+        """Runs a one-off adb command and returns (stdout, stderr), or (None, error)."""
+        full_cmd = self._adb(serial) + cmd_list
+        logging.debug(f"Running ADB command: {' '.join(full_cmd)}")
+        async with self._adb_slots:
+            try:
+                process = await asyncio.create_subprocess_exec(*full_cmd, stdout=subprocess.PIPE,
+                                                               stderr=subprocess.PIPE)
+            except FileNotFoundError:
+                logging.error("ADB executable not found in PATH.")
+                return None, "ADB executable not found in PATH."
+            try:
+                out, err = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                _kill(process)
+                return None, f"adb {cmd_list[0]} timed out after {timeout} s"
+            except asyncio.CancelledError:
+                _kill(process)
+                raise
+        return (out.decode('utf-8', errors='replace').strip(),
+                err.decode('utf-8', errors='replace').strip())
+
+    def run_adb_cmd(self, cmd_list, serial=None, timeout=ADB_COMMAND_TIMEOUT):
+        return self.loop.run(self.run_adb_cmd_async(cmd_list, serial, timeout))
+
+    async def list_devices_async(self):
+        """Returns (serials of the attached devices, None) or (None, error message).
+
+        Shell sessions of devices that went away are closed.
+        """
+        try:
+            serials = [serial for serial, state in await self.adb_client.devices() if state == 'device']
+        except AdbServerUnavailable:
+            # `adb devices` starts the server, so later calls can use the socket
+            out, err = await self.run_adb_cmd_async(['devices'])
+            if not out:
+                return None, err or "No output"
+            lines = out.split('\n')[1:]
+            serials = [line.split()[0] for line in lines if line.strip() and 'device' in line]
+        except (AdbProtocolError, OSError, EOFError) as e:
+            return None, str(e)
+        for serial in [s for s in self.shells if s not in serials]:
+            await self.shells.pop(serial).close()
+        return serials, None
+
+    def list_devices(self):
+        return self.loop.run(self.list_devices_async())
+
+    async def run_shell_cmd_async(self, command, timeout=SHELL_TIMEOUT, serial=None):
+        """Runs a shell command string on serial.
+
+        Goes through the device's persistent AdbShell session and falls back to a
+        one-off shell service (or `adb shell`) if the session cannot be (re)established.
+        A command that timed out is not run again.
+        """
+        if serial not in self.shells:
+            self.shells[serial] = AdbShell(serial)
+        try:
+            return await self.shells[serial].run(command, timeout)
+        except AdbShellTimeout as e:
+            return None, str(e)
+        except AdbShellError as e:
+            logging.warning(f"Shell session unavailable ({e}), using one-off adb shell")
+        try:
+            out, err, _ = await asyncio.wait_for(self.adb_client.shell(serial, command), timeout)
+            return out.strip(), err.strip()
+        except AdbServerUnavailable:
+            return await self.run_adb_cmd_async(['shell', command], serial, timeout)
+        except (AdbProtocolError, OSError, EOFError) as e:
+            return None, str(e)
+        except asyncio.TimeoutError:
+            return None, f"Shell command timed out after {timeout} s"
+
+    def run_shell_cmd(self, command, timeout=SHELL_TIMEOUT, serial=None):
+        return self.loop.run(self.run_shell_cmd_async(command, timeout, serial))
+
+    def run_adb_transfer(self, cmd_list, progress_callback, cancel_event=None, serial=None):
+        """Runs an adb command that prints progress, such as `push -p` or `pull -p`.
+
+        progress_callback receives the percentage on the loop thread, at most
+        progress.PROGRESS_HZ times a second. Setting cancel_event (an
+        eventloop.CancelEvent) terminates adb at once. Blocking; returns
+        (message, code), where -2 means cancelled.
+        """
+        # Linux Support (pty)
+        if pty is None: 
+            out, err = self.run_adb_cmd(cmd_list, serial, timeout=None)
+            progress_callback(100)
+            return out, 0
+
+        logging.debug(f"Running ADB transfer: {' '.join(cmd_list)}")
+        try:
+            return self.loop.run(run_with_progress(self._adb(serial) + cmd_list, progress_callback), cancel_event)
+        except CancelledError:
+            return "Cancelled", -2
+
+    def push_file(self, local_path, remote_path, progress_callback, cancel_event=None, serial=None):
+        """Pushes one file over a pooled sync connection to the adb server.
+
+        progress_callback receives the exact bytes sent so far, on the loop
+        thread. Without a server, `adb push -p` runs instead and its percentages
+        are scaled to bytes. Blocking; returns (message, code) like run_adb_transfer.
+        """
+        try:
+            self.loop.run(self.adb_client.push(serial, local_path, remote_path, progress_callback), cancel_event)
+            return "Transfer finished", 0
+        except CancelledError:
+            return "Cancelled", -2
+        except AdbServerUnavailable:
+            size = os.path.getsize(local_path)
+            return self.run_adb_transfer(['push', '-p', local_path, remote_path],
+                                         lambda val: progress_callback(int(size * val / 100)), cancel_event, serial)
+        except (AdbProtocolError, OSError, EOFError) as e:
+            return str(e), -1
+
+    def pull_file(self, remote_path, local_path, progress_callback, cancel_event=None, serial=None, size=0):
+        """Pulls one file over a pooled sync connection, keeping the device mtime like `adb pull -a`.
+
+        progress_callback receives the exact bytes received so far, on the loop
+        thread. Without a server, `adb pull -a -p` runs instead and its
+        percentages are scaled to size. Blocking; returns (message, code).
+        """
+        try:
+            self.loop.run(self.adb_client.pull(serial, remote_path, local_path, progress_callback), cancel_event)
+            return "Transfer finished", 0
+        except CancelledError:
+            return "Cancelled", -2
+        except AdbServerUnavailable:
+            return self.run_adb_transfer(['pull', '-a', '-p', remote_path, local_path],
+                                         lambda val: progress_callback(int(size * val / 100)), cancel_event, serial)
+        except (AdbProtocolError, OSError, EOFError) as e:
+            return str(e), -1
+
+    def device_hash_tool(self, serial=None):
+        """Returns (device tool, hashlib name) of the best checksum tool, or None. Cached per device."""
+        if serial not in self._hash_tools:
+            self._hash_tools[serial] = None
+            for tool, algorithm in DEVICE_HASH_TOOLS:
+                out, _ = self.run_shell_cmd(f'command -v {tool}', serial=serial)
+                if out:
+                    self._hash_tools[serial] = (tool, algorithm)
+                    break
+        return self._hash_tools[serial]
+
+    def device_compressor(self, serial=None):
+        """Returns the preferred compression tool both the device and this host support, or None."""
+        if serial not in self._compressors:
+            self._compressors[serial] = None
+            for tool in host_tools():
+                out, _ = self.run_shell_cmd(f'command -v {tool}', serial=serial)
+                if out:
+                    self._compressors[serial] = tool
+                    break
+        return self._compressors[serial]
+
+    def device_has_tar(self, serial=None):
+        """Checks once per device whether a `tar` binary is available."""
+        if serial not in self._tar_support:
+            out, _ = self.run_shell_cmd('command -v tar', serial=serial)
+            self._tar_support[serial] = bool(out)
+        return self._tar_support[serial]
+
+    def run_adb_tar_push(self, files, remote_base, progress_callback, cancel_event=None, serial=None,
+                         verifier=None):
+        """Streams (abs_path, rel_path, size) files as one tar into `tar -x` on the device.
+
+        progress_callback receives the number of payload bytes sent for each chunk.
+        With a TransferVerifier, every file is hashed from the bytes as they are sent.
+        Returns (message, code) like run_adb_transfer.
+        """
+        remote_cmd = f'mkdir -p {shlex.quote(remote_base)} && tar -x -f - -C {shlex.quote(remote_base)}'
+        logging.debug(f"Streaming {len(files)} files to: {remote_cmd}")
+        try:
+            process = subprocess.Popen(self._adb(serial) + ['exec-in', remote_cmd], stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            return "ADB executable not found in PATH.", -1
+        unwatch = _kill_on_cancel(process, cancel_event)
+
+        def on_chunk(n):
+            if cancel_event and cancel_event.is_set():
+                raise TransferCancelled()
+            progress_callback(n)
+
+        try:
+            # Symlinked files go in with their target's content, the size walk_local recorded
+            with tarfile.open(fileobj=process.stdin, mode='w|', bufsize=64 * 1024, dereference=True) as tar:
+                # Explicit directory entries so every parent exists before its files
+                dirs = set()
+                for _, rel_path, _ in files:
+                    parent = os.path.dirname(rel_path)
+                    while parent and parent not in dirs:
+                        dirs.add(parent)
+                        parent = os.path.dirname(parent)
+                for d in sorted(dirs):
+                    info = tarfile.TarInfo(d.replace(os.sep, '/'))
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o775
+                    info.mtime = int(time.time())
+                    tar.addfile(info)
+
+                for abs_path, rel_path, _ in files:
+                    info = tar.gettarinfo(abs_path, arcname=rel_path.replace(os.sep, '/'))
+                    info.uid = info.gid = 0
+                    info.uname = info.gname = ""
+                    hasher = hashlib.new(verifier.algorithm) if verifier else None
+                    with open(abs_path, 'rb') as f:
+                        tar.addfile(info, _ProgressReader(f, on_chunk, hasher))
+                    if hasher is not None:
+                        verifier.add_digest(rel_path, hasher.hexdigest())
+            process.stdin.close()
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                raise TransferCancelled()
+            # exec-in doesn't carry the device's exit status back: check what landed instead
+            remote_of = lambda rel: remote_base.rstrip('/') + '/' + rel.replace(os.sep, '/')
+            short = self.remote_size_mismatches({remote_of(rel_path): size for _, rel_path, size in files}, serial)
+            if short:
+                return f"{len(short)} of {len(files)} file(s) missing or incomplete on the device", 1
+            return "Transfer finished", process.returncode
+        except TransferCancelled:
+            # The partially extracted file is kept for resume
+            process.terminate()
+            process.wait()
+            return "Cancelled", -2
+        except (OSError, tarfile.TarError) as e:
+            process.kill()
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                return "Cancelled", -2
+            return str(e), -1
+        finally:
+            unwatch()
+
+    def run_adb_append_push(self, abs_path, remote_dest, offset, progress_callback, cancel_event=None, serial=None):
+        """Appends abs_path from byte offset onwards to the partial remote_dest.
+
+        Gives remote_dest abs_path's mtime once complete. progress_callback
+        receives the size of every chunk sent.
+        Returns (message, code) like run_adb_transfer.
+        """
+        remote_cmd = f'cat >> {shlex.quote(remote_dest)}'
+        logging.debug(f"Resuming {abs_path} at byte {offset}")
+        try:
+            process = subprocess.Popen(self._adb(serial) + ['exec-in', remote_cmd], stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            return "ADB executable not found in PATH.", -1
+        unwatch = _kill_on_cancel(process, cancel_event)
+        try:
+            with open(abs_path, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    if cancel_event and cancel_event.is_set():
+                        process.terminate()
+                        process.wait()
+                        return "Cancelled", -2
+                    chunk = f.read(64 * 1024)
+                    if not chunk: break
+                    process.stdin.write(chunk)
+                    progress_callback(len(chunk))
+            process.stdin.close()
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                return "Cancelled", -2
+            # exec-in doesn't carry the device's exit status back: check the size instead
+            st = os.stat(abs_path)
+            if self.remote_size_mismatches({remote_dest: st.st_size}, serial):
+                return f"{remote_dest} doesn't match the local size on the device", 1
+            # Keep the source mtime like a sync SEND does, so a later compare sees the file as unchanged
+            _, err = self.run_shell_cmd(f'touch -m -d @{int(st.st_mtime)} {shlex.quote(remote_dest)}',
+                                        serial=serial)
+            if err:
+                logging.warning(f"Could not set the mtime of {remote_dest}: {err}")
+            return "Transfer finished", process.returncode
+        except OSError as e:
+            process.kill()
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                return "Cancelled", -2
+            return str(e), -1
+        finally:
+            unwatch()
+
+    def run_adb_append_pull(self, remote_path, local_path, offset, progress_callback, cancel_event=None, serial=None):
+        """Appends remote_path from byte offset onwards to the partial local_path.
+
+        Restores the device mtime once complete, like `adb pull -a`, and fails
+        unless local_path ends up with the device file's size.
+        Returns (message, code) like run_adb_transfer.
+        """
+        remote_cmd = f"stat -c '%Y %s' {shlex.quote(remote_path)} && tail -c +{offset + 1} {shlex.quote(remote_path)}"
+        logging.debug(f"Resuming {remote_path} at byte {offset}")
+        try:
+            process = subprocess.Popen(self._adb(serial) + ['exec-out', remote_cmd],
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            return "ADB executable not found in PATH.", -1
+        unwatch = _kill_on_cancel(process, cancel_event)
+        try:
+            mtime, size = map(int, process.stdout.readline().split() or (0, -1))
+            with open(local_path, 'ab') as f:
+                while True:
+                    if cancel_event and cancel_event.is_set():
+                        process.terminate()
+                        process.wait()
+                        return "Cancelled", -2
+                    chunk = process.stdout.read1(64 * 1024)
+                    if not chunk: break
+                    f.write(chunk)
+                    progress_callback(len(chunk))
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                return "Cancelled", -2
+            if os.path.getsize(local_path) != size:
+                return f"{local_path} doesn't match the device's size", 1
+            os.utime(local_path, (mtime, mtime))
+            return "Transfer finished", process.returncode
+        except (OSError, ValueError) as e:
+            process.kill()
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                return "Cancelled", -2
+            return str(e), -1
+        finally:
+            unwatch()
+
+    def run_adb_compressed_pull(self, remote_path, local_path, tool, progress_callback, cancel_event=None,
+                                serial=None):
+        """Pulls remote_path through `tool` on the device, inflating it into local_path on the fly.
+
+        progress_callback(logical, wire) receives the decompressed and compressed
+        size of every chunk. Restores the device mtime like `adb pull -a`.
+        Returns (message, code) like run_adb_transfer.
+        """
+        remote_cmd = f'stat -c %Y {shlex.quote(remote_path)} && {compress_command(tool)} < {shlex.quote(remote_path)}'
+        logging.debug(f"Streaming from device: {remote_cmd}")
+        try:
+            process = subprocess.Popen(self._adb(serial) + ['exec-out', remote_cmd],
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            return "ADB executable not found in PATH.", -1
+        unwatch = _kill_on_cancel(process, cancel_event)
+
+        def on_chunk(logical, wire):
+            if cancel_event and cancel_event.is_set():
+                raise TransferCancelled()
+            progress_callback(logical, wire)
+
+        try:
+            mtime = int(process.stdout.readline().strip() or 0)
+            reader = DecompressingReader(process.stdout, tool, on_chunk)
+            with open(local_path, 'wb') as f:
+                for data in iter(reader.read, b''):
+                    f.write(data)
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                raise TransferCancelled()
+            if process.returncode == 0 and mtime:
+                os.utime(local_path, (mtime, mtime))
+            return "Transfer finished", process.returncode
+        except TransferCancelled:
+            process.terminate()
+            process.wait()
+            return "Cancelled", -2
+        except (OSError, ValueError, zlib.error) as e:
+            process.kill()
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                return "Cancelled", -2
+            return str(e), -1
+        finally:
+            unwatch()
+
+    def compressible_files(self, files, serial=None):
+        """Returns the rel_paths of (remote_path, rel_path, size) files worth pulling compressed.
+
+        The extension decides where it can; the rest get one batched sampling pass.
+        """
+        worth = set()
+        unknown = {}
+        for remote_path, rel_path, size in files:
+            verdict = classify(rel_path)
+            if verdict:
+                worth.add(rel_path)
+            elif verdict is None:
+                unknown[remote_path] = (rel_path, size)
+        sizes = {path: size for path, (_, size) in unknown.items()}
+        for chunk in chunk_args(list(unknown)):
+            out, _ = self.run_shell_cmd(sample_command(chunk), timeout=MANIFEST_TIMEOUT, serial=serial)
+            worth.update(unknown[path][0] for path in parse_sample_sizes(out or '', chunk, sizes))
+        return worth
+
+    def remote_file_sizes(self, remote_paths, serial=None):
+        """Returns {path: size} for the remote_paths that exist, in as few shell calls as possible."""
+        sizes = {}
+        for chunk in chunk_args(remote_paths):
+            out, _ = self.run_shell_cmd('stat -c "%s %n" ' + ' '.join(shlex.quote(p) for p in chunk),
+                                        serial=serial)
+            for line in (out or '').splitlines():
+                size, _, path = line.partition(' ')
+                if size.isdigit():
+                    sizes[path] = int(size)
+        return sizes
+
+    def remote_size_mismatches(self, expected, serial=None):
+        """Returns the paths of {remote path: size} that are missing on the device or have another size."""
+        sizes = self.remote_file_sizes(list(expected), serial)
+        return [path for path, size in expected.items() if sizes.get(path) != size]
+
+    def remote_manifest(self, remote_paths, serial=None):
+        """Recursively lists remote_paths with one `find | stat` pass per argument chunk.
+
+        Returns (path, size, mtime, is_dir) tuples with exact byte sizes.
+        """
+        entries = []
+        for chunk in chunk_args(remote_paths):
+            cmd = 'find ' + ' '.join(shlex.quote(p) for p in chunk) + " -exec stat -c '%f %s %Y %n' {} +"
+            out, _ = self.run_shell_cmd(cmd, timeout=MANIFEST_TIMEOUT, serial=serial)
+            for line in (out or '').splitlines():
+                parts = line.split(' ', 3)
+                if len(parts) < 4: continue
+                try:
+                    mode = int(parts[0], 16)
+                    entries.append((parts[3], int(parts[1]), int(parts[2]), stat.S_ISDIR(mode)))
+                except ValueError:
+                    continue
+        return entries
+
+    async def sync_manifest_async(self, remote_paths, serial=None):
+        """remote_manifest over the sync protocol, for devices without find or stat.
+
+        STATs every path and LISTs down every folder, one request at a time on
+        a pooled connection. Sizes come from the protocol's 32-bit field.
+        """
+        entries, folders = [], []
+        for path in remote_paths:
+            mode, size, mtime = await self.adb_client.stat(serial, path)
+            if stat.S_ISDIR(mode):
+                entries.append((path, 0, mtime, True))
+                folders.append(path)
+            elif mode:
+                entries.append((path, size, mtime, False))
+        while folders:
+            folder = folders.pop()
+            for name, mode, size, mtime in await self.adb_client.list(serial, folder):
+                if name in ('.', '..'):
+                    continue
+                path = folder.rstrip('/') + '/' + name
+                if stat.S_ISDIR(mode):
+                    entries.append((path, 0, mtime, True))
+                    folders.append(path)
+                elif stat.S_ISREG(mode) or stat.S_ISLNK(mode):
+                    entries.append((path, size, mtime, False))
+        return entries
+
+    def remote_hashes(self, remote_paths, serial=None, tool='sha256sum'):
+        """Returns {path: hex digest} computed on the device in batched calls."""
+        hashes = {}
+        for chunk in chunk_args(remote_paths):
+            out, _ = self.run_shell_cmd(f'{tool} ' + ' '.join(shlex.quote(p) for p in chunk),
+                                        timeout=MANIFEST_TIMEOUT, serial=serial)
+            for line in (out or '').splitlines():
+                digest, _, path = line.partition('  ')
+                if path:
+                    hashes[path] = digest
+        return hashes
+
+    def run_adb_tar_pull(self, remote_dir, names, local_dir, progress_callback, cancel_event=None, serial=None,
+                         tool=None):
+        """Streams `tar -c` of names (relative to remote_dir) from the device into local_dir.
+
+        Nothing is staged on disk; progress_callback receives the size of every chunk
+        read from the stream. With a compression tool, the tar is compressed on the
+        device and progress_callback(logical, wire) gets both sizes of each chunk.
+        Returns (message, code) like run_adb_transfer.
+        """
+        remote_cmd = f'tar -c -f - -C {shlex.quote(remote_dir)} ' + ' '.join(shlex.quote(n) for n in names)
+        if tool:
+            remote_cmd += ' | ' + compress_command(tool)
+        logging.debug(f"Streaming from device: {remote_cmd}")
+        try:
+            process = subprocess.Popen(self._adb(serial) + ['exec-out', remote_cmd],
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            return "ADB executable not found in PATH.", -1
+        unwatch = _kill_on_cancel(process, cancel_event)
+
+        def on_chunk(*sizes):
+            if cancel_event and cancel_event.is_set():
+                raise TransferCancelled()
+            progress_callback(*sizes)
+
+        if tool:
+            stream = DecompressingReader(process.stdout, tool, on_chunk)
+        else:
+            stream = _ProgressReader(process.stdout, on_chunk)
+        try:
+            with tarfile.open(fileobj=stream, mode='r|') as tar:
+                # Reject absolute paths and links escaping local_dir where supported
+                tar.extraction_filter = getattr(tarfile, 'data_filter', None)
+                for member in tar:
+                    # Without data_filter, do its most important checks by hand
+                    problem = _unsafe_member(member) if tar.extraction_filter is None else None
+                    if problem:
+                        logging.warning(f"Skipping {member.name}: {problem}")
+                        continue
+                    try:
+                        tar.extract(member, local_dir)
+                    except TAR_FILTER_ERRORS as e:
+                        logging.warning(f"Skipping {member.name}: {e}")
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                raise TransferCancelled()
+            return "Transfer finished", process.returncode
+        except TransferCancelled:
+            process.terminate()
+            process.wait()
+            return "Cancelled", -2
+        except (OSError, tarfile.TarError, zlib.error) as e:
+            process.kill()
+            process.wait()
+            if cancel_event and cancel_event.is_set():
+                return "Cancelled", -2
+            return str(e), -1
+        finally:
+            unwatch()
+
+    async def list_android_dir_async(self, path, serial=None, strict=False):
+        """Lists path on the device as FileEntry objects (hidden files excluded).
+
+        A folder that can't be listed comes back empty, or raises ListingError if strict.
+        """
+        out, err = await self.run_shell_cmd_async(list_command(path), serial=serial)
+        entries = parse_listing(out or '')
+        if not entries and err:
+            # Old toolbox builds without find/stat: fall back to parsing `ls -l`
+            out, err = await self.run_shell_cmd_async(f'ls -l {shlex.quote(path)}', serial=serial)
+            entries = parse_ls(out or '')
+            if strict and not entries and (out is None or err):
+                raise ListingError(err or f"Could not list {path}")
+        return entries
+
+    def list_android_dir(self, path, serial=None, strict=False):
+        return self.loop.run(self.list_android_dir_async(path, serial, strict))
+
+    async def stream_shell_batches(self, command, serial=None):
+        """Yields the output lines of command on the device in lists, as they arrive.
+
+        Output is only read when the next batch is asked for, so a slow consumer
+        stalls the command through the pipe instead of piling lines up in memory.
+        """
+        logging.debug(f"Streaming from device: {command}")
+        process = await asyncio.create_subprocess_exec(*self._adb(serial), 'exec-out', command,
+                                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        rest = ''
+        try:
+            while True:
+                chunk = await process.stdout.read(STREAM_READ_SIZE)
+                text = rest + decoder.decode(chunk, final=not chunk)
+                if not chunk:
+                    if text:
+                        yield [text]
+                    break
+                lines = text.split('\n')
+                rest = lines.pop()
+                if lines:
+                    yield [line + '\n' for line in lines]
+            await process.wait()
+        finally:
+            if process.returncode is None:
+                _kill(process)
+
+    def stream_shell_lines(self, command, serial=None):
+        """Yields the output lines of command on the device as they arrive."""
+        for lines in self.loop.iterate(self.stream_shell_batches(command, serial)):
+            yield from lines
+
+    async def delete_remote_async(self, paths, serial=None, on_progress=None):
+        """Deletes files and folders on the device and drops the cached listings they touch.
+
+        All paths go to one `rm -rf --` (more only past MAX_SHELL_ARGS_BYTES),
+        followed by a check of which ones are still there. on_progress(done,
+        total) is called after each command. Returns (path, error) for every
+        path the device refused to delete.
+        """
+        errors = []
+        done = 0
+        # Every path appears twice in a command: once for rm, once for the check
+        for chunk in chunk_args(paths, MAX_SHELL_ARGS_BYTES // 2):
+            quoted = ' '.join(shlex.quote(p) for p in chunk)
+            out, err = await self.run_shell_cmd_async(
+                f'rm -rf -- {quoted}; i=0; for p in {quoted}; do '
+                f'if [ -e "$p" ] || [ -L "$p" ]; then echo $i; fi; i=$((i+1)); done', DELETE_TIMEOUT, serial)
+            if out is None:
+                errors += [(path, err) for path in chunk]
+            else:
+                messages = (err or '').splitlines()
+                for i in {int(line) for line in out.split() if line.isdigit()}:
+                    path = chunk[i]
+                    errors.append((path, next((m for m in messages if path in m), err or "Not deleted")))
+            for path in chunk:
+                self.listing_cache.invalidate(serial, path, recursive=True)
+                self.listing_cache.invalidate(serial, path.rstrip('/').rsplit('/', 1)[0] or '/')
+            done += len(chunk)
+            if on_progress:
+                on_progress(done, len(paths))
+        return errors
+
+    def delete_remote(self, paths, serial=None, on_progress=None):
+        return self.loop.run(self.delete_remote_async(paths, serial, on_progress))
+
+    @staticmethod
+    def delete_local(paths, on_progress=None):
+        """Deletes local files and folders. Blocking.
+
+        on_progress(done, total) is called after each path. Returns (path,
+        error) for every path that couldn't be deleted completely.
+        """
+        errors = []
+        for done, path in enumerate(paths, 1):
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                errors.append((path, e.strerror or str(e)))
+            if on_progress:
+                on_progress(done, len(paths))
+        return errors
+
+    def get_scheduler(self, serial=None):
+        """Returns the transfer scheduler (worker pool) of a device.
+
+        Every device has its own pool, so transfers to different devices run side by side.
+        """
+        if serial not in self.schedulers:
+            self.schedulers[serial] = TransferScheduler(self.transfer_workers)
+        return self.schedulers[serial]
+
+    def prepare_pull(self, serial, remote_base, local_dir, remote_paths=None, files=None, resume_job=None):
+        """Plans a journaled pull into local_dir.
+
+        Either remote_paths (expanded with a single manifest call), explicit
+        (remote_path, rel_path, size) files, or a journaled job to resume.
+        Returns (job_id, files, offsets) for run_pull.
+        """
+        if resume_job is not None:
+            files, offsets = self._plan_pull_resume(resume_job, remote_base, serial)
+            return resume_job, files, offsets
+
+        if files is None:
+            # One recursive stat for the whole selection: exact sizes and the file plan
+            manifest = self.remote_manifest(remote_paths, serial)
+            if not manifest:
+                # No find/stat on the device: walk the selection with sync STAT and LIST instead
+                try:
+                    manifest = self.loop.run(self.sync_manifest_async(remote_paths, serial))
+                except AdbServerUnavailable:
+                    manifest = None
+                except (AdbProtocolError, EOFError) as e:
+                    raise ListingError(f"Could not list {', '.join(remote_paths)}: {e}") from e
+            if manifest is None:
+                # No server either: whole items go to `adb pull`, which takes folders too
+                files = [(p, p[len(remote_base):], 0, 0) for p in remote_paths]
+            else:
+                files = []
+                for path, size, mtime, is_dir in manifest:
+                    if is_dir:
+                        # Recreate empty folders too
+                        os.makedirs(os.path.join(local_dir, *path[len(remote_base):].split('/')), exist_ok=True)
+                    else:
+                        files.append((path, path[len(remote_base):], size, mtime))
+        else:
+            files = [(f[0], f[1], f[2], 0) for f in files]
+        rows = [(os.path.join(local_dir, *rel.split('/')), rel, size, mtime)
+                for _, rel, size, mtime in files]
+        job_id = self.journal.create_job('pull', serial, remote_base, rows, local_dir)
+        return job_id, [f[:3] for f in files], {}
+
+    def run_pull(self, serial, remote_base, local_dir, job_id, files, offsets, progress_callback, cancel_event,
+                 compress=False, wire_stats=None):
+        """Runs a planned pull on the device's scheduler. Blocking.
+
+        progress_callback receives the bytes done across the session. With
+        compress, compressed jobs add their [logical, wire] byte counts to
+        wire_stats. Returns the scheduler's (label, message, code) results; the
+        journal job is closed once everything arrived.
+        """
+        scheduler = self.get_scheduler(serial)
+        tool = self.device_compressor(serial) if compress else None
+        if compress and tool is None:
+            logging.warning(f"{serial or 'The device'} has no gzip, pulling uncompressed")
+        jobs = self._build_pull_jobs(files, offsets, remote_base, local_dir, job_id, scheduler, serial,
+                                     tool, wire_stats if wire_stats is not None else [])
+        results = scheduler.run(jobs, progress_callback, cancel_event)
+
+        if not cancel_event.is_set() and all(code == 0 for _, _, code in results):
+            self.journal.finish_job(job_id)
+        return results
+
+    def _plan_pull_resume(self, job_id, remote_base, serial):
+        """Reconciles a journaled pull with the local disk and the device.
+
+        Returns (files, offsets) like _plan_push_resume.
+        """
+        rows = self.journal.unfinished_files(job_id)
+        remote = {path: (size, mtime) for path, size, mtime, is_dir in
+                  self.remote_manifest([remote_base + r[1] for r in rows], serial) if not is_dir}
+
+        files, offsets, done = [], {}, []
+        for local_path, rel_path, size, mtime in rows:
+            remote_path = remote_base + rel_path
+            if remote_path not in remote:
+                logging.warning(f"{remote_path} is gone, dropping it from the transfer")
+                done.append(rel_path)
+                continue
+            if remote[remote_path] != (size, mtime):
+                # Changed on the device since the job started: fetch it again from scratch
+                files.append((remote_path, rel_path, remote[remote_path][0]))
+                continue
+            try:
+                st = os.stat(local_path)
+            except OSError:
+                st = None
+            if st and st.st_size == size and int(st.st_mtime) == int(mtime):
+                done.append(rel_path)
+                continue
+            if st and 0 < st.st_size < size:
+                offsets[rel_path] = st.st_size
+            files.append((remote_path, rel_path, size))
+        self.journal.mark_done(job_id, done)
+        return files, offsets
+
+    def _build_pull_jobs(self, files, offsets, remote_base, local_dir, job_id, scheduler, serial, tool=None,
+                         wire_stats=None):
+        """Turns (remote_path, rel_path, size) files into scheduler jobs that keep the journal current.
+
+        rel_path is relative to remote_base and is recreated under local_dir. With
+        a compression tool, files worth it are pulled compressed and every such
+        job appends its [logical, wire] byte counts to wire_stats.
+        """
+        jobs = []
+        local_of = lambda rel: os.path.join(local_dir, *rel.split('/'))
+
+        # Partial local files are continued where they stopped
+        for remote_path, rel_path, size in [f for f in files if f[1] in offsets]:
+            offset = offsets[rel_path]
+
+            def append_one(on_bytes, cancel, remote_path=remote_path, rel_path=rel_path, size=size, offset=offset):
+                received = [0]
+
+                def on_chunk(n):
+                    received[0] += n
+                    on_bytes(received[0])
+
+                res, code = self.run_adb_append_pull(remote_path, local_of(rel_path), offset, on_chunk, cancel, serial)
+                if code not in (0, -2):
+                    logging.warning(f"Resuming {remote_path} failed ({res}), pulling it again")
+                    offset = 0
+
+                    def on_received(n):
+                        received[0] = n
+                        on_bytes(n)
+
+                    res, code = self.pull_file(remote_path, local_of(rel_path), on_received, cancel, serial, size)
+                if code == 0:
+                    self.journal.mark_done(job_id, [rel_path])
+                else:
+                    self.journal.mark_partial(job_id, rel_path, offset + received[0])
+                return res, code
+
+            jobs.append((size - offset, rel_path, append_one))
+        files = [f for f in files if f[1] not in offsets]
+
+        # Small files of unknown type aren't sampled; only their extension can opt them in
+        if tool:
+            compressed = self.compressible_files([f for f in files if f[2] > TAR_BATCH_THRESHOLD], serial)
+            compressed.update(f[1] for f in files if f[2] <= TAR_BATCH_THRESHOLD and classify(f[1]))
+        else:
+            compressed = set()
+
+        small_files = [f for f in files if f[2] <= TAR_BATCH_THRESHOLD]
+        if len(small_files) > 1 and self.device_has_tar(serial):
+            files = [f for f in files if f[2] > TAR_BATCH_THRESHOLD]
+            plain = split_batches([f for f in small_files if f[1] not in compressed], scheduler.max_workers)
+            packed = split_batches([f for f in small_files if f[1] in compressed], scheduler.max_workers)
+            for batch, batch_tool in [(b, None) for b in plain] + [(b, tool) for b in packed]:
+                # Keep each tar command line within the device's argument limits
+                for names in chunk_args([f[1] for f in batch]):
+                    name_set = set(names)
+                    sizes = {f[1]: f[2] for f in batch if f[1] in name_set}
+                    size = sum(sizes.values())
+                    stats = [0, 0]
+                    if batch_tool:
+                        wire_stats.append(stats)
+
+                    def pull_batch(on_bytes, cancel, names=names, sizes=sizes, size=size, batch_tool=batch_tool,
+                                   stats=stats):
+                        def on_chunk(n, wire=None):
+                            stats[0] += n
+                            stats[1] += n if wire is None else wire
+                            on_bytes(min(stats[0], size))
+
+                        res, code = self.run_adb_tar_pull(remote_base, names, local_dir, on_chunk, cancel, serial,
+                                                          batch_tool)
+                        if code == -2:
+                            return res, code
+                        if code == 0:
+                            # tar's exit status doesn't cover every way a member can go missing
+                            failed = [name for name in names if local_size(local_of(name)) != sizes[name]]
+                            if failed:
+                                logging.warning(f"{len(failed)} file(s) incomplete after the tar pull, "
+                                                f"falling back to adb pull")
+                        else:
+                            logging.warning(f"tar pull failed ({res}), falling back to adb pull")
+                            failed = names
+                        failed_set = set(failed)
+                        self.journal.mark_done(job_id, [name for name in names if name not in failed_set])
+                        for name in failed:
+                            if cancel.is_set():
+                                return "Cancelled", -2
+                            local_path = local_of(name)
+                            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                            res, code = self.pull_file(remote_base + name, local_path, lambda n: None, cancel,
+                                                       serial, sizes[name])
+                            if code != 0:
+                                return res, code
+                            self.journal.mark_done(job_id, [name])
+                        return "Transfer finished", 0
+
+                    jobs.append((size, f"{len(names)} batched files", pull_batch))
+
+        for remote_path, rel_path, size in files:
+            def pull_one(on_bytes, cancel, remote_path=remote_path, rel_path=rel_path, size=size):
+                local_path = local_of(rel_path)
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                received = [0]
+
+                def on_received(n):
+                    received[0] = n
+                    on_bytes(n)
+
+                code = None
+                if rel_path in compressed:
+                    stats = [0, 0]
+                    wire_stats.append(stats)
+
+                    def on_chunk(logical, wire):
+                        stats[0] += logical
+                        stats[1] += wire
+                        received[0] = stats[0]
+                        on_bytes(received[0])
+
+                    res, code = self.run_adb_compressed_pull(remote_path, local_path, tool, on_chunk, cancel, serial)
+                    if code not in (0, -2):
+                        logging.warning(f"Compressed pull of {remote_path} failed ({res}), falling back to adb pull")
+                        stats[0] = stats[1] = 0
+                if code not in (0, -2):
+                    # The device mtime is kept, so later syncs see the file as unchanged
+                    res, code = self.pull_file(remote_path, local_path, on_received, cancel, serial, size)
+                if code == 0:
+                    self.journal.mark_done(job_id, [rel_path])
+                elif code == -2:
+                    self.journal.mark_partial(job_id, rel_path, received[0])
+                return res, code
+
+            jobs.append((size, rel_path, pull_one))
+        return jobs
+
+    def prepare_push(self, serial, remote_base, local_paths=None, files=None, resume_job=None):
+        """Plans a journaled push into remote_base.
+
+        Either local_paths (walked recursively), explicit (abs_path, rel_path,
+        size) files, or a journaled job to resume. Returns (job_id, files,
+        offsets) for run_push. For local_paths, files is a LocalWalk that has
+        only just started: its files are journaled as they are found, and
+        run_push sends them on the way.
+        """
+        if resume_job is not None:
+            files, offsets = self._plan_push_resume(resume_job, remote_base, serial)
+            return resume_job, files, offsets
+
+        if files is None:
+            job_id = self.journal.create_job('push', serial, remote_base, [], walk_paths=local_paths)
+            return job_id, LocalWalk(local_paths, lambda rows: self.journal.add_files(job_id, rows)), {}
+        rows = [(a, r, size, os.path.getmtime(a)) for a, r, size in files]
+        return self.journal.create_job('push', serial, remote_base, rows), files, {}
+
+    def run_push(self, serial, remote_base, job_id, files, offsets, progress_callback, cancel_event,
+                 verifiers=None, on_verify=None):
+        """Runs a planned push on the device's scheduler. Blocking.
+
+        verifiers maps hashlib names to TransferVerifier objects shared by the
+        devices of one session; when given, the pushed files are verified too,
+        after calling on_verify(file count). Returns the scheduler's (label,
+        message, code) results; the journal job is closed once everything landed.
+        When files is a LocalWalk, each batch it hands over is queued on the
+        scheduler right away, and cancelling also stops the walk.
+        """
+        scheduler = self.get_scheduler(serial)
+        hash_tool = self.device_hash_tool(serial) if verifiers is not None else None
+        if verifiers is not None and hash_tool is None:
+            logging.warning(f"{serial or 'The device'} has no sha256sum or md5sum, skipping verification")
+        verifier = None
+        if hash_tool:
+            verifier = verifiers.setdefault(hash_tool[1], TransferVerifier(self.hash_pool, hash_tool[1]))
+
+        if isinstance(files, LocalWalk):
+            walk = files
+
+            def job_batches():
+                for batch in walk.batches():
+                    if cancel_event.is_set():
+                        return
+                    yield self._build_push_jobs(batch, {}, remote_base, job_id, scheduler, serial, verifier)
+
+            remove = cancel_event.add_callback(walk.stop)
+            try:
+                results = scheduler.run_stream(job_batches(), progress_callback, cancel_event)
+            finally:
+                remove()
+                walk.stop()
+            if walk.finished:
+                self.journal.finish_walk(job_id)
+            files = walk.manifest
+        else:
+            jobs = self._build_push_jobs(files, offsets, remote_base, job_id, scheduler, serial, verifier)
+            results = scheduler.run(jobs, progress_callback, cancel_event)
+
+        if verifier and not cancel_event.is_set() and all(code == 0 for _, _, code in results):
+            if on_verify:
+                on_verify(len(files))
+            results += self._verify_push(serial, remote_base, files, job_id, verifier, hash_tool[0])
+
+        if not cancel_event.is_set() and all(code == 0 for _, _, code in results):
+            self.journal.finish_job(job_id)
+        self._invalidate_pushed(serial, remote_base, files)
+        return results
+
+    def _plan_push_resume(self, job_id, remote_base, serial):
+        """Reconciles a journaled push with the device.
+
+        Returns (files, offsets): what still has to move, and the byte offset of
+        every partial remote file that can be continued instead of restarted.
+        """
+        walk_paths = self.journal.walk_paths(job_id)
+        if walk_paths is not None:
+            # Cancelled while still walking: find the rest first, what was found keeps its state.
+            # The walk runs before add_files locks the journal, which other sessions keep writing to
+            self.journal.add_files(job_id, list(walk_local(walk_paths)))
+            self.journal.finish_walk(job_id)
+        rows = self.journal.unfinished_files(job_id)
+        remote_of = lambda rel: remote_base.rstrip('/') + '/' + rel.replace(os.sep, '/')
+        remote_sizes = self.remote_file_sizes([remote_of(r[1]) for r in rows], serial)
+
+        files, offsets, done = [], {}, []
+        for local_path, rel_path, size, mtime in rows:
+            try:
+                st = os.stat(local_path)
+            except OSError:
+                logging.warning(f"{local_path} is gone, dropping it from the transfer")
+                done.append(rel_path)
+                continue
+            if st.st_size != size or int(st.st_mtime) != int(mtime):
+                # Changed since the job started: send it again from scratch
+                files.append((local_path, rel_path, st.st_size))
+                continue
+            remote_size = remote_sizes.get(remote_of(rel_path))
+            if remote_size == size:
+                done.append(rel_path)
+                continue
+            if remote_size and remote_size < size:
+                offsets[rel_path] = remote_size
+            files.append((local_path, rel_path, size))
+        self.journal.mark_done(job_id, done)
+        return files, offsets
+
+    def _build_push_jobs(self, files, offsets, remote_base, job_id, scheduler, serial, verifier=None):
+        """Turns (abs_path, rel_path, size) files into scheduler jobs that keep the journal current.
+
+        With a TransferVerifier, every file's local digest is computed alongside its transfer.
+        """
+        jobs = []
+        remote_of = lambda rel: remote_base + rel if remote_base.endswith('/') else remote_base + '/' + rel
+
+        # Partial remote files are continued where they stopped
+        for abs_path, rel_path, size in [f for f in files if f[1] in offsets]:
+            offset = offsets[rel_path]
+
+            def append_one(on_bytes, cancel, abs_path=abs_path, rel_path=rel_path, offset=offset):
+                sent = [0]
+
+                def on_chunk(n):
+                    sent[0] += n
+                    on_bytes(sent[0])
+
+                if verifier:
+                    verifier.hash_file(rel_path, abs_path)
+                res, code = self.run_adb_append_push(abs_path, remote_of(rel_path), offset, on_chunk, cancel, serial)
+                if code == 0:
+                    self.journal.mark_done(job_id, [rel_path])
+                else:
+                    self.journal.mark_partial(job_id, rel_path, offset + sent[0])
+                return res, code
+
+            jobs.append((size - offset, rel_path, append_one))
+        files = [f for f in files if f[1] not in offsets]
+
+        # Small files share tar streams, large ones keep the direct push path
+        small_files = [f for f in files if f[2] <= TAR_BATCH_THRESHOLD]
+        if len(small_files) > 1 and self.device_has_tar(serial):
+            files = [f for f in files if f[2] > TAR_BATCH_THRESHOLD]
+            for batch in split_batches(small_files, scheduler.max_workers):
+                def push_batch(on_bytes, cancel, batch=batch):
+                    sent = [0]
+
+                    def on_chunk(n):
+                        sent[0] += n
+                        on_bytes(sent[0])
+
+                    res, code = self.run_adb_tar_push(batch, remote_base, on_chunk, cancel, serial, verifier)
+                    if code == 0:
+                        self.journal.mark_done(job_id, [f[1] for f in batch])
+                    return res, code
+
+                jobs.append((sum(f[2] for f in batch), f"{len(batch)} batched files", push_batch))
+
+        for abs_path, rel_path, size in files:
+            def push_one(on_bytes, cancel, abs_path=abs_path, rel_path=rel_path):
+                sent = [0]
+
+                def on_sent(n):
+                    sent[0] = n
+                    on_bytes(n)
+
+                if verifier:
+                    verifier.hash_file(rel_path, abs_path)
+                res, code = self.push_file(abs_path, remote_of(rel_path), on_sent, cancel, serial)
+                if code == 0:
+                    self.journal.mark_done(job_id, [rel_path])
+                elif code == -2:
+                    # Whatever landed is kept for resume
+                    self.journal.mark_partial(job_id, rel_path, sent[0])
+                return res, code
+
+            jobs.append((size, rel_path, push_one))
+        return jobs
+
+    def _verify_push(self, serial, remote_base, files, job_id, verifier, tool):
+        """Compares local digests with one batched device-side checksum pass.
+
+        Bad copies are deleted and reset in the journal, so Resume sends them
+        again. Returns a failed (label, message, code) result per bad file.
+        """
+        remote_of = lambda rel: remote_base.rstrip('/') + '/' + rel.replace(os.sep, '/')
+        local = verifier.local_digests()
+        remote = self.remote_hashes([remote_of(f[1]) for f in files], serial, tool)
+        bad = [f[1] for f in files if f[1] not in local or remote.get(remote_of(f[1])) != local[f[1]]]
+        if not bad:
+            return []
+
+        logging.error(f"{len(bad)} file(s) on {serial} failed verification")
+        for chunk in chunk_args([remote_of(rel) for rel in bad]):
+            self.run_shell_cmd('rm -f ' + ' '.join(shlex.quote(p) for p in chunk), serial=serial)
+        for rel in bad:
+            self.journal.mark_partial(job_id, rel, 0)
+        return [(rel, "Checksum mismatch", -1) for rel in bad]
+
+    def _invalidate_pushed(self, serial, remote_base, files):
+        """Drops cached listings of remote_base, its parent and every folder pushed into it."""
+        self.listing_cache.invalidate(serial, remote_base)
+        # The push creates remote_base if it was missing
+        self.listing_cache.invalidate(serial, remote_base.rstrip('/').rsplit('/', 1)[0] or '/')
+        for top in {f[1].split(os.sep)[0] for f in files if os.sep in f[1]}:
+            remote_dir = remote_base.rstrip('/') + '/' + top
+            self.listing_cache.invalidate(serial, remote_dir, recursive=True)
+
+
+    def compare(self, serial, direction, local_dir, remote_base, names, delete_extraneous=False, use_hash=False):
+        """Plans a one-way sync of the items names, found in local_dir and in remote_base.
+
+        direction is 'push' (local -> device) or 'pull' (device -> local). Without
+        use_hash, files match by size and mtime; with it, files of equal size are
+        compared by the device's checksum tool (SHA-256, or MD5 where that is all
+        it has), or by mtime again if it has neither. Returns a SyncPlan.
+        """
+        hash_tool = self.device_hash_tool(serial) if use_hash else None
+        if use_hash and hash_tool is None:
+            logging.warning(f"{serial or 'The device'} has no checksum tool, comparing by mtime instead")
+        local = local_manifest([os.path.join(local_dir, n) for n in names])
+        remote = {}
+        for path, size, mtime, is_dir in self.remote_manifest([remote_base + n for n in names], serial):
+            if not is_dir:
+                remote[path[len(remote_base):]] = (path, size, mtime)
+
+        source, target = (local, remote) if direction == 'push' else (remote, local)
+        new, modified, extraneous, unchanged = plan_sync(
+            {k: v[1:] for k, v in source.items()}, {k: v[1:] for k, v in target.items()},
+            delete_extraneous, compare_mtime=hash_tool is None)
+
+        if hash_tool and unchanged:
+            tool, algorithm = hash_tool
+            remote_digests = self.remote_hashes([remote[rel][0] for rel in unchanged], serial, tool)
+            differing = {rel for rel in unchanged
+                         if remote_digests.get(remote[rel][0]) != file_digest(local[rel][0], algorithm)}
+            modified += sorted(differing)
+            unchanged = [rel for rel in unchanged if rel not in differing]
+        return SyncPlan(direction, local, remote, new, modified, extraneous, unchanged)
+
+    def remove_extraneous(self, serial, plan, remote_base):
+        """Deletes the target files of a SyncPlan that the source doesn't have."""
+        if not plan.extraneous:
+            return
+        if plan.direction == 'push':
+            for chunk in chunk_args([plan.remote[rel][0] for rel in plan.extraneous]):
+                self.run_shell_cmd('rm -f ' + ' '.join(shlex.quote(p) for p in chunk), serial=serial)
+            self.listing_cache.invalidate(serial, remote_base, recursive=True)
+        else:
+            for rel in plan.extraneous:
+                try: os.remove(plan.local[rel][0])
+                except OSError as e: logging.warning(f"Could not delete {rel}: {e}")
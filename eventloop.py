@@ -0,0 +1,173 @@
+"""One asyncio event loop on a background thread that drives adb shells, commands and connections.
+
+The raw tar and append streams of transfers are the exception: they pump pipes
+on the transfer scheduler's threads, and a CancelEvent kills their process.
+
+Callers on plain threads (the Tk thread, transfer workers, the CLI) hand it
+coroutines and get an Operation back: a handle that can be waited on from any
+thread and cancelled, which raises CancelledError inside the coroutine so it
+can kill its process before the waiter wakes up. Short blocking work that has
+no asyncio form (file I/O, tarfile, SQLite) runs on a small bounded pool, so a
+burst of requests queues up instead of spawning a thread each. Transfer
+sessions block for as long as they run, so each gets a thread of its own
+instead of holding a pool worker that a folder refresh is waiting for.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Short blocking operations (listings, local deletes, index lookups) running at once; more wait their turn
+BLOCKING_WORKERS = 16
+
+_END = object()
+
+
+class CancelEvent(threading.Event):
+    """A threading.Event whose set() also runs callbacks.
+
+    Lets an Operation be cancelled the moment a cancel button is pressed,
+    without anyone polling is_set().
+    """
+    def __init__(self):
+        super().__init__()
+        self._callbacks_lock = threading.Lock()
+        self._callbacks = []
+
+    def add_callback(self, fn):
+        """Calls fn() on set(), right away if already set. Returns a function that removes it."""
+        with self._callbacks_lock:
+            if not self.is_set():
+                self._callbacks.append(fn)
+                return lambda: self._remove(fn)
+        fn()
+        return lambda: None
+
+    def _remove(self, fn):
+        with self._callbacks_lock:
+            if fn in self._callbacks:
+                self._callbacks.remove(fn)
+
+    def set(self):
+        with self._callbacks_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn()
+
+
+class Operation:
+    """A coroutine running on a BackgroundLoop, seen from other threads.
+
+    future is a concurrent.futures.Future that resolves once the coroutine has
+    returned, raised or finished unwinding from cancel(); a cancelled
+    operation's future raises concurrent.futures.CancelledError.
+    """
+    def __init__(self, loop, coro):
+        self._loop = loop
+        self._task = None
+        self.future = concurrent.futures.Future()
+        self.future.set_running_or_notify_cancel()
+        loop.call_soon_threadsafe(self._start, coro)
+
+    def _start(self, coro):
+        self._task = self._loop.create_task(coro)
+        self._task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        if task.cancelled():
+            self.future.set_exception(concurrent.futures.CancelledError())
+        elif task.exception() is not None:
+            self.future.set_exception(task.exception())
+        else:
+            self.future.set_result(task.result())
+
+    def cancel(self):
+        """Cancels the coroutine. Safe from any thread, and a no-op once it has finished."""
+        self._loop.call_soon_threadsafe(self._cancel)
+
+    def _cancel(self):
+        # _start was queued first, so the task exists by now
+        if not self._task.done():
+            self._task.cancel()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class BackgroundLoop:
+    """An asyncio event loop running forever on a daemon thread."""
+    def __init__(self, blocking_workers=BLOCKING_WORKERS):
+        self._loop = asyncio.new_event_loop()
+        self._blocking = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix='blocking')
+        self._thread = threading.Thread(target=self._loop.run_forever, name='adb-loop', daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedules coro on the loop and returns its Operation. Callable from any thread."""
+        return Operation(self._loop, coro)
+
+    def run(self, coro, cancel_event=None):
+        """Runs coro on the loop and blocks the calling thread until it is done.
+
+        Setting cancel_event (a CancelEvent) cancels the coroutine, in which case
+        concurrent.futures.CancelledError is raised once it has cleaned up.
+        Must not be called on the loop thread itself, which would deadlock.
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("Blocking call on the event loop thread")
+        operation = self.submit(coro)
+        remove = cancel_event.add_callback(operation.cancel) if cancel_event is not None else None
+        try:
+            return operation.result()
+        finally:
+            if remove:
+                remove()
+
+    async def run_blocking(self, fn, *args):
+        """Awaits fn(*args) run on the bounded pool of blocking workers."""
+        return await self._loop.run_in_executor(self._blocking, fn, *args)
+
+    async def run_thread(self, fn, *args):
+        """Awaits fn(*args) run on a new thread of its own, for work that blocks for minutes.
+
+        Cancelling the await doesn't stop fn; pass it a CancelEvent for that.
+        """
+        future = concurrent.futures.Future()
+
+        def target():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, name='session', daemon=True).start()
+        return await asyncio.wrap_future(future, loop=self._loop)
+
+    def iterate(self, agen):
+        """Iterates an async generator from a plain thread.
+
+        Each item costs one round trip to the loop and nothing is fetched before
+        it is asked for, so a slow consumer holds the producer back.
+        """
+        async def step():
+            try:
+                return await agen.__anext__()
+            except StopAsyncIteration:
+                return _END
+
+        try:
+            while True:
+                item = self.run(step())
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self.run(agen.aclose())
+
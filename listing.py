@@ -0,0 +1,196 @@
+"""Directory listings for both panes: the device command, a linear-time parser, and local folders.
+
+The device is asked for `stat -c` records instead of scraping `ls -l` columns:
+
+    <raw mode hex> <size> <mtime> ./<name>
+
+followed by two marker-delimited sections for symlinks (target mode, then
+`%N` with the link target). Names are taken verbatim up to the end of the
+line; a line that doesn't start a new record belongs to a name containing a
+newline. `parse_ls` remains as a fallback for devices without find/stat.
+Local folders are read with one os.scandir pass into the same FileEntry objects.
+"""
+import os
+import re
+import shlex
+import stat
+import time
+
+LINK_MODES_MARKER = "//DROIDPIPE_LINK_MODES//"
+LINK_TARGETS_MARKER = "//DROIDPIPE_LINK_TARGETS//"
+
+_RECORD = re.compile(r'([0-9a-fA-F]+) (\d+) (-?\d+) \./(.*)')
+_LINK_MODE = re.compile(r'([0-9a-fA-F]+) \./(.*)')
+_LS_DATE = re.compile(r' (\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}) ')
+
+_TYPE_BITS = {'d': stat.S_IFDIR, 'l': stat.S_IFLNK, 'c': stat.S_IFCHR, 'b': stat.S_IFBLK,
+              'p': stat.S_IFIFO, 's': stat.S_IFSOCK}
+
+
+class FileEntry:
+    """One directory entry with exact metadata, shared by both panes."""
+    __slots__ = ('name', 'size', 'mtime', 'mode', 'link_target', 'target_is_dir')
+
+    def __init__(self, name, size, mtime, mode, link_target=None, target_is_dir=False):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.mode = mode
+        self.link_target = link_target
+        self.target_is_dir = target_is_dir
+
+    @property
+    def is_link(self):
+        return stat.S_ISLNK(self.mode)
+
+    @property
+    def is_dir(self):
+        """True for folders and for symlinks pointing at one."""
+        return stat.S_ISDIR(self.mode) or (self.target_is_dir and self.is_link)
+
+    def _key(self):
+        return (self.name, self.size, self.mtime, self.mode, self.link_target, self.target_is_dir)
+
+    def __eq__(self, other):
+        return isinstance(other, FileEntry) and self._key() == other._key()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"FileEntry({self.name!r}, size={self.size}, mtime={self.mtime}, mode={oct(self.mode)})"
+
+
+def list_local_dir(path):
+    """Lists a local folder as FileEntry objects, folders first, like the Android pane.
+
+    Symlinks keep their own mode and tell what they point at through
+    link_target and target_is_dir; size and mtime are the target's, or the
+    link's own when it dangles. Raises OSError if the folder can't be read.
+    """
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if not entry.is_symlink():
+                    st = entry.stat()
+                    entries.append(FileEntry(entry.name, st.st_size, int(st.st_mtime), st.st_mode))
+                    continue
+                link = entry.stat(follow_symlinks=False)
+                try:
+                    st = entry.stat()
+                except OSError:
+                    st = link # Dangling symlink
+                entries.append(FileEntry(entry.name, st.st_size, int(st.st_mtime), link.st_mode,
+                                         os.readlink(entry.path), stat.S_ISDIR(st.st_mode)))
+            except OSError:
+                continue # Vanished, or unreadable
+    entries.sort(key=lambda e: (not e.is_dir, e.name.lower()))
+    return entries
+
+
+def list_command(path, show_hidden=False):
+    """Shell command that prints the machine-readable listing of path."""
+    hidden = "" if show_hidden else "! -name '.*' "
+    find = f"find . -mindepth 1 -maxdepth 1 {hidden}"
+    return (f"cd {shlex.quote(path)} && {find}-exec stat -c '%f %s %Y %n' {{}} + && "
+            f"echo '{LINK_MODES_MARKER}' && {find}-type l -exec stat -L -c '%f %n' {{}} + 2>/dev/null; "
+            f"echo '{LINK_TARGETS_MARKER}' && {find}-type l -exec stat -c '%N' {{}} +")
+
+
+def _strip_quotes(text):
+    if len(text) >= 2 and text[0] in "'`\"" and text[-1] in "'\"":
+        return text[1:-1]
+    return text
+
+
+def parse_listing(text):
+    """Parses the output of list_command into FileEntry objects in device order."""
+    entries = []
+    links = {}
+    section = 0
+    last = None
+    for line in text.split('\n'):
+        if line == LINK_MODES_MARKER:
+            section = 1
+            continue
+        if line == LINK_TARGETS_MARKER:
+            section = 2
+            continue
+
+        if section == 0:
+            m = _RECORD.fullmatch(line)
+            if m:
+                mode = int(m.group(1), 16)
+                last = FileEntry(m.group(4), int(m.group(2)), int(m.group(3)), mode)
+                entries.append(last)
+                if stat.S_ISLNK(mode):
+                    links[last.name] = last
+            elif last is not None:
+                # Continuation of a name containing a newline
+                if last.is_link:
+                    del links[last.name]
+                last.name += '\n' + line
+                if last.is_link:
+                    links[last.name] = last
+        elif section == 1:
+            m = _LINK_MODE.fullmatch(line)
+            if m and m.group(2) in links:
+                links[m.group(2)].target_is_dir = stat.S_ISDIR(int(m.group(1), 16))
+        elif line:
+            # '<q>./name<q> -> <q>target<q>': try each ' -> ' until the left side is a known link
+            quoted = line[0] in "'`\""
+            idx = line.find(' -> ')
+            while idx != -1:
+                name = line[1:idx - 1] if quoted else line[:idx]
+                entry = links.get(name[2:]) if name.startswith('./') else None
+                if entry is not None:
+                    entry.link_target = _strip_quotes(line[idx + 4:])
+                    break
+                idx = line.find(' -> ', idx + 1)
+    return entries
+
+
+def mode_from_perms(perms):
+    """Converts an `ls -l` permission string like 'drwxr-x---' into st_mode bits."""
+    mode = _TYPE_BITS.get(perms[0], stat.S_IFREG)
+    for i, bit in enumerate((stat.S_IRUSR, stat.S_IWUSR, stat.S_IXUSR, stat.S_IRGRP, stat.S_IWGRP,
+                             stat.S_IXGRP, stat.S_IROTH, stat.S_IWOTH, stat.S_IXOTH)):
+        if i + 1 < len(perms) and perms[i + 1] not in '-Tt':
+            mode |= bit
+    return mode
+
+
+def parse_ls(text):
+    """Fallback parser for toybox/toolbox `ls -l` output.
+
+    Anchors on the 'YYYY-MM-DD HH:MM' column, so names with spaces or dashes
+    survive, and splits symlinks on ' -> '.
+    """
+    entries = []
+    for line in text.splitlines():
+        if not line or line.startswith('total'):
+            continue
+        m = _LS_DATE.search(line)
+        if not m:
+            continue
+        head = line[:m.start()].split()
+        name = line[m.end():]
+        if not head or name in ('.', '..'):
+            continue
+        mode = mode_from_perms(head[0])
+        link_target = None
+        if stat.S_ISLNK(mode) and ' -> ' in name:
+            name, link_target = name.split(' -> ', 1)
+        if stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+            size = 0 # The column holds 'major, minor' instead
+        else:
+            try:
+                size = int(head[-1]) if len(head) > 1 else 0
+            except ValueError:
+                size = 0 # toolbox prints no size for folders
+        try:
+            mtime = int(time.mktime(time.strptime(f"{m.group(1)} {m.group(2)}", "%Y-%m-%d %H:%M")))
+        except (ValueError, OverflowError):
+            mtime = 0
+        entries.append(FileEntry(name, size, mtime, mode, link_target))
+    return entries
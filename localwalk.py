@@ -0,0 +1,211 @@
+"""Local trees for pushes: an os.scandir walker and a compact manifest of what it found.
+
+`os.walk` plus `os.path.getsize` stats every file at least twice and hands
+back nothing until the whole tree is read. walk_local yields files as
+scandir lists them, with one stat each (none for the type, which the
+directory entry already knows). LocalWalk runs it on a thread and hands the
+files over in batches through a bounded queue, so a push starts moving bytes
+while the rest of the tree is still being read, and the walk never runs more
+than a few batches ahead of the transfers. Everything found is kept in a
+FileManifest, which stores the paths once and the sizes and mtimes in typed
+arrays instead of a tuple, two strings, an int and a float per file.
+"""
+import logging
+import os
+import queue
+import stat
+import threading
+import time
+from array import array
+
+# A batch is handed over once it holds this many files...
+WALK_BATCH_FILES = 1024
+
+# ...or has been filling for this long, so the first files don't wait for a full batch
+WALK_BATCH_SECONDS = 0.25
+
+# Batches the walk may run ahead of the transfers
+WALK_QUEUE_BATCHES = 16
+
+_END = object()
+
+
+def walk_local(local_paths):
+    """Yields (abs_path, rel_path, size, mtime) for every file in or under local_paths.
+
+    rel_path starts with the selected item's own name: pushing /home/user/foo
+    lands in <remote dir>/foo/... Folders are walked depth first and their
+    files come out before their subfolders are read. Symlinked folders aren't
+    followed, like os.walk; unreadable ones are skipped with a warning.
+    """
+    for path in local_paths:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logging.warning(f"Skipping {path}: {e}")
+            continue
+        name = os.path.basename(os.path.normpath(path))
+        if stat.S_ISREG(st.st_mode):
+            yield path, name, st.st_size, st.st_mtime
+        elif stat.S_ISDIR(st.st_mode):
+            yield from _walk_dir(path, name)
+
+
+def _walk_dir(top, top_rel):
+    stack = [(top, top_rel)]
+    while stack:
+        dir_path, dir_rel = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    rel_path = dir_rel + os.sep + entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append((entry.path, rel_path))
+                        elif entry.is_file():
+                            st = entry.stat()
+                            yield entry.path, rel_path, st.st_size, st.st_mtime
+                    except OSError as e:
+                        logging.warning(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logging.warning(f"Skipping {dir_path}: {e}")
+        # Reversed, so subfolders come off the stack in listing order
+        stack.extend(reversed(subdirs))
+
+
+class FileManifest:
+    """Append-only list of files, read as (abs_path, rel_path, size) tuples.
+
+    That is the shape the transfer code takes, but the tuples are built on
+    access. rel_path is stored as an offset into abs_path, which always ends
+    with it, and sizes and mtimes live in typed arrays.
+    """
+    def __init__(self, rows=()):
+        self._paths = []
+        self._rel_starts = array('I')
+        self._sizes = array('q')
+        self._mtimes = array('d')
+        self.total_bytes = 0
+        for row in rows:
+            self.append(*row)
+
+    def append(self, abs_path, rel_path, size, mtime):
+        if not abs_path.endswith(rel_path):
+            raise ValueError(f"{rel_path} is not a tail of {abs_path}")
+        self._paths.append(abs_path)
+        self._rel_starts.append(len(abs_path) - len(rel_path))
+        self._sizes.append(size)
+        self._mtimes.append(mtime)
+        self.total_bytes += size
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __getitem__(self, i):
+        path = self._paths[i]
+        return path, path[self._rel_starts[i]:], self._sizes[i]
+
+    def __iter__(self):
+        for path, start, size in zip(self._paths, self._rel_starts, self._sizes):
+            yield path, path[start:], size
+
+    def rows(self):
+        """Yields (abs_path, rel_path, size, mtime), the journal's row format."""
+        for path, start, size, mtime in zip(self._paths, self._rel_starts, self._sizes, self._mtimes):
+            yield path, path[start:], size, mtime
+
+
+def local_files(local_paths):
+    """Walks local_paths completely and returns their files as a FileManifest."""
+    return FileManifest(walk_local(local_paths))
+
+
+class LocalWalk:
+    """walk_local on a thread of its own, handing files over in batches.
+
+    on_batch(rows) is called on the walk thread with each batch's (abs_path,
+    rel_path, size, mtime) rows before the batch is handed over. Everything
+    found so far is in manifest, so len() and total_bytes grow while the walk
+    goes on; finished tells whether it got to the end.
+    """
+    def __init__(self, local_paths, on_batch=None, batch_files=WALK_BATCH_FILES,
+                 queue_batches=WALK_QUEUE_BATCHES):
+        self.local_paths = list(local_paths)
+        self.on_batch = on_batch
+        self.batch_files = batch_files
+        self.manifest = FileManifest()
+        self.finished = False
+        self._queue = queue.Queue(maxsize=queue_batches)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='local-walk', daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self.manifest)
+
+    @property
+    def total_bytes(self):
+        return self.manifest.total_bytes
+
+    def _run(self):
+        batch, started = [], 0
+        try:
+            for row in walk_local(self.local_paths):
+                if self._stop.is_set():
+                    return
+                if not batch:
+                    started = time.monotonic()
+                self.manifest.append(*row)
+                batch.append(row)
+                if len(batch) >= self.batch_files or time.monotonic() - started >= WALK_BATCH_SECONDS:
+                    if not self._hand_over(batch):
+                        return
+                    batch = []
+            if batch and not self._hand_over(batch):
+                return
+            self.finished = True
+        except Exception as e:
+            logging.exception("Local walk failed")
+            self._error = e
+        finally:
+            self._put(_END)
+
+    def _hand_over(self, batch):
+        if self.on_batch:
+            self.on_batch(batch)
+        return self._put([(abs_path, rel_path, size) for abs_path, rel_path, size, _ in batch])
+
+    def _put(self, item):
+        # Waits for room in the queue, which is what holds the walk back
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def batches(self):
+        """Yields lists of (abs_path, rel_path, size) as the walk finds them.
+
+        Ends when the walk is done or stopped; raises what the walk raised.
+        """
+        while True:
+            batch = self._queue.get()
+            if batch is _END:
+                if self._error is not None:
+                    raise self._error
+                return
+            if self._stop.is_set():
+                return
+            yield batch
+
+    def stop(self):
+        """Stops the walk and ends batches(). Safe from any thread."""
+        self._stop.set()
+        try:
+            self._queue.put_nowait(_END)
+        except queue.Full:
+            pass # batches() isn't waiting then, and sees the stop after its next get()
@@ -1,20 +1,78 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, font
-import subprocess
 import os
+import shlex
 import shutil
 import threading
 import time
 import re
 import logging
-import select
 import argparse
+import asyncio
+import sqlite3
+from bisect import bisect_left
+from concurrent.futures import CancelledError
+
+from listing import list_local_dir
+from device_index import (DeviceIndex, INDEX_ROOT, index_path, full_scan_command, dir_scan_command,
+                          children_command, parse_records, parse_dir_scan)
+from engine import (TransferEngine, DEFAULT_TRANSFER_WORKERS, MANIFEST_TIMEOUT, STATE_DIR, chunk_args,
+                    remaining_bytes)
+from eventloop import CancelEvent
+from localwalk import LocalWalk, local_files
+
+# Treeview rows created beyond the visible window, and per after() chunk when growing
+VIEW_MARGIN_ROWS = 100
+VIEW_CHUNK_ROWS = 500
+
+# Device search shows at most this many hits per query
+SEARCH_RESULT_LIMIT = 1000
+
+# Worker threads' UI updates are applied at most once per frame of this length
+UI_FRAME_MS = 33
+
+
+class UiUpdateBus:
+    """The one bridge from worker and event loop threads to the Tk thread.
+
+    post() and call() may be called from any thread; they only queue work,
+    which the Tk thread picks up with an after() poll of its own, once per
+    frame. Posted updates are keyed (usually by the widget they redraw) and a
+    newer post replaces the pending one, so however many transfers report
+    progress, each key is updated at most once per frame. call() is for
+    results and one-off actions: every call runs once, in order, after the
+    frame's posted updates. Must be created on the Tk thread.
+    """
+    def __init__(self, root, frame_ms=UI_FRAME_MS):
+        self.root = root
+        self.frame_ms = frame_ms
+        self._lock = threading.Lock()
+        self._pending = {} # key -> (fn, args)
+        self._calls = [] # (fn, args)
+        self.root.after(self.frame_ms, self._drain)
+
+    def post(self, key, fn, *args):
+        with self._lock:
+            self._pending[key] = (fn, args)
+
+    def call(self, fn, *args):
+        with self._lock:
+            self._calls.append((fn, args))
+
+    def _drain(self):
+        # Rearmed first, so nothing a callback does can stop the poll
+        self.root.after(self.frame_ms, self._drain)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            calls, self._calls = self._calls, []
+        for fn, args in [*pending.values(), *calls]:
+            try:
+                fn(*args)
+            except tk.TclError:
+                pass # the widget was destroyed after the post
+            except Exception:
+                logging.exception("UI update failed")
 
-# Handle pty import for Windows/Linux compatibility
-try:
-    import pty
-except ImportError:
-    pty = None
 
 class TransferProgressWidget(tk.Frame):
     def __init__(self, parent, title, colors, fonts, cancel_cmd=None):
@@ -43,6 +101,11 @@ class TransferProgressWidget(tk.Frame):
         
         self.canvas = tk.Canvas(self, height=4, bg=colors['bg_dark'], highlightthickness=0)
         self.canvas.pack(fill=tk.X, padx=5, pady=(0, 5))
+        # Both rectangles are created once and only resized afterwards
+        self._bar_bg = self.canvas.create_rectangle(0, 0, 0, 0, fill=colors['bg_dark'], outline="")
+        self._bar_fill = self.canvas.create_rectangle(0, 0, 0, 0, fill=colors['accent'], outline="")
+        self._bar_size = None
+        self._texts = {}
         
         self.bind('<Configure>', self._on_resize)
         self.pct = 0
@@ -50,42 +113,460 @@ class TransferProgressWidget(tk.Frame):
     def _on_resize(self, event):
         self._update_bar()
 
+    def _set_text(self, label, text):
+        # Reconfiguring a label costs a relayout even when the text is the same
+        if self._texts.get(label) != text:
+            self._texts[label] = text
+            label.config(text=text)
+
     def update_stats(self, stats_text):
-        self.lbl_stats.config(text=stats_text)
+        self._set_text(self.lbl_stats, stats_text)
 
     def update_title(self, new_title):
-        self.lbl_title.config(text=new_title)
+        self._set_text(self.lbl_title, new_title)
 
     def update_progress(self, pct):
         self.pct = pct
-        self.lbl_percent.config(text=f"{int(pct)}%")
+        self._set_text(self.lbl_percent, f"{int(pct)}%")
         self._update_bar()
         
     def _update_bar(self):
-        # Draw progress bar on canvas
-        self.canvas.delete("all")
         w = self.canvas.winfo_width()
         h = self.canvas.winfo_height()
-        
-        # Background
-        self.canvas.create_rectangle(0, 0, w, h, fill=self.colors['bg_dark'], outline="")
-        
-        # Fill
         fill_w = int(w * (self.pct / 100))
-        if fill_w > 0:
-            self.canvas.create_rectangle(0, 0, fill_w, h, fill=self.colors['accent'], outline="")
+        if (w, h, fill_w) == self._bar_size:
+            return
+        self._bar_size = (w, h, fill_w)
+        self.canvas.coords(self._bar_bg, 0, 0, w, h)
+        self.canvas.coords(self._bar_fill, 0, 0, fill_w, h)
 
     def complete(self, success=True, msg=None):
         if success:
-            self.lbl_title.config(text="Transfer Complete", fg=self.colors['fg'])
+            self._set_text(self.lbl_title, msg or "Transfer Complete")
+            self.lbl_title.config(fg=self.colors['fg'])
             self.pct = 100
             self._update_bar()
         else:
-            self.lbl_title.config(text=f"Error: {msg}", fg="#ff5555")
+            self._set_text(self.lbl_title, f"Error: {msg}")
+            self.lbl_title.config(fg="#ff5555")
+
+
+# Primary sort key per Treeview column; ties keep name order
+SORT_KEYS = {
+    'Name': lambda e: e.name.lower(),
+    'Size': lambda e: -1 if e.is_dir else e.size,
+    'Type': lambda e: e.is_dir,
+}
+
+
+def _fuzzy_pattern(text):
+    """Regex matching names that contain the characters of text in order."""
+    return re.compile('.*?'.join(map(re.escape, text)), re.DOTALL)
+
+
+class FileListView:
+    """Virtualized model behind a pane's Treeview.
+
+    The full listing stays in a list of FileEntry objects. Rows are only created
+    from the top down to the visible window plus a margin; when the view scrolls
+    towards the last created row, more are inserted in after() chunks so the Tk
+    thread never blocks on a huge folder. Row iids are indices into the list.
+    """
+    def __init__(self, tree, format_row, row_height=28):
+        self.tree = tree
+        self.format_row = format_row
+        self.row_height = row_height
+        self.entries = []
+        self.order = [] # view position -> index into entries
+        self.materialized = 0 # rows currently in the Treeview (a prefix of order)
+        self.target = 0
+        self._pending = None
+        self._pending_selection = None # view positions to select once their rows exist
+        self._sorted = {} # column -> ascending order, computed once per listing
+        self.base_order = [] # sorted order before any filter is applied
+        self.filter_text = None # None when not filtering
+        self._filter_stack = [] # (text, substring matches, fuzzy matches) per narrowing step
+        self._lower = None # entries index -> lowercased name
+        self._index = None # (sorted lowercased names, entries indices) for prefix search
+        self._prefix_range = ('', 0, 0)
+        self._position = None # entries index -> view position, or None when filtered out
+        tree.configure(yscrollcommand=self._on_scroll)
+
+    def __len__(self):
+        return len(self.order)
+
+    def entry_for(self, iid):
+        return self.entries[int(iid)]
+
+    def selected_entries(self):
+        return [self.entry_for(iid) for iid in self.tree.selection()]
+
+    def visible_rows(self):
+        return max(self.tree.winfo_height() // self.row_height, 15)
+
+    def set_entries(self, entries, select_names=None):
+        """Replaces the listing. Rows named in select_names are selected again."""
+        self._cancel_pending()
+        self.entries = entries
+        self._sorted = {}
+        self._lower = self._index = None
+        self.filter_text = None
+        self._filter_stack = []
+        self.base_order = list(range(len(entries)))
+        self._rebuild(self.base_order)
+
+        if select_names:
+            positions = [pos for pos, idx in enumerate(self.order) if entries[idx].name in select_names]
+            if positions:
+                self.select_positions(positions)
+                return True
+        return False
+
+    def remove_names(self, names):
+        """Drops the entries named in names without a new listing.
+
+        Sort order, filter and scroll position stay as they are.
+        """
+        keep = [idx for idx, e in enumerate(self.entries) if e.name not in names]
+        if len(keep) == len(self.entries):
+            return
+        new_index = {old: new for new, old in enumerate(keep)}
+        yview = self.tree.yview()[0]
+        self.entries = [self.entries[idx] for idx in keep]
+        self._sorted = {col: [new_index[idx] for idx in order if idx in new_index]
+                        for col, order in self._sorted.items()}
+        self._lower = self._index = None
+        self.base_order = [new_index[idx] for idx in self.base_order if idx in new_index]
+        self._filter_stack = []
+        self._rebuild(self._filter(self.filter_text.lower()) if self.filter_text else self.base_order)
+        self.tree.yview_moveto(yview)
+
+    def sort(self, col, reverse=False):
+        """Reorders the view by a column using typed, cached keys; keeps the selection."""
+        order = self._sorted_order(col)
+        selected = [int(iid) for iid in self.tree.selection()]
+        self.base_order = order[::-1] if reverse else list(order)
+        if self.filter_text:
+            # Filter results are kept in view order, so redo them on the new base
+            self._filter_stack = []
+            self._rebuild(self._filter(self.filter_text.lower()))
+        else:
+            self._rebuild(self.base_order)
+        if selected:
+            position = self._positions()
+            self.select_positions(sorted(position[idx] for idx in selected))
+
+    def find_prefix(self, prefix):
+        """Returns the first view position whose name starts with prefix, or None.
+
+        Names are kept sorted once per listing, so each lookup is a bisect; a
+        prefix that extends the previous one only searches the previous range.
+        """
+        if self._index is None:
+            order = self._sorted_order('Name')
+            lower = self._lower_names()
+            self._index = ([lower[idx] for idx in order], order)
+            self._prefix_range = ('', 0, len(order))
+        names, indices = self._index
+        last, lo, hi = self._prefix_range
+        if not prefix.startswith(last):
+            lo, hi = 0, len(names)
+        lo = bisect_left(names, prefix, lo, hi)
+        hi = bisect_left(names, prefix + '\U0010ffff', lo, hi)
+        self._prefix_range = (prefix, lo, hi)
+
+        position = self._positions()
+        visible = [position[idx] for idx in indices[lo:hi] if position[idx] is not None]
+        return min(visible) if visible else None
+
+    def start_filter(self):
+        self.filter_text = ''
+        self._filter_stack = []
+
+    def set_filter(self, text):
+        """Shows rows whose name contains text, then rows that only match fuzzily.
+
+        Returns the number of matching rows.
+        """
+        self.filter_text = text
+        self._rebuild(self._filter(text.lower()) if text else self.base_order)
+        return len(self.order)
+
+    def clear_filter(self):
+        self.filter_text = None
+        self._filter_stack = []
+        self._rebuild(self.base_order)
+
+    def _filter(self, text):
+        # Matches for text are a subset of the matches for any prefix of it, so
+        # each keystroke narrows the previous result; backspace pops back to it
+        stack = self._filter_stack
+        while stack and not text.startswith(stack[-1][0]):
+            stack.pop()
+        if stack and stack[-1][0] == text:
+            return stack[-1][1] + stack[-1][2]
+        if stack:
+            _, prev_sub, prev_fuzzy = stack[-1]
+        else:
+            prev_sub, prev_fuzzy = self.base_order, []
+
+        lower = self._lower_names()
+        fuzzy_match = _fuzzy_pattern(text).search
+        sub = [idx for idx in prev_sub if text in lower[idx]]
+        if len(text) > 1:
+            matched = set(sub)
+            fuzzy = [idx for idx in prev_sub if idx not in matched and fuzzy_match(lower[idx])]
+        else:
+            fuzzy = [] # a single character is a substring or nothing
+        if fuzzy and prev_fuzzy:
+            fuzzy += [idx for idx in prev_fuzzy if fuzzy_match(lower[idx])]
+            base_pos = [0] * len(self.entries)
+            for pos, idx in enumerate(self.base_order):
+                base_pos[idx] = pos
+            fuzzy.sort(key=base_pos.__getitem__)
+        else:
+            fuzzy += [idx for idx in prev_fuzzy if fuzzy_match(lower[idx])]
+        stack.append((text, sub, fuzzy))
+        return sub + fuzzy
+
+    def _lower_names(self):
+        if self._lower is None:
+            self._lower = [e.name.lower() for e in self.entries]
+        return self._lower
+
+    def _positions(self):
+        if self._position is None:
+            position = [None] * len(self.entries)
+            for pos, idx in enumerate(self.order):
+                position[idx] = pos
+            self._position = position
+        return self._position
+
+    def _sorted_order(self, col):
+        order = self._sorted.get(col)
+        if order is None:
+            if col == 'Name':
+                keys = [SORT_KEYS['Name'](e) for e in self.entries]
+                order = sorted(range(len(self.entries)), key=keys.__getitem__)
+            else:
+                # Stable sort on top of the name order breaks ties by name
+                keys = [SORT_KEYS[col](e) for e in self.entries]
+                order = sorted(self._sorted_order('Name'), key=keys.__getitem__)
+            self._sorted[col] = order
+        return order
+
+    def _rebuild(self, order):
+        """Drops every row in one call and recreates the top window in the new order."""
+        self._cancel_pending()
+        self.order = order
+        self._position = None
+        self.materialized = self.target = 0
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self.materialize_to(self.visible_rows() + VIEW_MARGIN_ROWS)
+
+    def select_positions(self, positions):
+        """Selects the rows at ascending view positions and scrolls to the first.
+
+        Rows within a chunk of the created ones are made right away; a jump
+        further down grows the view in after() chunks and selects once they
+        get there, so a far jump never inserts the whole prefix in one go.
+        """
+        self._pending_selection = None
+        count = positions[-1] + 1
+        if count <= self.materialized + VIEW_CHUNK_ROWS:
+            self.materialize_to(min(count + VIEW_MARGIN_ROWS, self.materialized + VIEW_CHUNK_ROWS))
+            self._apply_selection(positions)
+        else:
+            self._pending_selection = positions
+            self._grow(count + VIEW_MARGIN_ROWS)
+
+    def _apply_selection(self, positions):
+        iids = [str(self.order[pos]) for pos in positions]
+        self.tree.selection_set(iids)
+        self.tree.focus(iids[0])
+        self.tree.see(iids[0])
+
+    def materialize_to(self, count):
+        """Synchronously creates the first count rows."""
+        count = min(count, len(self.order))
+        insert = self.tree.insert
+        entries, order, fmt = self.entries, self.order, self.format_row
+        for pos in range(self.materialized, count):
+            idx = order[pos]
+            insert('', 'end', iid=str(idx), values=fmt(entries[idx]))
+        self.materialized = max(self.materialized, count)
+
+    def _grow(self, count):
+        self.target = min(max(self.target, count), len(self.order))
+        if self._pending is None and self.materialized < self.target:
+            self._pending = self.tree.after(0, self._materialize_chunk)
+
+    def _materialize_chunk(self):
+        self._pending = None
+        self.materialize_to(min(self.materialized + VIEW_CHUNK_ROWS, self.target))
+        positions = self._pending_selection
+        if positions is not None and self.materialized > positions[-1]:
+            self._pending_selection = None
+            self._apply_selection(positions)
+        if self.materialized < self.target:
+            self._pending = self.tree.after(1, self._materialize_chunk)
+
+    def _cancel_pending(self):
+        self._pending_selection = None
+        if self._pending is not None:
+            self.tree.after_cancel(self._pending)
+            self._pending = None
+
+    def _on_scroll(self, first, last):
+        # Getting close to the last created row: extend by another window
+        if self.materialized < len(self.order) and float(last) > 0.8:
+            self._grow(self.materialized + self.visible_rows() + VIEW_MARGIN_ROWS)
+
+
+class SyncDialog(tk.Toplevel):
+    def __init__(self, parent, colors, fonts, run_cmd):
+        super().__init__(parent, bg=colors['bg'])
+        self.title("Sync")
+        self.geometry("640x480")
+        self.run_cmd = run_cmd
+
+        self.direction = tk.StringVar(value='push')
+        self.delete_extraneous = tk.BooleanVar(value=False)
+        self.use_hash = tk.BooleanVar(value=False)
+
+        options = tk.Frame(self, bg=colors['bg'])
+        options.pack(fill=tk.X, padx=10, pady=10)
+        opt_style = dict(font=fonts['default'], fg=colors['fg'], bg=colors['bg'],
+                         selectcolor=colors['bg_dark'], activebackground=colors['bg'],
+                         activeforeground=colors['fg'])
+        for text, value in (("Local -> Device", 'push'), ("Device -> Local", 'pull')):
+            tk.Radiobutton(options, text=text, value=value, variable=self.direction, **opt_style).pack(side=tk.LEFT)
+        tk.Checkbutton(options, text="Delete extraneous", variable=self.delete_extraneous, **opt_style).pack(side=tk.LEFT, padx=(15, 0))
+        tk.Checkbutton(options, text="Compare by hash", variable=self.use_hash, **opt_style).pack(side=tk.LEFT)
+
+        buttons = tk.Frame(self, bg=colors['bg'])
+        buttons.pack(fill=tk.X, padx=10)
+        for text, dry_run in (("Dry Run", True), ("Sync", False)):
+            tk.Button(buttons, text=text, font=fonts['bold'], bg=colors['accent'], fg='white',
+                      activebackground=colors['accent_hover'], activeforeground='white',
+                      relief='flat', bd=0, padx=15, pady=6, cursor='hand2',
+                      command=lambda d=dry_run: self._run(d)).pack(side=tk.LEFT, padx=(0, 10))
+
+        self.txt_report = tk.Text(self, font=fonts['small'], fg=colors['fg'], bg=colors['bg_dark'],
+                                  relief='flat', highlightthickness=0, wrap='none')
+        self.txt_report.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+    def _run(self, dry_run):
+        self.run_cmd(self, self.direction.get(), self.delete_extraneous.get(), self.use_hash.get(), dry_run)
+
+    def show_report(self, text):
+        if not self.winfo_exists(): return
+        self.txt_report.delete('1.0', tk.END)
+        self.txt_report.insert('1.0', text)
+
+
+class DeviceSearchDialog(tk.Toplevel):
+    def __init__(self, parent, colors, fonts, serial, search_cmd, index_cmd, open_cmd):
+        super().__init__(parent, bg=colors['bg'])
+        self.title(f"Search Device {serial}" if serial else "Search Device")
+        self.geometry("860x540")
+        self.serial = serial # the device whose index this dialog searches
+        self.search_cmd = search_cmd
+        self.index_cmd = index_cmd
+        self.open_cmd = open_cmd
+        self.paths = []
+        self.pending_search = None # token of the latest search; older results are dropped
+
+        fields = tk.Frame(self, bg=colors['bg'])
+        fields.pack(fill=tk.X, padx=10, pady=10)
+        self.vars = {}
+        for key, label, width in (('name', "Name", 24), ('exts', "Extensions", 12), ('min_mb', "Min MB", 7),
+                                  ('max_mb', "Max MB", 7), ('days', "Modified within days", 5)):
+            tk.Label(fields, text=label, font=fonts['default'], fg=colors['fg'], bg=colors['bg']).pack(side=tk.LEFT, padx=(0, 4))
+            var = tk.StringVar()
+            entry = tk.Entry(fields, textvariable=var, width=width, font=fonts['default'], fg=colors['fg'],
+                             bg=colors['bg_dark'], insertbackground=colors['fg'], relief='flat')
+            entry.pack(side=tk.LEFT, padx=(0, 10))
+            entry.bind("<Return>", lambda e: self._search())
+            self.vars[key] = var
+            if key == 'name':
+                entry.focus_set()
+
+        buttons = tk.Frame(self, bg=colors['bg'])
+        buttons.pack(fill=tk.X, padx=10)
+        for text, command in (("Search", self._search), ("Update Index", lambda: self.index_cmd(self, False)),
+                              ("Rebuild Index", lambda: self.index_cmd(self, True))):
+            tk.Button(buttons, text=text, font=fonts['bold'], bg=colors['accent'], fg='white',
+                      activebackground=colors['accent_hover'], activeforeground='white',
+                      relief='flat', bd=0, padx=15, pady=6, cursor='hand2',
+                      command=command).pack(side=tk.LEFT, padx=(0, 10))
+
+        self.lbl_status = tk.Label(self, text="", font=fonts['small'], fg='#808080', bg=colors['bg'], anchor='w')
+        self.lbl_status.pack(fill=tk.X, padx=10, pady=(10, 0))
+
+        results = tk.Frame(self, bg=colors['bg_dark'])
+        results.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.tree_results = ttk.Treeview(results, columns=('Path', 'Size', 'Modified'), show='headings',
+                                         selectmode='browse')
+        for col, width, stretch in (('Path', 540, True), ('Size', 100, False), ('Modified', 140, False)):
+            self.tree_results.heading(col, text=col, anchor='w')
+            self.tree_results.column(col, width=width, stretch=stretch, anchor='w')
+        scrollbar = ttk.Scrollbar(results, orient=tk.VERTICAL, command=self.tree_results.yview)
+        self.tree_results.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree_results.pack(fill=tk.BOTH, expand=True)
+        self.tree_results.bind("<Double-1>", self._open)
+        self.tree_results.bind("<Return>", self._open)
+
+    def _query(self):
+        """Turns the form into DeviceIndex.search arguments. Raises ValueError on bad numbers."""
+        values = {key: var.get().strip() for key, var in self.vars.items()}
+        query = {}
+        if values['name']:
+            query['name'] = values['name']
+        if values['exts']:
+            query['exts'] = [e for e in re.split(r'[\s,;]+', values['exts']) if e]
+        if values['min_mb']:
+            query['min_size'] = int(float(values['min_mb']) * 1024 * 1024)
+        if values['max_mb']:
+            query['max_size'] = int(float(values['max_mb']) * 1024 * 1024)
+        if values['days']:
+            query['newer_than'] = int(time.time() - float(values['days']) * 86400)
+        return query
+
+    def _search(self):
+        try:
+            query = self._query()
+        except ValueError:
+            self.show_status("Sizes and days must be numbers")
+            return
+        self.search_cmd(self, query)
+
+    def _open(self, event=None):
+        sel = self.tree_results.selection()
+        if sel:
+            self.open_cmd(self, self.paths[int(sel[0])])
+
+    def show_status(self, text):
+        if not self.winfo_exists(): return
+        self.lbl_status.config(text=text)
+
+    def show_results(self, paths, rows, status):
+        """paths are the full device paths behind rows of (path, size, modified) display values."""
+        if not self.winfo_exists(): return
+        self.paths = paths
+        children = self.tree_results.get_children()
+        if children:
+            self.tree_results.delete(*children)
+        for i, values in enumerate(rows):
+            self.tree_results.insert('', 'end', iid=str(i), values=values)
+        self.show_status(status)
 
 
 class DroidPipe:
-    def __init__(self, root):
+    def __init__(self, root, transfer_workers=DEFAULT_TRANSFER_WORKERS):
         self.root = root
         self.root.title("DroidPipe - ADB File Manager")
         self.root.geometry("1200x800")
@@ -113,8 +594,18 @@ class DroidPipe:
         # State
         self.local_cwd = os.path.expanduser("~")
         self.android_cwd = "/storage/emulated/0/"
-        self.connected_device = None
+        self.connected_device = None # device shown in the Android pane
+        self.devices = [] # serials of every attached device
+        self.device_cwds = {} # serial -> Android pane folder while another device is shown
+        self.verify_transfers = tk.BooleanVar(value=False)
+        self.compress_pulls = tk.BooleanVar(value=False)
         self.active_pane = "local" # Tracks which pane was last active
+        self.engine = TransferEngine(transfer_workers)
+        self.ui_bus = UiUpdateBus(self.root)
+        self.device_indexes = {} # serial -> DeviceIndex
+        self._indexing = set() # serials with an index update running
+        self._device_check = None # Operation of the running `adb devices`
+        self._delete_queue = asyncio.Lock() # deletes run one at a time, in the order asked for
         
         # Search State
         self.search_buffer = ""
@@ -223,7 +714,7 @@ class DroidPipe:
         nav_buttons = [
             ("Home", lambda: self.go_home_local() if pane_type == "local" else self.go_home_android()),
             ("Up", lambda: self.go_up_local() if pane_type == "local" else self.go_up_android()),
-            ("Refresh", lambda: self.refresh_local() if pane_type == "local" else self.refresh_android()),
+            ("Refresh", lambda: self.refresh_local() if pane_type == "local" else self.refresh_android(force=True)),
             ("Delete", lambda: self.delete_selection(target=pane_type))
         ]
         
@@ -231,6 +722,14 @@ class DroidPipe:
             style = 'danger_small' if text == "Delete" else 'small'
             btn = self._create_button(btn_frame, text, cmd, style=style)
             btn.pack(side=tk.LEFT, padx=2)
+
+        if pane_type == "android":
+            # Device switcher; every device keeps its own folder, shell and transfer queue
+            self.cmb_device = ttk.Combobox(btn_frame, state='readonly', width=22, font=self.fonts['small'])
+            self.cmb_device.pack(side=tk.RIGHT, padx=2)
+            self.cmb_device.bind("<<ComboboxSelected>>", lambda e: self.select_device(self.cmb_device.get()))
+            tk.Label(btn_frame, text="Device:", font=self.fonts['small'], fg=self.colors['fg'],
+                     bg=self.colors['bg_light']).pack(side=tk.RIGHT, padx=(10, 2))
         
         # Disk Info Footer
         disk_label = tk.Label(frame, text="Checking disk space...", 
@@ -256,24 +755,28 @@ class DroidPipe:
         
         if pane_type == "local":
             self.tree_local = tree
+            self.view_local = FileListView(tree, self._local_row)
             tree.bind("<Double-1>", self.on_local_interact)
             tree.bind("<Return>", self.on_local_interact)
-            tree.bind("<Escape>", lambda e: self.go_up_local())
+            tree.bind("<Escape>", lambda e: self.on_escape(tree, self.go_up_local))
             tree.bind("<Right>", lambda e: self.tree_android.focus_set())
             tree.bind("<Shift-Right>", self.request_push_confirm)
             tree.bind("<FocusIn>", lambda e: setattr(self, 'active_pane', 'local'))
             tree.bind("<Delete>", lambda e: self.delete_selection(target='local'))
             tree.bind("<Key>", search_callback) 
+            tree.bind("<Control-f>", lambda e: self.start_filter(tree))
         else:
             self.tree_android = tree
+            self.view_android = FileListView(tree, self._android_row)
             tree.bind("<Double-1>", self.on_android_interact)
             tree.bind("<Return>", self.on_android_interact)
-            tree.bind("<Escape>", lambda e: self.go_up_android())
+            tree.bind("<Escape>", lambda e: self.on_escape(tree, self.go_up_android))
             tree.bind("<Left>", lambda e: self.tree_local.focus_set())
             tree.bind("<Shift-Left>", self.request_pull_confirm)
             tree.bind("<FocusIn>", lambda e: setattr(self, 'active_pane', 'android'))
             tree.bind("<Delete>", lambda e: self.delete_selection(target='android'))
             tree.bind("<Key>", search_callback)
+            tree.bind("<Control-f>", lambda e: self.start_filter(tree))
         
         return frame
 
@@ -415,15 +918,53 @@ class DroidPipe:
                                        self.push_file,
                                        style='action')
         btn_push.pack(side=tk.LEFT, padx=10)
+
+        btn_push_all = self._create_button(btn_container,
+                                           "Push to All",
+                                           self.push_to_all_devices,
+                                           style='normal')
+        btn_push_all.pack(side=tk.LEFT, padx=10)
+
+        opt_style = dict(font=self.fonts['default'], fg=self.colors['fg'], bg=self.colors['bg_light'],
+                         selectcolor=self.colors['bg_dark'], activebackground=self.colors['bg_light'],
+                         activeforeground=self.colors['fg'])
+        tk.Checkbutton(btn_container, text="Verify", variable=self.verify_transfers,
+                       **opt_style).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Checkbutton(btn_container, text="Compress", variable=self.compress_pulls,
+                       **opt_style).pack(side=tk.LEFT, padx=(0, 10))
+
+        btn_resume = self._create_button(btn_container,
+                                         "Resume",
+                                         self.resume_transfer,
+                                         style='normal')
+        btn_resume.pack(side=tk.LEFT, padx=10)
+
+        btn_sync = self._create_button(btn_container,
+                                       "Sync...",
+                                       self.open_sync_dialog,
+                                       style='normal')
+        btn_sync.pack(side=tk.LEFT, padx=10)
+
+        btn_search = self._create_button(btn_container,
+                                         "Search Device...",
+                                         self.open_search_dialog,
+                                         style='normal')
+        btn_search.pack(side=tk.LEFT, padx=10)
         
         tip_label = tk.Label(frame, 
-                            text="Tip: Type to search, Click headers to sort, Shift+Click for multiple selection",
+                            text="Tip: Type to search, Ctrl+F to filter, Click headers to sort, Shift+Click for multiple selection",
                             font=self.fonts['small'],
                             fg='#808080',
                             bg=self.colors['bg_light'])
         tip_label.pack(pady=(0, 10))
 
     # --- UTILS & SEARCH ---
+    def _view_for(self, tree):
+        return self.view_local if tree is self.tree_local else self.view_android
+
+    def _selected_names(self, tree):
+        return [e.name for e in self._view_for(tree).selected_entries()]
+
     def select_first_item(self, tree):
         children = tree.get_children()
         if children:
@@ -433,26 +974,7 @@ class DroidPipe:
             tree.see(first)
 
     def sort_column(self, tree, col, reverse):
-        l = [(tree.set(k, col), k) for k in tree.get_children('')]
-        
-        # Helper for natural sort (File vs Folder logic handled mostly by refresh, 
-        # but this does alphanumeric sort)
-        try:
-            # Try to sort by size as number if possible
-            if col == 'Size':
-                def size_val(x):
-                    s = x[0].lower().replace('kb', '').replace('mb', '').replace('gb', '').strip()
-                    if s == '?' or s == '': return -1
-                    return float(s)
-                l.sort(key=size_val, reverse=reverse)
-            else:
-                l.sort(key=lambda t: t[0].lower(), reverse=reverse)
-        except:
-            l.sort(reverse=reverse)
-
-        for index, (val, k) in enumerate(l):
-            tree.move(k, '', index)
-
+        self._view_for(tree).sort(col, reverse)
         tree.heading(col, command=lambda: self.sort_column(tree, col, not reverse))
 
     def on_key_search(self, event, tree):
@@ -464,17 +986,54 @@ class DroidPipe:
             self.search_buffer = ""
         self.search_last_time = now
         
+        view = self._view_for(tree)
+        if view.filter_text is not None:
+            if event.keysym == 'BackSpace':
+                text = view.filter_text[:-1]
+            elif event.char and event.char.isprintable():
+                text = view.filter_text + event.char
+            else:
+                return
+            count = view.set_filter(text)
+            self._show_filter(tree, f"{count} matches")
+            self.select_first_item(tree)
+            return "break"
+
         if event.char and event.char.isprintable():
             self.search_buffer += event.char.lower()
             
-            # Find matching item
-            for child in tree.get_children():
-                name = tree.item(child)['values'][0].lower()
-                if name.startswith(self.search_buffer):
-                    tree.selection_set(child)
-                    tree.see(child)
-                    tree.focus(child)
-                    return
+            # Bisect the listing's name index, not the (partial) Tk rows
+            pos = view.find_prefix(self.search_buffer)
+            if pos is not None:
+                view.select_positions([pos])
+
+    def start_filter(self, tree):
+        view = self._view_for(tree)
+        if view.filter_text is None:
+            view.start_filter()
+        self._show_filter(tree, "type to narrow, Esc to clear")
+        return "break"
+
+    def on_escape(self, tree, go_up):
+        """Esc clears an active filter first and only then goes up a folder."""
+        view = self._view_for(tree)
+        if view.filter_text is None:
+            go_up()
+            return
+        view.clear_filter()
+        if tree is self.tree_local:
+            self.lbl_local_path.config(text=self.local_cwd)
+        else:
+            self.lbl_android_path.config(text=self.android_cwd)
+        self.select_first_item(tree)
+
+    def _show_filter(self, tree, note):
+        view = self._view_for(tree)
+        if tree is self.tree_local:
+            label, cwd = self.lbl_local_path, self.local_cwd
+        else:
+            label, cwd = self.lbl_android_path, self.android_cwd
+        label.config(text=f"{cwd}   [filter: {view.filter_text}_  {note}]")
 
     def set_loading(self, is_loading):
         # Deprecated: The old usage was for main progress bar.
@@ -504,149 +1063,127 @@ class DroidPipe:
         if size_bytes > 1024: return f"{size_bytes/1024:.2f} KB"
         return f"{size_bytes} B"
 
-    def _get_recursive_files(self, local_paths):
-        """Returns list of (abs_path, relative_path, size) tuples"""
-        files_to_transfer = []
-        for path in local_paths:
-            if os.path.isfile(path):
-                files_to_transfer.append((path, os.path.basename(path), os.path.getsize(path)))
-            elif os.path.isdir(path):
-                base_name = os.path.basename(path)
-                for root, dirs, files in os.walk(path):
-                    for f in files:
-                        abs_path = os.path.join(root, f)
-                        # Relative path from the parent of the selected directory
-                        # If we select /a/b, and file is /a/b/c/d.txt, we want c/d.txt relative to b?
-                        # No, if we push folder 'foo', it should end up as '.../foo' on device.
-                        # So relative path should include 'foo'.
-                        # If path is /home/user/foo, and file is /home/user/foo/bar.txt
-                        # We want the destination to be <android_cwd>/foo/bar.txt
-                        # So relative from os.path.dirname(path)
-                        rel_path = os.path.relpath(abs_path, os.path.dirname(path))
-                        files_to_transfer.append((abs_path, rel_path, os.path.getsize(abs_path)))
-        return files_to_transfer
-
-    def run_adb_cmd(self, cmd_list):
-        logging.debug(f"Running ADB command: {' '.join(cmd_list)}")
-        try:
-            full_cmd = ['adb'] + cmd_list
-            result = subprocess.run(full_cmd, capture_output=True, text=True,
-                                  encoding='utf-8', errors='replace')
-            return result.stdout.strip(), result.stderr.strip()
-        except FileNotFoundError:
-            logging.error("ADB executable not found in PATH.")
-            return None, "ADB executable not found in PATH."
-
-    def run_adb_transfer(self, cmd_list, progress_callback, cancel_event=None):
-        # Linux Support (pty)
-        if pty is None: 
-            out, err = self.run_adb_cmd(cmd_list)
-            progress_callback(100)
-            return out, 0
-
-        master_fd, slave_fd = pty.openpty()
-        try:
-            full_cmd = ['adb'] + cmd_list
-            process = subprocess.Popen(full_cmd, stdout=slave_fd, stderr=slave_fd, close_fds=True)
-            os.close(slave_fd)
-            output_buffer = b""
-            while True:
-                if cancel_event and cancel_event.is_set():
-                    process.terminate()
-                    return "Cancelled", -2
-                
-                r, w, e = select.select([master_fd], [], [], 0.1)
-                if master_fd in r:
-                    try:
-                        chunk = os.read(master_fd, 1024)
-                        if not chunk: break
-                        output_buffer += chunk
-                        output_buffer = output_buffer[-1024:]
-                        try:
-                            current_str = output_buffer.decode('utf-8', errors='ignore')
-                            matches = list(re.finditer(r'(\d+)%', current_str))
-                            if matches:
-                                p = int(matches[-1].group(1))
-                                if progress_callback:
-                                    self.root.after(0, lambda val=p: progress_callback(val))
-                        except: pass
-                    except OSError: break
-                elif process.poll() is not None: break
-            process.wait()
-            return "Transfer finished", process.returncode
-        except Exception as e:
-            if 'slave_fd' in locals(): os.close(slave_fd)
-            if 'master_fd' in locals(): os.close(master_fd)
-            return str(e), -1
-        finally:
-            if 'master_fd' in locals():
-                try: os.close(master_fd)
-                except: pass
+    def _spawn(self, work, on_done=None, session=False):
+        """Runs work on the engine's event loop and returns its Operation.
+
+        work is a coroutine, or a blocking callable for the loop's bounded worker
+        pool; with session, a long one (a transfer or sync) that gets a thread of
+        its own so it can't starve refreshes and deletes of pool workers.
+        on_done(result) runs on the Tk thread, unless the operation was
+        cancelled or failed (failures are logged).
+        """
+        if not asyncio.iscoroutine(work):
+            work = (self.engine.loop.run_thread if session else self.engine.loop.run_blocking)(work)
+        operation = self.engine.loop.submit(work)
+
+        def finished(future):
+            if future.exception() is not None:
+                if not isinstance(future.exception(), CancelledError):
+                    logging.error("Background operation failed", exc_info=future.exception())
+            elif on_done is not None:
+                self.ui_bus.call(on_done, future.result())
+        operation.future.add_done_callback(finished)
+        return operation
 
     def _check_connection(self):
-        def check():
+        if self._device_check is not None and not self._device_check.done():
+            return # adb is still answering the previous check
+
+        async def check():
             logging.info("Checking ADB connection...")
-            self._loading = True
-            self.root.after(0, lambda: self.set_loading(True))
-            out, err = self.run_adb_cmd(['devices'])
-            self._loading = False
-            self.root.after(0, lambda: self.set_loading(False))
+            return await self.engine.list_devices_async()
 
+        def apply(result):
+            serials, err = result
             if err and "not found" in err:
                 self.update_status("Error: ADB not found", self.colors['error'])
-                self.root.after(0, lambda: self.update_status_indicator(self.colors['error']))
+                self.update_status_indicator(self.colors['error'])
                 return
 
-            if not out:
+            if serials is None:
                 self.connected_device = None
                 self.update_status("ADB Error: No output", self.colors['error'])
-                self.root.after(0, lambda: self.update_status_indicator(self.colors['error']))
+                self.update_status_indicator(self.colors['error'])
                 return
 
-            lines = out.split('\n')[1:]
-            devices = [line for line in lines if line.strip() and 'device' in line]
-            if devices:
-                self.connected_device = devices[0].split()[0]
-                self.update_status(f"Connected: {self.connected_device}", self.colors['success'])
-                self.root.after(0, lambda: self.update_status_indicator(self.colors['success']))
-                self.root.after(0, self.refresh_android)
-                self.root.after(0, self.refresh_local)
-            else:
-                self.connected_device = None
-                self.update_status("No device found", self.colors['warning'])
-                self.root.after(0, lambda: self.update_status_indicator(self.colors['warning']))
-                for item in self.tree_android.get_children():
-                    self.tree_android.delete(item)
-        threading.Thread(target=check, daemon=True).start()
+            self._set_devices(serials)
+        self._device_check = self._spawn(check(), apply)
+
+    def _set_devices(self, serials):
+        """Fills the device switcher. The shown device stays selected while it is attached."""
+        self.devices = serials
+        self.cmb_device.config(values=serials)
+        if not serials:
+            self.connected_device = None
+            self.cmb_device.set('')
+            self.update_status("No device found", self.colors['warning'])
+            self.update_status_indicator(self.colors['warning'])
+            self.view_android.set_entries([])
+            return
+
+        self.update_status_indicator(self.colors['success'])
+        if self.connected_device in serials:
+            self._show_connected()
+            self.refresh_android()
+        else:
+            self.select_device(serials[0])
+        self.refresh_local()
+
+    def select_device(self, serial):
+        """Shows serial in the Android pane; transfers on other devices keep running."""
+        if serial == self.connected_device:
+            return
+        if self.connected_device:
+            self.device_cwds[self.connected_device] = self.android_cwd
+        self.connected_device = serial
+        self.android_cwd = self.device_cwds.get(serial, "/storage/emulated/0/")
+        self.cmb_device.set(serial)
+        self._show_connected()
+        # Don't leave the previous device's files up while the listing loads
+        self.view_android.set_entries([])
+        self.lbl_android_disk.config(text="")
+        self.refresh_android()
+
+    def _show_connected(self):
+        others = len(self.devices) - 1
+        suffix = f" (+{others} more attached)" if others > 0 else ""
+        self.update_status(f"Connected: {self.connected_device}{suffix}", self.colors['success'])
 
     def refresh_local(self):
-        self.lbl_local_path.config(text=self.local_cwd)
-        for item in self.tree_local.get_children():
-            self.tree_local.delete(item)
-        try:
-            items = os.listdir(self.local_cwd)
-            items.sort(key=lambda x: (not os.path.isdir(os.path.join(self.local_cwd, x)), x.lower()))
-            for item in items:
-                path = os.path.join(self.local_cwd, item)
-                if os.path.isdir(path):
-                    self.tree_local.insert('', 'end', values=(item, "", "Folder"))
-                else:
-                    try: size = f"{os.path.getsize(path) / 1024:.1f} KB"
-                    except: size = "?"
-                    self.tree_local.insert('', 'end', values=(item, size, "File"))
-            self.select_first_item(self.tree_local)
-            
-            # Disk Usage
+        path = self.local_cwd
+        self.lbl_local_path.config(text=path)
+
+        # Slow disks and network homes can take seconds, so the folder is read off the Tk thread
+        def fetch():
+            try:
+                entries = list_local_dir(path)
+            except OSError as e:
+                return None, None, e
             try:
-                total, used, free = shutil.disk_usage(self.local_cwd)
-                free_str = self._format_size(free)
-                total_str = self._format_size(total)
-                self.lbl_local_disk.config(text=f"Local: {free_str} free / {total_str} total")
-            except:
-                self.lbl_local_disk.config(text="Disk info unavailable")
+                total, used, free = shutil.disk_usage(path)
+                disk_text = f"Local: {self._format_size(free)} free / {self._format_size(total)} total"
+            except OSError:
+                disk_text = "Disk info unavailable"
+            return entries, disk_text, None
+
+        self._spawn(fetch, lambda result: self._apply_local_listing(path, *result))
+
+    def _apply_local_listing(self, path, entries, disk_text, error):
+        if path != self.local_cwd:
+            return # The user has moved on
+        if error is not None:
+            self.update_status(f"Cannot open {path}: {error.strerror or error}", self.colors['error'])
+            if os.path.dirname(path) != path:
+                self.go_up_local()
+            return
+        self.view_local.set_entries(entries)
+        self.select_first_item(self.tree_local)
+        self.lbl_local_disk.config(text=disk_text)
 
-        except PermissionError:
-            self.go_up_local()
+    def _local_row(self, entry):
+        if entry.is_dir:
+            return (entry.name, "", "Folder")
+        return (entry.name, f"{entry.size / 1024:.1f} KB", "File")
 
     def go_up_local(self):
         self.local_cwd = os.path.dirname(self.local_cwd)
@@ -659,84 +1196,32 @@ class DroidPipe:
     def on_local_interact(self, event):
         sel = self.tree_local.selection()
         if not sel: return
-        item = self.tree_local.item(sel[0])
-        name = str(item['values'][0])
-        itype = item['values'][2]
-        if itype == "Folder":
-            self.local_cwd = os.path.join(self.local_cwd, name)
+        entry = self.view_local.entry_for(sel[0])
+        if entry.is_dir:
+            self.local_cwd = os.path.join(self.local_cwd, entry.name)
             self.refresh_local()
 
-    def refresh_android(self):
+    def refresh_android(self, force=False, select=None):
         if not self.connected_device: return
-        def fetch():
-            self._loading = True
-            self.root.after(0, lambda: self.set_loading(True))
-            # Use -l to get details including size
-            cmd = ['shell', f'ls -l "{self.android_cwd}"']
-            out, err = self.run_adb_cmd(cmd)
-            self._loading = False
-            self.root.after(0, lambda: self.set_loading(False))
-            items_data = []
-            if out:
-                lines = out.splitlines()
-                for line in lines:
-                    line = line.strip()
-                    if not line or line.startswith('total'): continue
-                    
-                    parts = line.split()
-                    if len(parts) < 4: continue # Skip malformed lines
-                    
-                    # Very basic parsing for 'ls -l' on Android (toybox)
-                    # drwxrwx--x 3 root sdcard_rw 4096 2023-01-01 12:00 Name
-                    perms = parts[0]
-                    is_dir = perms.startswith('d')
-                    
-                    # Finding size and name is tricky as columns vary.
-                    # Usually: perms links owner group size date time name
-                    # Let's assume size is 4th index (5th item) if typical
-                    # But safest is: First char 'd' = Folder.
-                    
-                    try:
-                        # Attempt to find name index. Usually date is like YYYY-MM-DD
-                        date_idx = -1
-                        for i, p in enumerate(parts):
-                            if '-' in p and ':' in parts[i+1]: # Finds date/time
-                                date_idx = i
-                                break
-                        
-                        if date_idx != -1:
-                            size_idx = date_idx - 1
-                            name_start = date_idx + 2
-                            raw_size = parts[size_idx]
-                            name = " ".join(parts[name_start:])
-                        else:
-                            # Fallback logic
-                            name = parts[-1]
-                            raw_size = "?"
-                    except:
-                        name = parts[-1]
-                        raw_size = "?"
-
-                    if name == "." or name == "..": continue
-
-                    if is_dir:
-                        items_data.append((name, "", "Folder"))
-                    else:
-                        try:
-                            s = int(raw_size)
-                            if s > 1024*1024: size_str = f"{s/(1024*1024):.1f} MB"
-                            elif s > 1024: size_str = f"{s/1024:.1f} KB"
-                            else: size_str = f"{s} B"
-                        except: size_str = "?"
-                        items_data.append((name, size_str, "File"))
-
-            self.root.after(0, lambda: self._update_android_tree(items_data))
+        serial, path = self.connected_device, self.android_cwd
+
+        # Render a cached listing right away and revalidate it in the background
+        cached = None if force else self.engine.listing_cache.get(serial, path)
+        if cached is not None:
+            cached_items, cached_disk = cached
+            self._update_android_tree(list(cached_items), select=select)
+            if cached_disk:
+                self.lbl_android_disk.config(text=cached_disk)
+
+        async def fetch():
+            items_data = await self.engine.list_android_dir_async(path, serial)
+            items_data.sort(key=lambda e: (not e.is_dir, e.name.lower()))
             
             # Disk Usage (df)
+            disk_text = None
             try:
                 # Use -k for 1K blocks explicitly if supported, or just default
-                cmd_df = ['shell', f'df "{self.android_cwd}"']
-                out_df, err_df = self.run_adb_cmd(cmd_df)
+                out_df, err_df = await self.engine.run_shell_cmd_async(f'df {shlex.quote(path)}', serial=serial)
                 if out_df:
                     lines = out_df.strip().splitlines()
                     # Filter for the line that likely contains our path or the last line
@@ -752,22 +1237,52 @@ class DroidPipe:
                                 avail = int(parts[3]) * 1024
                                 t_str = self._format_size(total)
                                 a_str = self._format_size(avail)
-                                self.root.after(0, lambda: self.lbl_android_disk.config(text=f"Android: {a_str} free / {t_str} total"))
+                                disk_text = f"Android: {a_str} free / {t_str} total"
                             except:
                                 pass
             except Exception:
                 pass
 
-        self.lbl_android_path.config(text=self.android_cwd)
-        threading.Thread(target=fetch, daemon=True).start()
+            self.engine.listing_cache.put(serial, path, items_data, disk_text)
+            return items_data, disk_text
 
-    def _update_android_tree(self, items):
-        for item in self.tree_android.get_children():
-            self.tree_android.delete(item)
-        items.sort(key=lambda x: (x[2] != "Folder", x[0].lower()))
-        for name, size, ftype in items:
-            self.tree_android.insert('', 'end', values=(name, size, ftype))
-        self.select_first_item(self.tree_android)
+        self.lbl_android_path.config(text=self.android_cwd)
+        self._spawn(fetch(), lambda result: self._apply_android_listing(serial, path, *result, cached, select))
+
+    def _android_row(self, entry):
+        if entry.is_dir:
+            return (entry.name, "", "Folder")
+        s = entry.size
+        if s > 1024*1024: size_str = f"{s/(1024*1024):.1f} MB"
+        elif s > 1024: size_str = f"{s/1024:.1f} KB"
+        else: size_str = f"{s} B"
+        return (entry.name, size_str, "File")
+
+    def _apply_android_listing(self, serial, path, items, disk_text, cached, select=None):
+        # The user may have moved on while the listing was in flight
+        if serial != self.connected_device or path != self.android_cwd:
+            return
+        if cached is None:
+            self._update_android_tree(items, select=select)
+        elif items != cached[0]:
+            self._update_android_tree(items, keep_selection=True)
+        if disk_text:
+            self.lbl_android_disk.config(text=disk_text)
+
+    def _update_android_tree(self, items, keep_selection=False, select=None):
+        """Shows items; keeps the current selection, or selects the entry named select."""
+        if select is not None:
+            selected = {select}
+        else:
+            selected = set(self._selected_names(self.tree_android)) if keep_selection else None
+        yview = self.tree_android.yview()[0]
+        items.sort(key=lambda e: (not e.is_dir, e.name.lower()))
+        self.lbl_android_path.config(text=self.android_cwd) # a new listing drops any filter
+        if self.view_android.set_entries(items, selected):
+            if select is None:
+                self.tree_android.yview_moveto(yview)
+        else:
+            self.select_first_item(self.tree_android)
 
     def go_up_android(self):
         if self.android_cwd == "/": return
@@ -784,10 +1299,9 @@ class DroidPipe:
     def on_android_interact(self, event):
         sel = self.tree_android.selection()
         if not sel: return
-        item = self.tree_android.item(sel[0])
-        name = str(item['values'][0])
-        itype = item['values'][2]
-        if itype == "Folder":
+        entry = self.view_android.entry_for(sel[0])
+        name = entry.name
+        if entry.is_dir:
             if self.android_cwd == "/": self.android_cwd += name + "/"
             else: self.android_cwd = os.path.join(self.android_cwd, name) + "/"
             self.refresh_android()
@@ -802,46 +1316,88 @@ class DroidPipe:
             if not sel_items: return
             
             count = len(sel_items)
-            msg = f"Permanently delete {count} items from PC?" if count > 1 else f"Permanently delete '{self.tree_local.item(sel_items[0])['values'][0]}' from PC?"
+            names = self._selected_names(self.tree_local)
+            msg = f"Permanently delete {count} items from PC?" if count > 1 else f"Permanently delete '{names[0]}' from PC?"
             
             if messagebox.askyesno("Delete Local", msg):
-                try:
-                    for sel in sel_items:
-                        name = str(self.tree_local.item(sel)['values'][0])
-                        path = os.path.join(self.local_cwd, name)
-                        if os.path.isdir(path):
-                            shutil.rmtree(path)
-                        else:
-                            os.remove(path)
-                    self.update_status(f"Deleted {count} items", self.colors['success'])
-                    self.refresh_local()
-                except Exception as e:
-                    messagebox.showerror("Error", str(e))
+                cwd = self.local_cwd
+                paths = [os.path.join(cwd, name) for name in names]
+
+                def refresh():
+                    if self.local_cwd == cwd:
+                        self.refresh_local()
+
+                self.view_local.remove_names(set(names))
+                self._start_delete(f"Deleting {count} item(s) from PC",
+                                   lambda on_progress: self.engine.loop.run_blocking(
+                                       self.engine.delete_local, paths, on_progress),
+                                   refresh)
         
         elif target == "android":
             sel_items = self.tree_android.selection()
             if not sel_items: return
             
             count = len(sel_items)
-            msg = f"Permanently delete {count} items from Device?" if count > 1 else f"Permanently delete '{self.tree_android.item(sel_items[0])['values'][0]}' from Device?"
+            names = self._selected_names(self.tree_android)
+            msg = f"Permanently delete {count} items from Device?" if count > 1 else f"Permanently delete '{names[0]}' from Device?"
             
             if messagebox.askyesno("Delete Android", msg):
-                def task():
-                    for sel in sel_items:
-                        name = str(self.tree_android.item(sel)['values'][0])
-                        path = self.android_cwd + name if self.android_cwd.endswith('/') else self.android_cwd + '/' + name
-                        escaped_path = f'"{path}"'
-                        self.run_adb_cmd(['shell', 'rm', '-rf', escaped_path])
-                    
-                    self.root.after(0, lambda: self.update_status(f"Deleted {count} items", self.colors['success']))
-                    self.root.after(0, self.refresh_android)
-                threading.Thread(target=task, daemon=True).start()
+                serial, cwd = self.connected_device, self.android_cwd
+                base = cwd if cwd.endswith('/') else cwd + '/'
+                paths = [base + name for name in names]
+
+                def refresh():
+                    if (serial, cwd) == (self.connected_device, self.android_cwd):
+                        self.refresh_android(force=True)
+
+                self.view_android.remove_names(set(names))
+                self._start_delete(self._session_title(serial, f"Deleting {count} item(s) from device"),
+                                   lambda on_progress: self.engine.delete_remote_async(paths, serial, on_progress),
+                                   refresh)
+
+    def _start_delete(self, title, delete, refresh):
+        """Runs a delete as a background job with its own session widget.
+
+        The pane has already dropped the rows; delete(on_progress) is awaited on
+        the engine's loop, behind any delete still running, and reports (items
+        done, items total). It returns (path, error) for what is left over, in
+        which case refresh() relists the pane to bring those rows back.
+        """
+        widget = TransferProgressWidget(self.sessions_frame, f"{title} (queued)", self.colors, self.fonts)
+        widget.pack(side=tk.TOP, fill=tk.X, pady=2)
+
+        def show(done, total):
+            widget.update_title(title)
+            widget.update_stats(f"{done} / {total} items")
+            widget.update_progress(done / total * 100)
+
+        def on_progress(done, total):
+            self.ui_bus.post(widget, show, done, total)
+
+        async def task():
+            try:
+                async with self._delete_queue:
+                    self.ui_bus.post(widget, widget.update_title, title)
+                    errors = await delete(on_progress)
+            except Exception as e:
+                logging.exception("Delete failed")
+                errors = [(title, str(e))]
+            for path, error in errors:
+                logging.error(f"Could not delete {path}: {error}")
+            if errors:
+                self.ui_bus.post(widget, widget.complete, False, f"{len(errors)} item(s) not deleted")
+                self.ui_bus.call(refresh)
+            else:
+                self.ui_bus.post(widget, widget.complete, True, "Deleted")
+            self.ui_bus.call(self.root.after, 5000, widget.destroy)
+
+        self._spawn(task())
 
     def request_push_confirm(self, event=None):
         sel_items = self.tree_local.selection()
         if not sel_items: return
         count = len(sel_items)
-        name = str(self.tree_local.item(sel_items[0])['values'][0])
+        name = self._selected_names(self.tree_local)[0]
         msg = f"Push {count} items to Android?" if count > 1 else f"Push '{name}' to Android?"
         if messagebox.askyesno("Confirm", msg):
             self.push_file()
@@ -850,202 +1406,461 @@ class DroidPipe:
         sel_items = self.tree_android.selection()
         if not sel_items: return
         count = len(sel_items)
-        name = str(self.tree_android.item(sel_items[0])['values'][0])
+        name = self._selected_names(self.tree_android)[0]
         msg = f"Pull {count} items from Android?" if count > 1 else f"Pull '{name}' from Android?"
         if messagebox.askyesno("Confirm", msg):
             self.pull_file()
 
+    def _session_title(self, serial, title):
+        # Only worth the space once more than one device is attached
+        return f"{serial}: {title}" if len(self.devices) > 1 else title
+
+    def _progress_reporter(self, widget, total_bytes, title_prefix=None, wire_stats=None):
+        """Returns a thread-safe callback taking the bytes done so far.
+
+        Progress goes through the UI bus, so the widget redraws at most once per
+        frame with the latest value. wire_stats lists [logical, wire] byte counts
+        of compressed jobs; when given, the stats show the bytes on the wire too.
+        total_bytes and title_prefix may also be functions, asked on every
+        redraw, for pushes whose files are still being found.
+        """
+        start_time = time.time()
+
+        def show(done):
+            total = total_bytes() if callable(total_bytes) else total_bytes
+            prefix = title_prefix() if callable(title_prefix) else title_prefix
+            global_pct = min((done / total) * 100, 100)
+            if prefix:
+                widget.update_title(f"{prefix}: {global_pct:.1f}%")
+            widget.update_progress(global_pct)
+
+            # Stats
+            elapsed = time.time() - start_time
+            if elapsed > 0.5:
+                speed = done / elapsed
+                if speed > 0:
+                    eta = max(total - done, 0) / speed
+                    speed_str = self._format_size(speed) + "/s"
+                    eta_str = f"{int(eta // 60)}m {int(eta % 60)}s"
+                    if wire_stats:
+                        wire = done - sum(logical - wired for logical, wired in wire_stats)
+                        speed_str += (f" ({self._format_size(wire / elapsed)}/s wire) | "
+                                      f"{self._format_size(done)} / {self._format_size(wire)} wire")
+                    widget.update_stats(f"{speed_str} | ETA: {eta_str}")
+
+        def report(done):
+            self.ui_bus.post(widget, show, done)
+
+        return report
+
+    def _finish_transfer(self, widget, results, cancel_event, refresh):
+        failed = [label for label, msg, code in results if code not in (0, -2)]
+        for label in failed:
+            logging.error(f"Transfer failed: {label}")
+
+        # Same key as the progress updates, so a late progress frame can't overwrite the result
+        if cancel_event.is_set():
+            self.ui_bus.post(widget, widget.complete, False, "Cancelled")
+        elif failed:
+            self.ui_bus.post(widget, widget.complete, False, f"{len(failed)} item(s) failed")
+        else:
+            self.ui_bus.post(widget, widget.complete, True)
+        self.ui_bus.call(refresh)
+        self.ui_bus.call(self.root.after, 5000, widget.destroy)
+
     def pull_file(self):
         sel_items = self.tree_android.selection()
         if not sel_items: return
-        
-        total_items = len(sel_items)
-        session_title = f"Pulling {total_items} item(s)"
-        widget = TransferProgressWidget(self.sessions_frame, session_title, self.colors, self.fonts)
+
+        remote_base = self.android_cwd if self.android_cwd.endswith('/') else self.android_cwd + '/'
+        paths_to_pull = [remote_base + name for name in self._selected_names(self.tree_android)]
+        self._start_pull(remote_base, self.local_cwd, f"Pulling {len(sel_items)} item(s)",
+                         remote_paths=paths_to_pull)
+
+    def _start_pull(self, remote_base, local_dir, title, remote_paths=None, files=None, resume_job=None, serial=None):
+        """Pulls into local_dir as one session.
+
+        Either remote_paths (expanded with a single manifest call), explicit
+        (remote_path, rel_path, size) files, or a journaled job to resume.
+        serial defaults to the selected device.
+        """
+        serial = serial or self.connected_device
+        compress = self.compress_pulls.get()
+        cancel_event = CancelEvent()
+        widget = TransferProgressWidget(self.sessions_frame, self._session_title(serial, title), self.colors, self.fonts,
+                                        cancel_cmd=cancel_event.set)
         # Pack new sessions at the top or bottom of the session frame? 
         # Side=TOP usually makes sense for a stack
         widget.pack(side=tk.TOP, fill=tk.X, pady=2)
-        
+
         def task():
             try:
-                # 1. Calculate stats with du
-                paths_to_pull = []
-                for sel in sel_items:
-                    item = self.tree_android.item(sel)
-                    name = str(item['values'][0])
-                    p = self.android_cwd + name if self.android_cwd.endswith('/') else self.android_cwd + '/' + name
-                    paths_to_pull.append(p)
-                
-                total_bytes = 0
-                item_sizes = []
-                try:
-                    # Get size for each item to track progress accurately
-                    for p in paths_to_pull:
-                        # du -s -k for summary in KB. 
-                        out, _ = self.run_adb_cmd(['shell', 'du', '-s', '-k', f'"{p}"'])
-                        size_b = 0
-                        if out:
-                            # Output: 1234   /path/to/file
-                            parts = out.split()
-                            if parts:
-                                try: size_b = int(parts[0]) * 1024
-                                except: pass
-                        item_sizes.append(size_b)
-                        total_bytes += size_b
-                except:
-                    # Fallback if du fails
-                    item_sizes = [0] * len(paths_to_pull)
-                    total_bytes = 1
-                
-                if total_bytes == 0: total_bytes = 1
-                
-                start_time = time.time()
-                transferred_so_far = 0
-                
-                for i, sel in enumerate(sel_items):
-                    android_path = paths_to_pull[i]
-                    current_item_size = item_sizes[i]
-                    
-                    def progress_wrapper(val, idx=i, c_size=current_item_size):
-                        # Global percent based on item count (legacy) or bytes?
-                        # Let's use bytes for accuracy if we have them
-                        curr_file_bytes = int(c_size * (val / 100.0))
-                        curr_total = transferred_so_far + curr_file_bytes
-                        
-                        # Use raw val for per-file progress if needed, 
-                        # but widget only has one bar. 
-                        # Let's show global progress on the bar.
-                        global_p = (curr_total / total_bytes) * 100
-                        if global_p > 100: global_p = 100
-                        widget.update_progress(global_p)
-                        
-                        # Stats
-                        elapsed = time.time() - start_time
-                        if elapsed > 0.5:
-                            speed = curr_total / elapsed
-                            if speed > 0:
-                                eta = (total_bytes - curr_total) / speed
-                                speed_str = self._format_size(speed) + "/s"
-                                eta_str = f"{int(eta // 60)}m {int(eta % 60)}s"
-                                widget.update_stats(f"{speed_str} | ETA: {eta_str}")
-
-                    self.run_adb_transfer(['pull', '-p', android_path, self.local_cwd], progress_wrapper)
-                    transferred_so_far += current_item_size
-                
-                self.root.after(0, lambda: widget.complete(True))
-                self.root.after(0, self.refresh_local)
-                self.root.after(5000, widget.destroy)
+                job_id, plan, offsets = self.engine.prepare_pull(serial, remote_base, local_dir, remote_paths,
+                                                                 files, resume_job)
+                wire_stats = []
+                report = self._progress_reporter(widget, remaining_bytes(plan, offsets) or 1, wire_stats=wire_stats)
+                results = self.engine.run_pull(serial, remote_base, local_dir, job_id, plan, offsets, report,
+                                               cancel_event, compress, wire_stats)
+                self._finish_transfer(widget, results, cancel_event, self.refresh_local)
             except Exception as e:
-                self.root.after(0, lambda: widget.complete(False, str(e)))
-            
-        threading.Thread(target=task, daemon=True).start()
+                self.ui_bus.post(widget, widget.complete, False, str(e))
+
+        self._spawn(task, session=True)
+
+    # --- SYNC ---
+    def open_sync_dialog(self):
+        SyncDialog(self.root, self.colors, self.fonts, self.run_sync)
+
+    # --- DEVICE SEARCH ---
+    def open_search_dialog(self):
+        dialog = DeviceSearchDialog(self.root, self.colors, self.fonts, self.connected_device,
+                                    self.search_device, self.index_device, self.open_search_result)
+        # Bring an existing index up to date (or build the first one) in the background
+        self.index_device(dialog, rebuild=False)
 
+    def _get_device_index(self, serial):
+        index = self.device_indexes.get(serial)
+        if index is None:
+            try:
+                index = DeviceIndex(index_path(STATE_DIR, serial))
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Device index unavailable ({e}), it won't be kept across restarts")
+                index = DeviceIndex(':memory:')
+            self.device_indexes[serial] = index
+        return index
+
+    def update_device_index(self, index, serial, rebuild=False, on_progress=None):
+        """Fills an empty index (or rebuilds it) from one streamed recursive listing of
+        INDEX_ROOT; otherwise refreshes only the folders whose mtime changed.
+
+        Blocking; returns a status message.
+        """
+        if rebuild or index.is_empty():
+            out, _ = self.engine.run_shell_cmd('date +%s', serial=serial)
+            device_time = int(out.strip()) if out and out.strip().isdigit() else None
+            records = parse_records(self.engine.stream_shell_lines(full_scan_command(INDEX_ROOT), serial))
+            count = index.rebuild(records, INDEX_ROOT, device_time, on_progress)
+            return f"Indexed {count:,} entries under {INDEX_ROOT}"
+
+        out, _ = self.engine.run_shell_cmd(dir_scan_command(INDEX_ROOT), timeout=MANIFEST_TIMEOUT, serial=serial)
+        device_time, scanned = parse_dir_scan(out or '')
+        if not scanned:
+            return f"Could not list the folders under {INDEX_ROOT}"
+
+        def list_children(dirs):
+            for chunk in chunk_args(dirs):
+                out, _ = self.engine.run_shell_cmd(children_command(chunk), timeout=MANIFEST_TIMEOUT, serial=serial)
+                yield from parse_records((out or '').rstrip('\n').split('\n'))
+
+        changed = index.refresh(scanned, device_time, list_children, INDEX_ROOT)
+        count, _ = index.summary()
+        return f"{count:,} entries indexed, {changed:,} folders rescanned"
+
+    def index_device(self, dialog, rebuild=False):
+        serial = dialog.serial
+        if not serial:
+            dialog.show_status("No device connected")
+            return
+        if serial in self._indexing:
+            dialog.show_status("Indexing is already running for this device")
+            return
+        index = self._get_device_index(serial)
+        count, updated = index.summary()
+        if rebuild or updated is None:
+            dialog.show_status(f"Indexing {INDEX_ROOT}...")
+        else:
+            age = time.strftime('%Y-%m-%d %H:%M', time.localtime(updated))
+            dialog.show_status(f"{count:,} entries indexed ({age}), checking for changes...")
+        self._indexing.add(serial)
+
+        def on_progress(n):
+            self.ui_bus.post(dialog, dialog.show_status, f"Indexing {INDEX_ROOT}... {n:,} entries")
+
+        def task():
+            try:
+                return self.update_device_index(index, serial, rebuild, on_progress)
+            except (OSError, sqlite3.Error) as e:
+                logging.error(f"Indexing {serial} failed: {e}")
+                return f"Indexing failed: {e}"
+            finally:
+                self.ui_bus.call(self._indexing.discard, serial)
+
+        self._spawn(task, dialog.show_status, session=True)
+
+    def search_device(self, dialog, query):
+        """Runs a DeviceIndex.search query against the dialog device's index.
+
+        The query runs off the Tk thread: it waits for the index lock, which
+        an update holds for as long as it writes.
+        """
+        if not dialog.serial:
+            dialog.show_status("No device connected")
+            return
+        index = self._get_device_index(dialog.serial)
+        token = dialog.pending_search = object()
+        dialog.show_status("Searching...")
+
+        def task():
+            start = time.perf_counter()
+            try:
+                hits = index.search(limit=SEARCH_RESULT_LIMIT, **query)
+            except sqlite3.Error as e:
+                logging.error(f"Searching {dialog.serial} failed: {e}")
+                return [], [], f"Search failed: {e}"
+            elapsed = (time.perf_counter() - start) * 1000
+
+            paths, rows = [], []
+            for path, size, mtime, is_dir in hits:
+                paths.append(path)
+                rows.append((path, "Folder" if is_dir else self._format_size(size),
+                             time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))))
+            status = f"{len(hits):,} results in {elapsed:.0f} ms"
+            if len(hits) == SEARCH_RESULT_LIMIT:
+                status += f" (first {SEARCH_RESULT_LIMIT:,} shown, narrow the search)"
+            if index.is_empty():
+                status += " - the index is still being built"
+            return paths, rows, status
+
+        def show(result):
+            if dialog.pending_search is token:
+                dialog.show_results(*result)
+
+        self._spawn(task, show)
+
+    def open_search_result(self, dialog, path):
+        """Shows the folder containing path in the Android pane with the entry selected."""
+        if dialog.serial != self.connected_device:
+            dialog.show_status(f"{dialog.serial} is no longer the connected device")
+            return
+        directory, name = path.rstrip('/').rsplit('/', 1)
+        self.android_cwd = (directory or '') + '/'
+        self.refresh_android(select=name)
+        self.tree_android.focus_set()
+
+    def run_sync(self, dialog, direction, delete_extraneous, use_hash, dry_run):
+        """Plans a one-way sync of the selection and, unless dry_run, carries it out.
+
+        direction is 'push' (local -> device) or 'pull' (device -> local). The selected
+        items of the source pane are mirrored into the other pane's current directory.
+        """
+        if not self.connected_device:
+            dialog.show_report("No device connected")
+            return
+        source_tree = self.tree_local if direction == 'push' else self.tree_android
+        names = self._selected_names(source_tree)
+        if not names:
+            dialog.show_report("Select the items to sync in the source pane first")
+            return
+        local_cwd = self.local_cwd
+        remote_base = self.android_cwd if self.android_cwd.endswith('/') else self.android_cwd + '/'
+        serial = self.connected_device
+        dialog.show_report("Comparing...")
+
+        def task():
+            try:
+                plan = self.engine.compare(serial, direction, local_cwd, remote_base, names, delete_extraneous,
+                                           use_hash)
+                report = plan.report(self._format_size(plan.copy_bytes), dry_run)
+                self.ui_bus.call(dialog.show_report, report)
+                if dry_run:
+                    return
+
+                self.engine.remove_extraneous(serial, plan, remote_base)
+                if plan.extraneous and direction == 'pull':
+                    self.ui_bus.call(self.refresh_local)
+
+                files = plan.transfer_files()
+                if direction == 'push' and files:
+                    self.ui_bus.call(lambda: self._start_push(remote_base, files=files, serial=serial))
+                elif files:
+                    self.ui_bus.call(lambda: self._start_pull(remote_base, local_cwd, f"Syncing {len(files)} file(s)",
+                                                              files=files, serial=serial))
+            except Exception as e:
+                logging.exception("Sync failed")
+                self.ui_bus.call(dialog.show_report, f"Sync failed: {e}")
+
+        self._spawn(task, session=True)
 
     def push_file(self):
         sel_items = self.tree_local.selection()
         if not sel_items: return
         
         # 1. Collect all files first
-        local_paths = []
-        for sel in sel_items:
-            item = self.tree_local.item(sel)
-            name = str(item['values'][0])
-            local_paths.append(os.path.join(self.local_cwd, name))
+        local_paths = [os.path.join(self.local_cwd, name) for name in self._selected_names(self.tree_local)]
+        self._start_push(self.android_cwd, local_paths=local_paths)
+
+    def resume_transfer(self):
+        if not self.connected_device: return
+        job = self.engine.journal.latest_incomplete(self.connected_device)
+        if job is None:
+            self.update_status("No interrupted transfer to resume", self.colors['warning'])
+            return
+        job_id, direction, remote_base, local_dir, count, remaining = job
+        size_str = self._format_size(remaining)
+        if direction == 'push':
+            if messagebox.askyesno("Resume", f"Resume push of {count} file(s) ({size_str} left) to {remote_base}?"):
+                self._start_push(remote_base, resume_job=job_id)
+        elif messagebox.askyesno("Resume", f"Resume pull of {count} file(s) ({size_str} left) to {local_dir}?"):
+            self._start_pull(remote_base, local_dir, f"Resuming pull of {count} file(s)", resume_job=job_id)
+
+    def _start_push(self, remote_base, local_paths=None, files=None, resume_job=None, serial=None):
+        serial = serial or self.connected_device
+        verifiers = {} if self.verify_transfers.get() else None
             
         # Cancellation
-        cancel_event = threading.Event()
+        cancel_event = CancelEvent()
         
         def on_cancel():
             cancel_event.set()
         
         # Setup Progress Widget
-        count = len(sel_items)
-        session_title = f"Preparing push..."
-        widget = TransferProgressWidget(self.sessions_frame, session_title, self.colors, self.fonts, cancel_cmd=on_cancel)
+        session_title = "Resuming push..." if resume_job else "Preparing push..."
+        widget = TransferProgressWidget(self.sessions_frame, self._session_title(serial, session_title),
+                                        self.colors, self.fonts, cancel_cmd=on_cancel)
         widget.pack(side=tk.TOP, fill=tk.X, pady=2)
         
         def task():
             try:
-                files_to_transfer = self._get_recursive_files(local_paths)
-                total_bytes = sum(f[2] for f in files_to_transfer)
-                if total_bytes == 0: total_bytes = 1 # Avoid div/0
-                
-                formatted_total = self._format_size(total_bytes)
-                
-                transferred_bytes = 0
-                is_cancelled = False
-                
-                start_time = time.time()
-
-                for i, (abs_path, rel_path, size) in enumerate(files_to_transfer):
-                    if cancel_event.is_set():
-                        is_cancelled = True
-                        break
-
-                    # Update Title/Status initially for this file
-                    pct = (transferred_bytes / total_bytes) * 100
-                    widget.update_title(f"Pushing: {pct:.1f}%")
-                    
-                    # Update Progress Bar for current file (reset to 0 initially)
-                    widget.update_progress(pct) # Actually let's show global progress on bar
-                    
-                    remote_dest = self.android_cwd + rel_path if self.android_cwd.endswith('/') else self.android_cwd + '/' + rel_path
-                    remote_dir = os.path.dirname(remote_dest)
-                    
-                    def progress_wrapper(val):
-                        # val is percentage of CURRENT file
-                        
-                        # Update global text
-                        current_file_bytes = int(size * (val / 100.0))
-                        current_global_bytes = transferred_bytes + current_file_bytes
-                        global_pct = (current_global_bytes / total_bytes) * 100
-                        widget.update_title(f"Pushing: {global_pct:.1f}%")
-                        widget.update_progress(global_pct)
-
-                        # Stats
-                        elapsed = time.time() - start_time
-                        if elapsed > 0.5:
-                            speed = current_global_bytes / elapsed
-                            if speed > 0:
-                                eta = (total_bytes - current_global_bytes) / speed
-                                speed_str = self._format_size(speed) + "/s"
-                                eta_str = f"{int(eta // 60)}m {int(eta % 60)}s"
-                                widget.update_stats(f"{speed_str} | ETA: {eta_str}")
-
-                    # Using escaped paths just in case
-                    cmd = ['push', '-p', abs_path, remote_dest] 
-                    res, code = self.run_adb_transfer(cmd, progress_wrapper, cancel_event)
-                    
-                    if code == -2 or cancel_event.is_set(): # Cancelled
-                        is_cancelled = True
-                        # Cleanup partial file
-                        self.run_adb_cmd(['shell', 'rm', '-f', f'"{remote_dest}"'])
-                        break
-                    
-                    if code != 0:
-                         widget.update_title(f"Error transferring {rel_path}")
-                    
-                    transferred_bytes += size
-                
-                if is_cancelled:
-                     widget.complete(False, "Cancelled")
+                job_id, files_to_transfer, offsets = self.engine.prepare_push(serial, remote_base, local_paths,
+                                                                              files, resume_job)
+                if isinstance(files_to_transfer, LocalWalk):
+                    # Sending starts right away; the total grows until the walk is done
+                    walk = files_to_transfer
+                    report = self._progress_reporter(
+                        widget, lambda: walk.total_bytes or 1,
+                        lambda: self._session_title(serial, "Pushing" if walk.finished
+                                                    else f"Pushing ({len(walk)} files found so far)"))
                 else:
-                    widget.complete(True)
-                
-                self.root.after(0, self.refresh_android)
-                self.root.after(5000, widget.destroy)
+                    total_bytes = remaining_bytes(files_to_transfer, offsets)
+                    if total_bytes == 0: total_bytes = 1 # Avoid div/0
+                    report = self._progress_reporter(widget, total_bytes, self._session_title(serial, "Pushing"))
+                self._run_device_push(serial, remote_base, files_to_transfer, offsets, job_id,
+                                      widget, cancel_event, report, verifiers)
                 
             except Exception as e:
-                self.root.after(0, lambda: widget.complete(False, str(e)))
+                self.ui_bus.post(widget, widget.complete, False, str(e))
+
+        self._spawn(task, session=True)
+
+    def _run_device_push(self, serial, remote_base, files, offsets, job_id, widget, cancel_event, report,
+                         verifiers=None):
+        """Runs a journaled push through the engine and closes its session. Blocking.
+
+        Returns the engine's (label, message, code) results.
+        """
+        def on_verify(count):
+            self.ui_bus.post(widget, widget.update_title, self._session_title(serial, f"Verifying {count} file(s)..."))
+
+        results = self.engine.run_push(serial, remote_base, job_id, files, offsets, report, cancel_event,
+                                       verifiers, on_verify)
+        self._finish_transfer(widget, results, cancel_event, lambda: self._refresh_if_shown(serial))
+        return results
+
+    def _refresh_if_shown(self, serial):
+        if serial == self.connected_device:
+            self.refresh_android()
+
+    def push_to_all_devices(self):
+        names = self._selected_names(self.tree_local)
+        if not names: return
+        serials = list(self.devices)
+        if not serials:
+            self.update_status("No device found", self.colors['warning'])
+            return
+        msg = f"Push {len(names)} item(s) to {self.android_cwd} on all {len(serials)} devices?"
+        if messagebox.askyesno("Push to All Devices", msg):
+            local_paths = [os.path.join(self.local_cwd, name) for name in names]
+            self._start_broadcast_push(self.android_cwd, local_paths, serials)
+
+    def _start_broadcast_push(self, remote_base, local_paths, serials):
+        """Pushes one payload to several devices at once.
+
+        The local tree is walked and stat'ed once. Every device then runs its own
+        journaled job on its own scheduler with its own session widget and cancel
+        button, so a slow or failing device only holds up itself. The overall
+        widget shows the combined progress and cancels every device.
+        """
+        cancel_all = CancelEvent()
+        cancels = {serial: CancelEvent() for serial in serials}
+        # Devices using the same checksum tool share the local digests
+        verifiers = {} if self.verify_transfers.get() else None
+
+        def on_cancel_all():
+            cancel_all.set()
+            for event in cancels.values():
+                event.set()
+
+        overall = TransferProgressWidget(self.sessions_frame, f"Preparing push to {len(serials)} devices...",
+                                         self.colors, self.fonts, cancel_cmd=on_cancel_all)
+        overall.pack(side=tk.TOP, fill=tk.X, pady=2)
+        widgets = {}
+        for serial in serials:
+            widgets[serial] = TransferProgressWidget(self.sessions_frame, f"{serial}: waiting...", self.colors,
+                                                     self.fonts, cancel_cmd=cancels[serial].set)
+            widgets[serial].pack(side=tk.TOP, fill=tk.X, pady=2)
+
+        async def task():
+            loop = self.engine.loop
+            try:
+                files = await loop.run_thread(local_files, local_paths)
+            except OSError as e:
+                for widget in [overall, *widgets.values()]:
+                    self.ui_bus.post(widget, widget.complete, False, str(e))
+                return
+
+            total_bytes = files.total_bytes or 1
+            overall_report = self._progress_reporter(overall, total_bytes * len(serials),
+                                                     f"All {len(serials)} devices")
+            lock = threading.Lock()
+            done = dict.fromkeys(serials, 0)
+
+            def device_reporter(serial):
+                own = self._progress_reporter(widgets[serial], total_bytes, f"{serial}: Pushing")
+
+                def report(n):
+                    own(n)
+                    with lock:
+                        done[serial] = n
+                        combined = sum(done.values())
+                    overall_report(combined)
+                return report
+
+            def push_device(serial):
+                widget = widgets[serial]
+                try:
+                    job_id = self.engine.journal.create_job('push', serial, remote_base, files.rows())
+                    results = self._run_device_push(serial, remote_base, files, {}, job_id, widget,
+                                                    cancels[serial], device_reporter(serial), verifiers)
+                    return all(code == 0 for _, _, code in results)
+                except Exception as e:
+                    logging.exception(f"Push to {serial} failed")
+                    self.ui_bus.post(widget, widget.complete, False, str(e))
+                    return False
+
+            # Each device's session waits on that device's scheduler from a thread of its own
+            results = await asyncio.gather(*(loop.run_thread(push_device, serial) for serial in serials))
+            finished = dict(zip(serials, results))
+
+            unfinished = [serial for serial, ok in finished.items() if not ok]
+            if cancel_all.is_set():
+                self.ui_bus.post(overall, overall.complete, False, "Cancelled")
+            elif unfinished:
+                self.ui_bus.post(overall, overall.complete, False,
+                                 f"{len(unfinished)} of {len(serials)} devices incomplete: {', '.join(unfinished)}")
+            else:
+                self.ui_bus.post(overall, overall.complete, True)
+            self.ui_bus.call(self.root.after, 5000, overall.destroy)
 
-        threading.Thread(target=task, daemon=True).start()
+        self._spawn(task())
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--debug", action="store_true")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_TRANSFER_WORKERS,
+                        help="concurrent adb transfers per device")
     args = parser.parse_args()
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
     
     root = tk.Tk()
-    app = DroidPipe(root)
+    app = DroidPipe(root, transfer_workers=max(1, args.workers))
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""Progress scraping for adb commands that only report on a terminal.
+
+`adb push -p` and `adb pull -p` print '[ 42%] path' updates, rewriting the line
+with carriage returns, and only when stdout is a tty. The reader here runs the
+command on a pty from an asyncio event loop, reads in large chunks and keeps just enough state between
+chunks to finish a percentage split across two reads. The callback sees at
+most PROGRESS_HZ updates per second, plus the final value.
+"""
+import asyncio
+import os
+import signal
+import time
+
+try:
+    import pty
+except ImportError:
+    pty = None
+
+PROGRESS_HZ = 20
+READ_SIZE = 64 * 1024
+
+# '100' is the longest percentage; longer digit runs are not progress
+_MAX_DIGITS = 3
+
+
+def _is_digit(byte):
+    return 48 <= byte <= 57
+
+
+class PercentParser:
+    """Finds the latest 'NN%' in output fed in arbitrary chunks.
+
+    Only the trailing digits of the previous chunk are carried over, so the
+    state stays a few bytes no matter how much the command prints.
+    """
+    __slots__ = ('_carry',)
+
+    def __init__(self):
+        self._carry = b''
+
+    def feed(self, chunk):
+        """Returns the last percentage completed within chunk, or None."""
+        data = self._carry + chunk if self._carry else chunk
+
+        # Digits at the very end may be followed by '%' in the next chunk
+        keep = len(data)
+        while keep > 0 and len(data) - keep <= _MAX_DIGITS and _is_digit(data[keep - 1]):
+            keep -= 1
+        self._carry = data[keep:]
+
+        end = len(data)
+        while True:
+            pos = data.rfind(b'%', 0, end)
+            if pos == -1:
+                return None
+            start = pos
+            while start > 0 and pos - start < _MAX_DIGITS and _is_digit(data[start - 1]):
+                start -= 1
+            if start < pos and not (start > 0 and _is_digit(data[start - 1])):
+                value = int(data[start:pos])
+                if value <= 100:
+                    return value
+            end = pos
+
+
+class Throttle:
+    """Passes values on to callback at most hz times per second, dropping repeats.
+
+    The most recent value held back is delivered by tick() once the interval has
+    passed, or by flush().
+    """
+    __slots__ = ('callback', 'interval', '_last_time', '_last_value', '_pending')
+
+    def __init__(self, callback, hz=PROGRESS_HZ):
+        self.callback = callback
+        self.interval = 1.0 / hz
+        self._last_time = float('-inf')
+        self._last_value = None
+        self._pending = None
+
+    def update(self, value):
+        if value == self._last_value:
+            self._pending = None
+            return
+        self._pending = value
+        self.tick()
+
+    def tick(self):
+        if self._pending is None:
+            return
+        now = time.monotonic()
+        if now - self._last_time >= self.interval:
+            self._emit(now)
+
+    def flush(self):
+        if self._pending is not None:
+            self._emit(time.monotonic())
+
+    def _emit(self, now):
+        value, self._pending = self._pending, None
+        self._last_time = now
+        self._last_value = value
+        self.callback(value)
+
+
+async def run_with_progress(cmd, on_percent, hz=PROGRESS_HZ):
+    """Runs cmd on a pty and reports the percentages it prints through on_percent.
+
+    The pty is watched with an event loop reader instead of being polled, and
+    on_percent is called on the loop's thread; a value the throttle holds back
+    is delivered by a timer if the command goes quiet. Returns ("Transfer
+    finished", returncode) or (error message, -1). Cancelling the coroutine
+    terminates the command. Needs the pty module.
+    """
+    loop = asyncio.get_running_loop()
+    master_fd, slave_fd = pty.openpty()
+    try:
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=slave_fd, stderr=slave_fd)
+    except OSError as e:
+        os.close(slave_fd)
+        os.close(master_fd)
+        return str(e), -1
+    os.close(slave_fd)
+    os.set_blocking(master_fd, False)
+
+    parser = PercentParser()
+    throttle = Throttle(on_percent, hz)
+    eof = loop.create_future()
+    timer = None
+
+    def on_timer():
+        nonlocal timer
+        timer = None
+        throttle.tick()
+
+    def drain():
+        """Parses everything readable now; True once the child has closed its end."""
+        nonlocal timer
+        while True:
+            try:
+                chunk = os.read(master_fd, READ_SIZE)
+            except BlockingIOError:
+                return False
+            except OSError:
+                return True # EIO once the child has closed its end
+            if not chunk:
+                return True
+            value = parser.feed(chunk)
+            if value is not None:
+                throttle.update(value)
+            if timer is None:
+                timer = loop.call_later(throttle.interval, on_timer)
+
+    def on_readable():
+        try:
+            closed = drain()
+        except Exception as e:
+            closed = True
+            if not eof.done():
+                eof.set_exception(e)
+        if closed:
+            loop.remove_reader(master_fd)
+            if not eof.done():
+                eof.set_result(None)
+
+    loop.add_reader(master_fd, on_readable)
+    exited = asyncio.ensure_future(process.wait())
+    try:
+        # A daemon forked by the command (the adb server) can keep the pty open past its exit
+        await asyncio.wait((eof, exited), return_when=asyncio.FIRST_COMPLETED)
+        if not eof.done():
+            drain()
+        else:
+            eof.result()
+        throttle.flush()
+        await exited
+        return "Transfer finished", process.returncode
+    except asyncio.CancelledError:
+        # Not process.terminate(): it reaps a child that Ctrl+C already killed, behind the loop's back
+        try:
+            os.kill(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise
+    except Exception as e:
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+        return str(e), -1
+    finally:
+        loop.remove_reader(master_fd)
+        if timer is not None:
+            timer.cancel()
+        if not exited.done():
+            exited.cancel()
+        os.close(master_fd)
@@ -0,0 +1,194 @@
+"""A small adb server for tests, speaking the host, shell v2 and sync protocols.
+
+It serves one device, FAKE123, whose filesystem is the host's: tests point it
+at temporary folders. Shell commands run under the host's /bin/sh. Hooks let a
+test slow down or stall RECV, turn shell v2 off, and see what went over the
+wire.
+"""
+import asyncio
+import os
+import stat
+import struct
+
+SERIAL = 'FAKE123'
+
+_HEADER = struct.Struct('<4sI')
+
+
+class FakeAdbServer:
+    def __init__(self, shell_v2=True):
+        self.shell_v2 = shell_v2
+        self.port = None
+        self.connections = 0 # accepted so far
+        self.sync_sessions = [] # writers of open sync connections
+        self.requests = [] # host requests and sync request ids, in order
+        self.data_sizes = [] # payload size of every DATA packet received
+        self.recv_stall_after = None # RECV stops after this many bytes until recv_resume is set
+        self.recv_stalled = asyncio.Event()
+        self.recv_resume = asyncio.Event()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.recv_resume.set()
+        self.drop_sync_sessions()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_sync_sessions(self):
+        """Closes every open sync connection, like adbd restarting."""
+        for writer in self.sync_sessions:
+            writer.close()
+        self.sync_sessions = []
+
+    async def _read_request(self, reader):
+        length = int(await reader.readexactly(4), 16)
+        request = (await reader.readexactly(length)).decode('utf-8')
+        self.requests.append(request)
+        return request
+
+    @staticmethod
+    def _okay(writer, data=None):
+        writer.write(b'OKAY' + (b'%04x' % len(data) + data if data is not None else b''))
+
+    @staticmethod
+    def _fail(writer, message):
+        data = message.encode('utf-8')
+        writer.write(b'FAIL' + b'%04x' % len(data) + data)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            request = await self._read_request(reader)
+            if request == 'host:devices':
+                self._okay(writer, f"{SERIAL}\tdevice\n".encode())
+            elif request in (f'host:transport:{SERIAL}', 'host:transport-any'):
+                self._okay(writer)
+                await self._device_service(reader, writer)
+            elif request.startswith('host:transport:'):
+                self._fail(writer, f"device '{request[15:]}' not found")
+            else:
+                self._fail(writer, 'unknown host service')
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _device_service(self, reader, writer):
+        service = await self._read_request(reader)
+        if service == 'sync:':
+            self._okay(writer)
+            self.sync_sessions.append(writer)
+            await self._sync(reader, writer)
+        elif service.startswith('shell,v2,raw:') and self.shell_v2:
+            self._okay(writer)
+            out, err, status = await self._run(service[len('shell,v2,raw:'):])
+            for packet_id, data in ((1, out), (2, err)):
+                if data:
+                    writer.write(struct.pack('<BI', packet_id, len(data)) + data)
+            writer.write(struct.pack('<BI', 3, 1) + bytes([status & 0xff]))
+        elif service.startswith('shell:'):
+            self._okay(writer)
+            out, err, _ = await self._run(service[len('shell:'):])
+            writer.write(out + err)
+        else:
+            self._fail(writer, 'closed')
+
+    @staticmethod
+    async def _run(command):
+        process = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.PIPE)
+        out, err = await process.communicate()
+        return out, err, process.returncode
+
+    @staticmethod
+    def _sync_fail(writer, message):
+        data = message.encode('utf-8')
+        writer.write(_HEADER.pack(b'FAIL', len(data)) + data)
+
+    async def _sync(self, reader, writer):
+        while True:
+            request_id, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+            if request_id == b'QUIT':
+                return
+            path = (await reader.readexactly(length)).decode('utf-8', 'surrogateescape')
+            self.requests.append(request_id.decode())
+            if request_id == b'STAT':
+                try:
+                    st = os.stat(path)
+                    writer.write(b'STAT' + struct.pack('<III', st.st_mode, st.st_size, int(st.st_mtime)))
+                except OSError:
+                    writer.write(b'STAT' + bytes(12))
+            elif request_id == b'LIST':
+                for name in ['.', '..'] + sorted(os.listdir(path)):
+                    st = os.lstat(os.path.join(path, name))
+                    data = name.encode()
+                    writer.write(b'DENT' + struct.pack('<IIII', st.st_mode, st.st_size, int(st.st_mtime), len(data))
+                                 + data)
+                writer.write(b'DONE' + bytes(16))
+            elif request_id == b'SEND':
+                if not await self._receive_file(reader, writer, path):
+                    return # adbd ends the session after a FAIL
+            elif request_id == b'RECV':
+                if not await self._send_file(writer, path):
+                    return
+            else:
+                self._sync_fail(writer, f"unknown request {request_id!r}")
+                return
+            await writer.drain()
+
+    async def _receive_file(self, reader, writer, spec):
+        path, mode = spec.rsplit(',', 1)
+        chunks, error = [], None
+        while True:
+            request_id, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+            if request_id == b'DATA':
+                self.data_sizes.append(length)
+                chunks.append(await reader.readexactly(length))
+            elif request_id == b'DONE':
+                mtime = length
+                break
+            else:
+                error = f"unexpected {request_id!r}"
+                break
+        if error is None:
+            try:
+                # Like adbd, SEND creates the missing parent folders
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(b''.join(chunks))
+                os.chmod(path, stat.S_IMODE(int(mode)))
+                os.utime(path, (mtime, mtime))
+            except OSError as e:
+                error = f"couldn't create file: {e.strerror}"
+        if error is not None:
+            self._sync_fail(writer, error)
+            await writer.drain()
+            return False
+        writer.write(_HEADER.pack(b'OKAY', 0))
+        return True
+
+    async def _send_file(self, writer, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            self._sync_fail(writer, e.strerror)
+            await writer.drain()
+            return False
+        sent = 0
+        for start in range(0, len(data), 64 * 1024):
+            if self.recv_stall_after is not None and sent >= self.recv_stall_after:
+                self.recv_stalled.set()
+                await self.recv_resume.wait()
+            chunk = data[start:start + 64 * 1024]
+            writer.write(_HEADER.pack(b'DATA', len(chunk)) + chunk)
+            await writer.drain()
+            sent += len(chunk)
+        writer.write(_HEADER.pack(b'DONE', 0))
+        return True
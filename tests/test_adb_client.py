@@ -0,0 +1,189 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import adb_client
+from adb_client import (AdbClient, AdbProtocolError, AdbServerUnavailable, FILE_BLOCK_SIZE, SYNC_DATA_MAX,
+                        SYNC_POOL_SIZE)
+from tests.fake_adb_server import SERIAL, FakeAdbServer
+
+
+class SlowFile:
+    """A file whose writes take a while, so a cancel can land while one is running."""
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, data):
+        if data:
+            time.sleep(0.3)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+class AdbClientTestCase(unittest.IsolatedAsyncioTestCase):
+    shell_v2 = True
+
+    async def asyncSetUp(self):
+        self.server = await FakeAdbServer(shell_v2=self.shell_v2).start()
+        self.client = AdbClient(port=self.server.port)
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    async def asyncTearDown(self):
+        self.client.close()
+        await self.server.stop()
+        self._tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def write(self, name, data):
+        with open(self.path(name), 'wb') as f:
+            f.write(data)
+        return self.path(name)
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+
+class HostTest(AdbClientTestCase):
+    async def test_devices(self):
+        self.assertEqual(await self.client.devices(), [(SERIAL, 'device')])
+
+    async def test_shell_v2_keeps_streams_and_status_apart(self):
+        out, err, status = await self.client.shell(SERIAL, 'echo out; echo err >&2; exit 3')
+        self.assertEqual((out, err, status), ('out\n', 'err\n', 3))
+
+    async def test_unknown_device_fails(self):
+        with self.assertRaisesRegex(AdbProtocolError, "not found"):
+            await self.client.shell('NOPE', 'true')
+
+    async def test_no_server(self):
+        server = await asyncio.start_server(lambda r, w: None, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        with self.assertRaises(AdbServerUnavailable):
+            await AdbClient(port=port).devices()
+
+
+class LegacyShellTest(AdbClientTestCase):
+    shell_v2 = False
+
+    async def test_falls_back_to_plain_shell(self):
+        out, err, status = await self.client.shell(None, 'echo out')
+        self.assertEqual((out, err, status), ('out\n', '', None))
+        self.assertIn('shell:echo out', self.server.requests)
+
+
+class SyncTest(AdbClientTestCase):
+    async def test_stat_and_list(self):
+        self.write('a.txt', b'12345')
+        mode, size, _ = await self.client.stat(SERIAL, self.path('a.txt'))
+        self.assertTrue(mode)
+        self.assertEqual(size, 5)
+        self.assertEqual((await self.client.stat(SERIAL, self.path('missing')))[0], 0)
+        names = [entry[0] for entry in await self.client.list(SERIAL, self.tmp)]
+        self.assertEqual(names, ['.', '..', 'a.txt'])
+
+    async def test_chunk_boundaries(self):
+        sizes = (0, 1, SYNC_DATA_MAX - 1, SYNC_DATA_MAX, SYNC_DATA_MAX + 1, FILE_BLOCK_SIZE, FILE_BLOCK_SIZE + 1)
+        for size in sizes:
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                source = self.write('source', data)
+                os.utime(source, (1600000000, 1600000000))
+                self.server.data_sizes = []
+                sent = []
+                await self.client.push(SERIAL, source, self.path('pushed'), sent.append)
+                self.assertEqual(self.read('pushed'), data)
+                self.assertEqual(sent[-1:], [size] if size else [])
+                self.assertTrue(all(n <= SYNC_DATA_MAX for n in self.server.data_sizes))
+                self.assertEqual(sum(self.server.data_sizes), size)
+
+                received = []
+                count = await self.client.pull(SERIAL, self.path('pushed'), self.path('pulled'), received.append)
+                self.assertEqual(count, size)
+                self.assertEqual(self.read('pulled'), data)
+                self.assertEqual(received[-1:], [size] if size else [])
+                self.assertEqual(int(os.path.getmtime(self.path('pulled'))), 1600000000)
+
+    async def test_push_creates_parent_folders(self):
+        source = self.write('source', b'nested')
+        await self.client.push(SERIAL, source, self.path('a/b/c/file'))
+        self.assertEqual(self.read('a/b/c/file'), b'nested')
+        names = [entry[0] for entry in await self.client.list(SERIAL, self.path('a/b'))]
+        self.assertEqual(names, ['.', '..', 'c'])
+
+    async def test_fail_replies(self):
+        with self.assertRaises(AdbProtocolError):
+            await self.client.pull(SERIAL, self.path('missing'), self.path('out'))
+        source = self.write('source', b'data')
+        with self.assertRaisesRegex(AdbProtocolError, "couldn't create file"):
+            await self.client.push(SERIAL, source, self.path('source/file')) # its parent is a file
+        # The session that got a FAIL is gone; the next request opens a fresh one
+        connections = self.server.connections
+        await self.client.stat(SERIAL, source)
+        self.assertEqual(self.server.connections, connections + 1)
+
+    async def test_cancel_during_pull_keeps_exactly_what_arrived(self):
+        data = os.urandom(2 * FILE_BLOCK_SIZE)
+        self.write('big', data)
+        self.server.recv_stall_after = FILE_BLOCK_SIZE
+        with mock.patch.object(adb_client, 'open', lambda *args: SlowFile(open(*args)), create=True):
+            task = asyncio.create_task(self.client.pull(SERIAL, self.path('big'), self.path('partial')))
+            await self.server.recv_stalled.wait()
+            await asyncio.sleep(0.1) # the first block's write is still running
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertEqual(self.read('partial'), data[:FILE_BLOCK_SIZE])
+
+
+class PoolTest(AdbClientTestCase):
+    async def test_reuses_sync_connection(self):
+        source = self.write('a', b'x')
+        for _ in range(5):
+            await self.client.stat(SERIAL, source)
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_drops_connection_closed_by_device(self):
+        source = self.write('a', b'x')
+        await self.client.stat(SERIAL, source)
+        self.server.drop_sync_sessions()
+        await asyncio.sleep(0.05)
+        self.assertEqual((await self.client.stat(SERIAL, source))[1], 1)
+        self.assertEqual(self.server.connections, 2)
+
+    async def test_keeps_at_most_pool_size_idle(self):
+        source = self.write('a', b'x')
+        count = SYNC_POOL_SIZE + 2
+        await asyncio.gather(*(self.client.stat(SERIAL, source) for _ in range(count)))
+        self.assertEqual(self.server.connections, count)
+        self.assertEqual(len(self.client._idle[SERIAL]), SYNC_POOL_SIZE)
+
+    async def test_cancelled_operation_drops_its_connection(self):
+        self.write('big', os.urandom(2 * FILE_BLOCK_SIZE))
+        self.server.recv_stall_after = SYNC_DATA_MAX
+        task = asyncio.create_task(self.client.pull(SERIAL, self.path('big'), self.path('partial')))
+        await self.server.recv_stalled.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertFalse(self.client._idle.get(SERIAL))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+import unittest
+
+from listing import LINK_MODES_MARKER, LINK_TARGETS_MARKER, FileEntry, list_command, parse_listing, parse_ls
+
+
+def _mtime(date):
+    return int(time.mktime(time.strptime(date, "%Y-%m-%d %H:%M")))
+
+
+class ParseListingTest(unittest.TestCase):
+    def test_records(self):
+        text = '\n'.join([
+            "41f9 3452 1700000000 ./DCIM",
+            "81b0 1234 1700000001 ./IMG 2023-01-01 12:00.jpg",
+            "81a4 0 1700000002 ./ -> not a link",
+            "21b6 0 1700000003 ./null",
+            "61b0 0 1700000004 ./sda",
+            LINK_MODES_MARKER,
+            LINK_TARGETS_MARKER,
+            "",
+        ])
+        self.assertEqual(parse_listing(text), [
+            FileEntry('DCIM', 3452, 1700000000, stat.S_IFDIR | 0o771),
+            FileEntry('IMG 2023-01-01 12:00.jpg', 1234, 1700000001, stat.S_IFREG | 0o660),
+            FileEntry(' -> not a link', 0, 1700000002, stat.S_IFREG | 0o644),
+            FileEntry('null', 0, 1700000003, stat.S_IFCHR | 0o666),
+            FileEntry('sda', 0, 1700000004, stat.S_IFBLK | 0o660),
+        ])
+
+    def test_names_keep_newlines_and_trailing_spaces(self):
+        text = '\n'.join([
+            "81b0 1 1700000000 ./two",
+            "lines ",
+            "81b0 2 1700000000 ./after",
+            LINK_MODES_MARKER,
+            LINK_TARGETS_MARKER,
+        ])
+        self.assertEqual([e.name for e in parse_listing(text)], ['two\nlines ', 'after'])
+
+    def test_negative_mtime(self):
+        entry, = parse_listing(f"81b0 1 -86400 ./old\n{LINK_MODES_MARKER}\n{LINK_TARGETS_MARKER}\n")
+        self.assertEqual(entry.mtime, -86400)
+
+    def test_symlinks(self):
+        text = '\n'.join([
+            "a1ff 21 1700000000 ./sdcard",
+            "a1ff 12 1700000000 ./a -> b",
+            "a1ff 7 1700000000 ./dangling",
+            LINK_MODES_MARKER,
+            "41f9 ./sdcard",
+            "81b0 ./a -> b",
+            LINK_TARGETS_MARKER,
+            "'./sdcard' -> '/storage/self/primary'",
+            "'./a -> b' -> 'c -> d'",
+            "'./dangling' -> 'nowhere'",
+        ])
+        sdcard, arrow, dangling = parse_listing(text)
+        self.assertEqual((sdcard.link_target, sdcard.is_link, sdcard.is_dir), ('/storage/self/primary', True, True))
+        self.assertEqual((arrow.name, arrow.link_target, arrow.is_dir), ('a -> b', 'c -> d', False))
+        self.assertEqual((dangling.link_target, dangling.is_dir), ('nowhere', False))
+
+    def test_unquoted_link_targets(self):
+        text = '\n'.join([
+            "a1ff 4 1700000000 ./etc",
+            LINK_MODES_MARKER,
+            LINK_TARGETS_MARKER,
+            "./etc -> /system/etc",
+        ])
+        entry, = parse_listing(text)
+        self.assertEqual(entry.link_target, '/system/etc')
+
+    def test_garbage_before_first_record_is_ignored(self):
+        text = '\n'.join([
+            "stat: ./gone: No such file or directory",
+            "81b0 1 1700000000 ./kept",
+            LINK_MODES_MARKER,
+            LINK_TARGETS_MARKER,
+        ])
+        self.assertEqual([e.name for e in parse_listing(text)], ['kept'])
+
+    @unittest.skipUnless(shutil.which('find') and shutil.which('stat'), "needs find and stat")
+    def test_list_command_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, 'My Folder'))
+            with open(os.path.join(tmp, 'a file.txt'), 'wb') as f:
+                f.write(b'12345')
+            with open(os.path.join(tmp, '.hidden'), 'wb'):
+                pass
+            os.symlink('My Folder', os.path.join(tmp, 'link'))
+            os.utime(os.path.join(tmp, 'a file.txt'), (1600000000, 1600000000))
+
+            for show_hidden, expected in ((False, ['My Folder', 'a file.txt', 'link']),
+                                          (True, ['.hidden', 'My Folder', 'a file.txt', 'link'])):
+                with self.subTest(show_hidden=show_hidden):
+                    out = subprocess.run(['sh', '-c', list_command(tmp, show_hidden)], capture_output=True,
+                                         text=True, check=True).stdout
+                    entries = {e.name: e for e in parse_listing(out)}
+                    self.assertEqual(sorted(entries), expected)
+            self.assertEqual((entries['a file.txt'].size, entries['a file.txt'].mtime), (5, 1600000000))
+            self.assertTrue(entries['My Folder'].is_dir)
+            self.assertEqual((entries['link'].link_target, entries['link'].is_dir), ('My Folder', True))
+
+
+class ParseLsTest(unittest.TestCase):
+    def test_toybox(self):
+        text = '\n'.join([
+            "total 24",
+            "drwxrwx--x 4 root sdcard_rw 3452 2023-01-01 12:00 DCIM",
+            "-rw-rw---- 1 root sdcard_rw 1234 2023-06-30 23:59 IMG 2023-01-01 12:00.jpg",
+            "-rw-r--r-- 1 root root 0 2023-01-01 12:00 --dashes--",
+            "drwxr-xr-x 2 root root 4096 2023-01-01 12:00 .",
+            "drwxr-xr-x 2 root root 4096 2023-01-01 12:00 ..",
+        ])
+        self.assertEqual(parse_ls(text), [
+            FileEntry('DCIM', 3452, _mtime("2023-01-01 12:00"), stat.S_IFDIR | 0o771),
+            FileEntry('IMG 2023-01-01 12:00.jpg', 1234, _mtime("2023-06-30 23:59"), stat.S_IFREG | 0o660),
+            FileEntry('--dashes--', 0, _mtime("2023-01-01 12:00"), stat.S_IFREG | 0o644),
+        ])
+
+    def test_toolbox_folders_have_no_size(self):
+        entry, = parse_ls("drwxr-xr-x root     root              2023-01-01 12:00 acct")
+        self.assertEqual((entry.name, entry.size, entry.is_dir), ('acct', 0, True))
+
+    def test_device_nodes(self):
+        text = '\n'.join([
+            "crw-rw-rw- 1 root root   1,   3 2023-01-01 12:00 null",
+            "brw------- 1 root root 259,   0 2023-01-01 12:00 sda",
+            "prw------- 1 root root        0 2023-01-01 12:00 fifo",
+            "srw-rw---- 1 root root        0 2023-01-01 12:00 socket",
+        ])
+        null, sda, fifo, socket = parse_ls(text)
+        self.assertEqual((null.mode, null.size), (stat.S_IFCHR | 0o666, 0))
+        self.assertEqual((sda.mode, sda.size), (stat.S_IFBLK | 0o600, 0))
+        self.assertTrue(stat.S_ISFIFO(fifo.mode))
+        self.assertTrue(stat.S_ISSOCK(socket.mode))
+
+    def test_symlinks(self):
+        text = '\n'.join([
+            "lrwxrwxrwx 1 root root 21 2023-01-01 12:00 sdcard -> /storage/self/primary",
+            "lrwxrwxrwx 1 root root 6 2023-01-01 12:00 a b -> c -> d",
+            "-rw-r--r-- 1 root root 6 2023-01-01 12:00 not -> a link",
+        ])
+        sdcard, spaced, plain = parse_ls(text)
+        self.assertEqual((sdcard.name, sdcard.link_target, sdcard.is_link), ('sdcard', '/storage/self/primary', True))
+        self.assertEqual((spaced.name, spaced.link_target), ('a b', 'c -> d'))
+        self.assertEqual((plain.name, plain.link_target, plain.is_link), ('not -> a link', None, False))
+
+    def test_odd_dates(self):
+        text = '\n'.join([
+            "-rw-r--r-- 1 root root 1 Jan  1 12:00 busybox",
+            "-rw-r--r-- 1 root root 2 2023-01-01 12:00:59.000000000 +0000 seconds",
+            "-rw-r--r-- 1 root root 3 2023-13-45 25:61 impossible",
+            "-rw-r--r-- 1 root root 4 1999-12-31 23:59 y2k",
+        ])
+        impossible, y2k = parse_ls(text)
+        self.assertEqual((impossible.name, impossible.size, impossible.mtime), ('impossible', 3, 0))
+        self.assertEqual((y2k.name, y2k.mtime), ("y2k", _mtime("1999-12-31 23:59")))
+
+    def test_sticky_and_setuid_bits_are_not_permissions(self):
+        sticky, setuid = parse_ls("drwxrwxrwT 2 root root 0 2023-01-01 12:00 tmp\n"
+                                  "-rwsr-xr-x 1 root root 0 2023-01-01 12:00 su")
+        self.assertEqual(stat.S_IMODE(sticky.mode), 0o776)
+        self.assertEqual(stat.S_IMODE(setuid.mode), 0o755)
+
+
+if __name__ == "__main__":
+    unittest.main()
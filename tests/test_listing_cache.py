@@ -0,0 +1,142 @@
+import os
+import unittest
+from unittest import mock
+
+import engine
+from engine import ListingCache, SyncPlan, TransferEngine
+from tests.fake_adb_server import SERIAL
+
+
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class ListingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(engine, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ListingCache(max_entries=3, ttl=60)
+
+    def cached(self, path, serial=SERIAL):
+        return self.cache.get(serial, path) is not None
+
+    def test_put_and_get(self):
+        items = ['a', 'b']
+        self.assertIsNone(self.cache.get(SERIAL, '/sdcard'))
+        self.cache.put(SERIAL, '/sdcard', items, 'disk')
+        items.append('c')
+        self.assertEqual(self.cache.get(SERIAL, '/sdcard/'), (['a', 'b'], 'disk'))
+        self.assertFalse(self.cached('/sdcard', serial='OTHER'))
+        self.assertFalse(self.cached('/sdcard', serial=None))
+
+    def test_ttl(self):
+        self.cache.put(SERIAL, '/sdcard/', [])
+        self.clock.now += 60
+        self.assertTrue(self.cached('/sdcard/'))
+        self.clock.now += 0.5
+        self.assertFalse(self.cached('/sdcard/'))
+        self.assertNotIn((SERIAL, '/sdcard/'), self.cache._entries)
+
+    def test_put_restarts_the_ttl(self):
+        self.cache.put(SERIAL, '/sdcard/', ['old'])
+        self.clock.now += 50
+        self.cache.put(SERIAL, '/sdcard/', ['new'])
+        self.clock.now += 50
+        self.assertEqual(self.cache.get(SERIAL, '/sdcard/'), (['new'], None))
+
+    def test_evicts_least_recently_used(self):
+        for path in ('/a/', '/b/', '/c/'):
+            self.cache.put(SERIAL, path, [])
+        self.cache.get(SERIAL, '/a/')
+        self.cache.put(SERIAL, '/d/', [])
+        self.assertEqual([p for p in ('/a/', '/b/', '/c/', '/d/') if self.cached(p)], ['/a/', '/c/', '/d/'])
+
+        self.cache.put(SERIAL, '/c/', [])
+        self.cache.put(SERIAL, '/e/', [])
+        self.assertEqual([p for p in ('/a/', '/c/', '/d/', '/e/') if self.cached(p)], ['/c/', '/d/', '/e/'])
+
+    def test_invalidate(self):
+        cache = self.cache = ListingCache(max_entries=10, ttl=60)
+        for path in ('/sdcard/', '/sdcard/DCIM/', '/sdcard/DCIM/Camera/', '/sdcard/DCIM2/'):
+            cache.put(SERIAL, path, [])
+        cache.put('OTHER', '/sdcard/DCIM/', [])
+
+        cache.invalidate(SERIAL, '/sdcard/DCIM')
+        self.assertEqual([p for p in ('/sdcard/', '/sdcard/DCIM/', '/sdcard/DCIM/Camera/', '/sdcard/DCIM2/')
+                          if self.cached(p)], ['/sdcard/', '/sdcard/DCIM/Camera/', '/sdcard/DCIM2/'])
+
+        cache.put(SERIAL, '/sdcard/DCIM/', [])
+        cache.invalidate(SERIAL, '/sdcard/DCIM/', recursive=True)
+        self.assertEqual([p for p in ('/sdcard/', '/sdcard/DCIM/', '/sdcard/DCIM/Camera/', '/sdcard/DCIM2/')
+                          if self.cached(p)], ['/sdcard/', '/sdcard/DCIM2/'])
+        self.assertTrue(self.cached('/sdcard/DCIM/', serial='OTHER'))
+
+        cache.invalidate(SERIAL, '/', recursive=True)
+        self.assertEqual(len(cache._entries), 1)
+
+
+class EngineInvalidationTest(unittest.TestCase):
+    """The engine drops the listings its own writes make stale, without asking the device."""
+    PATHS = ('/', '/sdcard/', '/sdcard/DCIM/', '/sdcard/DCIM/Camera/', '/sdcard/Music/', '/sdcard/Music/Old/')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = TransferEngine(journal_path=':memory:')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.hash_pool.shutdown()
+
+    def setUp(self):
+        self.engine.listing_cache = ListingCache()
+        for path in self.PATHS:
+            self.engine.listing_cache.put(SERIAL, path, [])
+        patcher = mock.patch.object(self.engine, 'run_shell_cmd_async', mock.AsyncMock(return_value=('', '')))
+        self.shell = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cached(self):
+        return [p for p in self.PATHS if self.engine.listing_cache.get(SERIAL, p) is not None]
+
+    def cached_except(self, *paths):
+        return [p for p in self.PATHS if p not in paths]
+
+    def test_push(self):
+        files = [('/tmp/a.jpg', 'a.jpg', 1, 0),
+                 ('/tmp/DCIM/Camera/b.jpg', os.path.join('DCIM', 'Camera', 'b.jpg'), 1, 0)]
+        self.engine._invalidate_pushed(SERIAL, '/sdcard/', files)
+        self.assertEqual(self.cached(), ['/sdcard/Music/', '/sdcard/Music/Old/'])
+
+    def test_push_into_a_new_folder(self):
+        self.engine._invalidate_pushed(SERIAL, '/sdcard/Music/New/', [('/tmp/c.mp3', 'c.mp3', 1, 0)])
+        self.assertEqual(self.cached(), self.cached_except('/sdcard/Music/'))
+
+    def test_delete(self):
+        self.engine.delete_remote(['/sdcard/DCIM', '/sdcard/Music/Old/'], SERIAL)
+        self.assertEqual(self.cached(), ['/'])
+
+    def test_delete_at_the_root(self):
+        self.engine.delete_remote(['/sdcard'], SERIAL)
+        self.assertEqual(self.cached(), [])
+
+    def test_failed_delete_still_invalidates(self):
+        self.shell.return_value = (None, "device offline")
+        errors = self.engine.delete_remote(['/sdcard/Music/Old'], SERIAL)
+        self.assertEqual(errors, [('/sdcard/Music/Old', "device offline")])
+        self.assertEqual(self.cached(), self.cached_except('/sdcard/Music/', '/sdcard/Music/Old/'))
+
+    def test_sync_removes_extraneous(self):
+        plan = SyncPlan('push', {}, {'Old/x.mp3': ('/sdcard/Music/Old/x.mp3', 1, 0)}, [], [], ['Old/x.mp3'], [])
+        self.engine.remove_extraneous(SERIAL, plan, '/sdcard/Music/')
+        self.assertEqual(self.cached(), self.cached_except('/sdcard/Music/', '/sdcard/Music/Old/'))
+        self.assertIn("rm -f /sdcard/Music/Old/x.mp3", self.shell.call_args[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
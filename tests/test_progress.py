@@ -0,0 +1,134 @@
+import sys
+import unittest
+from unittest import mock
+
+import progress
+from progress import PercentParser, Throttle, run_with_progress
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+class PercentParserTest(unittest.TestCase):
+    def feed_all(self, *chunks):
+        parser = PercentParser()
+        return [parser.feed(chunk) for chunk in chunks]
+
+    def test_carriage_returns(self):
+        self.assertEqual(self.feed_all(b"\r[  5%] /sdcard/a.mp4\r[ 42%] /sdcard/a.mp4\r[100%] /sdcard/a.mp4\n"), [100])
+        self.assertEqual(self.feed_all(b"\r[  0%] a\r[ 42%] a\r"), [42])
+
+    def test_no_percentage(self):
+        self.assertEqual(self.feed_all(b"", b"adb: error: failed to stat\n", b"%", b"[ %] a"), [None] * 4)
+
+    def test_split_across_chunks(self):
+        cases = [
+            ((b"\r[ 4", b"2%] a"), [None, 42]),
+            ((b"\r[ 42", b"%] a"), [None, 42]),
+            ((b"\r[1", b"0", b"0%] a"), [None, None, 100]),
+            ((b"\r[ 42%", b"] a\r[ 4"), [42, None]),
+            ((b"\r[ 42%] 1", b"5"), [42, None]),
+        ]
+        for chunks, expected in cases:
+            with self.subTest(chunks=chunks):
+                self.assertEqual(self.feed_all(*chunks), expected)
+
+    def test_earlier_value_when_the_last_is_not_a_percentage(self):
+        self.assertEqual(self.feed_all(b"\r[ 42%] a\r[1234%] a"), [42])
+        self.assertEqual(self.feed_all(b"\r[ 42%] a\r[150%] a"), [42])
+        self.assertEqual(self.feed_all(b"\r[ 42%] a", b"\r[12", b"34%] a"), [42, None, None])
+
+    def test_carry_stays_small(self):
+        parser = PercentParser()
+        self.assertIsNone(parser.feed(b"1" * 100_000))
+        self.assertLessEqual(len(parser._carry), progress._MAX_DIGITS + 1)
+        self.assertIsNone(parser.feed(b"%"))
+        self.assertEqual(parser.feed(b"\r[ 7%] a"), 7)
+        self.assertEqual(parser._carry, b"")
+
+
+class ThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(progress, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.seen = []
+        self.throttle = Throttle(self.seen.append, hz=4)
+
+    def test_first_value_passes_at_once(self):
+        self.throttle.update(1)
+        self.assertEqual(self.seen, [1])
+
+    def test_holds_back_until_the_interval_has_passed(self):
+        self.throttle.update(1)
+        self.clock.now += 0.1
+        self.throttle.update(2)
+        self.throttle.update(3)
+        self.clock.now += 0.1
+        self.throttle.tick()
+        self.assertEqual(self.seen, [1])
+        self.clock.now += 0.05
+        self.throttle.tick()
+        self.assertEqual(self.seen, [1, 3])
+        self.throttle.tick()
+        self.assertEqual(self.seen, [1, 3])
+
+    def test_update_after_the_interval_passes_at_once(self):
+        self.throttle.update(1)
+        self.clock.now += 0.25
+        self.throttle.update(2)
+        self.assertEqual(self.seen, [1, 2])
+
+    def test_drops_repeats(self):
+        self.throttle.update(1)
+        self.clock.now += 1
+        self.throttle.update(1)
+        self.assertEqual(self.seen, [1])
+
+        # Going back to the last delivered value cancels the one held back
+        self.throttle.update(2)
+        self.throttle.update(3)
+        self.throttle.update(2)
+        self.clock.now += 1
+        self.throttle.tick()
+        self.throttle.flush()
+        self.assertEqual(self.seen, [1, 2])
+
+    def test_flush_ignores_the_interval(self):
+        self.throttle.flush()
+        self.assertEqual(self.seen, [])
+        self.throttle.update(1)
+        self.throttle.update(100)
+        self.throttle.flush()
+        self.assertEqual(self.seen, [1, 100])
+        self.throttle.flush()
+        self.assertEqual(self.seen, [1, 100])
+
+
+@unittest.skipIf(progress.pty is None, "needs a pty")
+class RunWithProgressTest(unittest.IsolatedAsyncioTestCase):
+    async def test_reports_the_final_value_and_exit_status(self):
+        script = ("import sys\n"
+                  "sys.stdout.write('\\r[ 10%] a\\r[ 50%] a\\r[100%] a\\n')\n"
+                  "sys.exit(int(sys.argv[1]))")
+        for status in (0, 1):
+            with self.subTest(status=status):
+                seen = []
+                result = await run_with_progress([sys.executable, '-c', script, str(status)], seen.append)
+                self.assertEqual(result, ("Transfer finished", status))
+                self.assertEqual(seen[-1:], [100])
+
+    async def test_missing_command(self):
+        msg, code = await run_with_progress(['/nonexistent/adb'], lambda value: None)
+        self.assertEqual(code, -1)
+        self.assertTrue(msg)
+
+
+if __name__ == '__main__':
+    unittest.main()